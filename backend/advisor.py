@@ -0,0 +1,315 @@
+"""
+LLM advisor for agent entries.
+
+An optional review stage between the rule-based decisions and the fills of a
+market cycle: every BUY intent is put to a model, which may approve or veto
+it (exits are never blocked). Calling a model per agent per symbol would
+make cycles far too slow, so:
+
+- a prompt is built only from a quantized market state and DNA fingerprint,
+  so agents with the same view of the same market share one prompt
+- identical prompts in a cycle are asked once, concurrently, under a bounded
+  asyncio semaphore
+- answers are memoized in an LRU/TTL cache keyed by (market, DNA) fingerprint
+- the whole stage has a deadline; prompts not answered in time fall back to
+  the rule decision, so a slow model cannot stall the cycle
+
+Enable it with ADVISOR_MODEL: 'stub' for the offline StubModel, or any LiteLLM
+model name (e.g. gpt-4o-mini). Tuning: ADVISOR_CONCURRENCY, ADVISOR_DEADLINE,
+ADVISOR_REQUEST_TIMEOUT, ADVISOR_CACHE_SIZE, ADVISOR_CACHE_TTL, ADVISOR_FALLBACK.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+import metrics
+
+SYSTEM_PROMPT = (
+    "You are the risk advisor of an automated stock trading agent. Given the agent's "
+    "strategy parameters and the current market state, decide whether its proposed entry "
+    "should go ahead. Answer with exactly one word: APPROVE or VETO."
+)
+STRATEGY_NAMES = {0: "mean_reversion", 1: "momentum"}
+
+
+class TTLCache:
+    """LRU cache whose entries also expire `ttl` seconds after they were stored."""
+
+    def __init__(self, maxsize=10000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _round(value, digits):
+    return None if value is None else round(float(value), digits)
+
+
+def market_fingerprint(symbol, data, rsi_period=None):
+    """
+    Quantized market state: price to the cent, RSI to a point, SMA spread to 10 bps.
+    The RSI is the one over `rsi_period` when the snapshot has it (as the agent
+    decided on), else the default period's.
+    """
+    price = data["price"]
+    rsi = data.get("rsi")
+    if rsi_period is not None:
+        rsi = (data.get("rsi_by_period") or {}).get(rsi_period, rsi)
+    sma_short, sma_long = data.get("sma_20"), data.get("sma_50")
+    spread = _round((sma_short - sma_long) / sma_long * 1000, 0) if sma_short and sma_long else None
+    return (symbol, _round(price, 2), _round(rsi, 0), spread)
+
+
+def dna_fingerprint(population, i):
+    """
+    The DNA fields an entry depends on, for agent row i: RSI settings only for
+    mean reversion, stop loss to 1% and position size to 5%.
+    """
+    strategy = STRATEGY_NAMES.get(int(population.strategy[i]), "unknown")
+    mean_reversion = strategy == "mean_reversion"
+    return (
+        strategy,
+        int(population.rsi_period[i]) if mean_reversion else None,
+        _round(population.rsi_limit[i], 0) if mean_reversion else None,
+        _round(population.stop_loss_pct[i], 2),
+        _round(population.max_position_size[i] * 20, 0) / 20,
+    )
+
+
+def build_prompt(market, dna):
+    symbol, price, rsi, spread = market
+    strategy, rsi_period, rsi_limit, stop_loss, size = dna
+    rules = f"RSI period {rsi_period}, RSI limit {rsi_limit:g}, " if rsi_period is not None else ""
+    return (
+        f"Agent: {strategy} strategy, {rules}stop loss {stop_loss:.0%}, position size {size:.0%} of cash.\n"
+        f"Market: {symbol} at {price}, RSI {'n/a' if rsi is None else f'{rsi:g}'}, "
+        f"SMA20 vs SMA50 {'n/a' if spread is None else f'{spread / 10:+.1f}%'}.\n"
+        f"Proposed action: BUY {symbol}."
+    )
+
+
+def parse_verdict(text):
+    """True (approve) / False (veto) / None when the answer is neither."""
+    text = (text or "").strip().upper()
+    if "VETO" in text:
+        return False
+    if "APPROVE" in text:
+        return True
+    return None
+
+
+class StubModel:
+    """
+    Offline stand-in for the model: vetoes entries with RSI above `max_rsi`, approves
+    the rest, after `latency` seconds. Counts calls for tests and benchmarks.
+    """
+
+    def __init__(self, latency=0.0, max_rsi=70):
+        self.latency = latency
+        self.max_rsi = max_rsi
+        self.calls = 0
+
+    async def complete(self, prompt):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        match = re.search(r"RSI (\d+(?:\.\d+)?)\b", prompt.split("Market:", 1)[-1])
+        return "VETO" if match and float(match.group(1)) > self.max_rsi else "APPROVE"
+
+
+class LiteLLMModel:
+    """Any chat model LiteLLM can reach (OpenAI, Anthropic, Gemini, local servers...)."""
+
+    def __init__(self, model, max_tokens=5):
+        self.model = model
+        self.max_tokens = max_tokens
+
+    async def complete(self, prompt):
+        import litellm
+
+        response = await litellm.acompletion(
+            model=self.model,
+            messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=self.max_tokens,
+        )
+        return response.choices[0].message.content
+
+
+class Advisor:
+    """
+    advisor.review is passed to Population.step as its `review` hook:
+        population.step(snapshot, review=advisor.review)
+
+    review() is synchronous and blocks until the deadline at most. Called from
+    inside a running event loop (the tick pipeline), it asks the model on a
+    helper thread with its own loop, so it still works but stalls that loop.
+    """
+
+    def __init__(self, model, concurrency=8, deadline=2.0, request_timeout=None,
+                 cache_size=10000, cache_ttl=300.0, fallback=True):
+        self.model = model
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.request_timeout = request_timeout or deadline
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.fallback = fallback  # verdict for prompts without an answer in time
+        self.last_stats = {}
+
+    def review(self, population, decisions):
+        """Filters every decision's BUY rows by the (cached, deduplicated) verdicts."""
+        start = time.perf_counter()
+        with metrics.phase("advise"):
+            # One key per (market, DNA) pair among this cycle's BUY intents; the
+            # market side depends on the agent's RSI period (None past mean reversion)
+            wanted = []  # (decision index, agent indices, keys)
+            prompts = {}
+            cached = {}
+            dna_keys = {}
+            for d, (j, data, price, idx, sell) in enumerate(decisions):
+                if len(idx) == 0:
+                    continue
+                markets = {}
+                keys = []
+                for i in idx:
+                    dna = dna_keys.get(i)
+                    if dna is None:
+                        dna = dna_keys[i] = dna_fingerprint(population, i)
+                    market = markets.get(dna[1])
+                    if market is None:
+                        market = markets[dna[1]] = market_fingerprint(population.symbols[j], data, dna[1])
+                    key = (market, dna)
+                    keys.append(key)
+                    if key in prompts or key in cached:
+                        continue
+                    verdict = self.cache.get(key)
+                    if verdict is None:
+                        prompts[key] = build_prompt(market, dna)
+                    else:
+                        cached[key] = verdict
+                wanted.append((d, idx, keys))
+
+            answered = self._ask_all(prompts) if prompts else {}
+            for key, verdict in answered.items():
+                if verdict is not None:
+                    self.cache.set(key, verdict)
+
+            verdicts = {**cached, **answered}
+            reviewed = list(decisions)
+            intents = vetoed = 0
+            for d, idx, keys in wanted:
+                j, data, price, _, sell = decisions[d]
+                approved = np.array([
+                    self.fallback if verdicts.get(k) is None else verdicts[k] for k in keys
+                ], dtype=bool)
+                reviewed[d] = (j, data, price, idx[approved], sell)
+                intents += len(idx)
+                vetoed += int((~approved).sum())
+
+        unanswered = sum(1 for k in prompts if answered.get(k) is None)
+        metrics.ADVISOR_PROMPTS.labels("cached").inc(len(cached))
+        metrics.ADVISOR_PROMPTS.labels("answered").inc(len(prompts) - unanswered)
+        metrics.ADVISOR_PROMPTS.labels("unanswered").inc(unanswered)
+        self.last_stats = {
+            "intents": intents,
+            "prompts": len(prompts) + len(cached),
+            "cached": len(cached),
+            "asked": len(prompts),
+            "unanswered": unanswered,
+            "vetoed": vetoed,
+            "seconds": time.perf_counter() - start,
+        }
+        if intents:
+            s = self.last_stats
+            print(f"Advisor: {s['intents']} entries, {s['prompts']} distinct prompts ({s['cached']} cached, "
+                  f"{s['asked']} asked, {s['unanswered']} unanswered), {s['vetoed']} vetoed "
+                  f"in {s['seconds'] * 1000:.0f}ms.")
+        return reviewed
+
+    def _ask_all(self, prompts):
+        """{key: verdict or None} for every prompt, answered concurrently within the deadline."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._ask(prompts))
+        # asyncio.run cannot nest inside a running loop: run ours on a helper thread
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(lambda: asyncio.run(self._ask(prompts))).result()
+
+    async def _ask(self, prompts):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        answers = dict.fromkeys(prompts)
+
+        async def ask(key, prompt):
+            async with semaphore:
+                try:
+                    text = await asyncio.wait_for(self.model.complete(prompt), self.request_timeout)
+                    answers[key] = parse_verdict(text)
+                except Exception as e:
+                    if not isinstance(e, asyncio.TimeoutError):
+                        print(f"Advisor request failed: {e}")
+
+        tasks = [asyncio.ensure_future(ask(k, p)) for k, p in prompts.items()]
+        _, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return answers
+
+
+_advisor = None
+_advisor_lock = threading.Lock()
+
+
+def get_advisor():
+    """Process-wide advisor (so its cache survives across cycles), or None when ADVISOR_MODEL is unset."""
+    global _advisor
+    name = os.getenv("ADVISOR_MODEL")
+    if not name:
+        return None
+    if _advisor is None:
+        with _advisor_lock:
+            if _advisor is None:
+                if name == "stub":
+                    model = StubModel(latency=float(os.getenv("ADVISOR_STUB_LATENCY", "0")))
+                else:
+                    model = LiteLLMModel(name)
+                _advisor = Advisor(
+                    model,
+                    concurrency=int(os.getenv("ADVISOR_CONCURRENCY", "8")),
+                    deadline=float(os.getenv("ADVISOR_DEADLINE", "2")),
+                    request_timeout=float(os.getenv("ADVISOR_REQUEST_TIMEOUT", "0")) or None,
+                    cache_size=int(os.getenv("ADVISOR_CACHE_SIZE", "10000")),
+                    cache_ttl=float(os.getenv("ADVISOR_CACHE_TTL", "300")),
+                    fallback=os.getenv("ADVISOR_FALLBACK", "approve").lower() != "veto",
+                )
+    return _advisor
@@ -2,6 +2,8 @@ import logging
 import random
 import datetime
 
+from positions import PositionBook
+
 logger = logging.getLogger(__name__)
 
 class TradingAgent:
@@ -10,7 +12,7 @@ class TradingAgent:
         self.dna = dna
         self.alpaca = alpaca_client
         self.portfolio_value = 100000.0  # Default, should be overwritten by db state
-        self.positions = {} # {symbol: qty}
+        self.positions = PositionBook()
         self.pending_trades = [] # List of dicts to be saved to DB
 
     def execute_logic(self, market_data):
@@ -32,9 +34,9 @@ class TradingAgent:
         max_pos_size = self.dna.get('max_position_size', 0.1)
         
         # Check active positions for stop-loss / take-profit
-        current_qty = self.positions.get(symbol, 0)
+        current_qty = self.positions.qty(symbol)
         if current_qty > 0:
-            avg_price = self.positions.get(f"{symbol}_avg_price", price) # Simplify for now
+            avg_price = self.positions.avg_price(symbol) or price  # unknown cost -> flat PnL
             pnl_pct = (price - avg_price) / avg_price
             
             if pnl_pct <= -stop_loss_pct:
@@ -46,9 +48,15 @@ class TradingAgent:
                 self.place_order("SELL", symbol, price, 1.0) # Sell all
                 return
 
+        # Only enter symbols on the agent's watchlist (when it has one)
+        watchlist = self.dna.get('watchlist')
+        if watchlist and symbol not in watchlist and current_qty == 0:
+            return
+
         # Strategy Execution
         if strategy == 'mean_reversion':
-            rsi = market_data.get('rsi')
+            # Prefer the RSI computed over this agent's own period when available
+            rsi = market_data.get('rsi_by_period', {}).get(rsi_period, market_data.get('rsi'))
             rsi_limit_low = self.dna.get('rsi_limit', 30)
             rsi_limit_high = 100 - rsi_limit_low
             
@@ -79,12 +87,8 @@ class TradingAgent:
             cost = qty * price
             if self.portfolio_value >= cost:
                 self.portfolio_value -= cost
-                old_qty = self.positions.get(symbol, 0)
-                # Weighted average price update (simplified)
-                # In real scenario, track lots.
-                self.positions[symbol] = old_qty + qty
-                # simple avg price tracking for PnL calculation
-                self.positions[f"{symbol}_avg_price"] = price 
+                # New lot; average cost is weighted across open lots
+                self.positions.buy(symbol, qty, price)
                 logger.info(f"Agent {self.agent_id} BUY {qty} {symbol} @ {price}")
                 self.pending_trades.append({
                     "symbol": symbol,
@@ -95,12 +99,12 @@ class TradingAgent:
                 })
 
         elif side == "SELL":
-            current_qty = self.positions.get(symbol, 0)
+            current_qty = self.positions.qty(symbol)
             qty_to_sell = int(current_qty * size_pct) # size_pct=1.0 means sell all
             if qty_to_sell <= 0: return
 
             if current_qty >= qty_to_sell:
-                self.positions[symbol] -= qty_to_sell
+                self.positions.sell(symbol, qty_to_sell)  # FIFO; drops the position once flat
                 self.portfolio_value += qty_to_sell * price
                 logger.info(f"Agent {self.agent_id} SELL {qty_to_sell} {symbol} @ {price}")
                 self.pending_trades.append({
@@ -110,6 +114,3 @@ class TradingAgent:
                     "price": price,
                     "timestamp": datetime.datetime.utcnow()
                 })
-                
-                if self.positions[symbol] == 0:
-                    del self.positions[symbol]
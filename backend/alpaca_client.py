@@ -23,10 +23,14 @@ class AlpacaClient:
                 return None
         return 150.0 # Mock price
 
-    def get_bars(self, symbol, timeframe=TimeFrame.Day, limit=100):
+    def get_bars(self, symbol, timeframe=TimeFrame.Day, limit=100, start=None):
+        # start (naive UTC datetime) fetches the bars after it, e.g. to extend a stored history
         if self.api:
             try:
-                bars = self.api.get_bars(symbol, timeframe, limit=limit).df
+                if start is not None:
+                    bars = self.api.get_bars(symbol, timeframe, start=start.isoformat() + "Z", limit=limit).df
+                else:
+                    bars = self.api.get_bars(symbol, timeframe, limit=limit).df
                 return bars
             except Exception as e:
                 print(f"Error fetching bars for {symbol}: {e}")
@@ -0,0 +1,280 @@
+"""
+Offline backtester.
+
+Replays historical (or synthetic) bars through the same strategy rules the
+live market cycle uses, filling at the simulated bar price. Runs without the
+paper account, Celery or Postgres:
+
+    python backtest.py --agents 1000 --bars 126
+    python backtest.py --source file --file bars.csv
+    python backtest.py --source alpaca --symbols AAPL,TSLA --bars 250
+"""
+import argparse
+import csv
+import datetime
+import random
+import time
+
+import numpy as np
+
+from indicators import rsi_from_averages
+from population import Population
+
+DEFAULT_UNIVERSE = ["AAPL", "TSLA", "SPY", "NVDA", "AMZN"]
+STARTING_CASH = 100000.0
+
+
+class PriceHistory:
+    """Aligned close prices: closes[t, j] is the close of symbols[j] at timestamps[t]."""
+
+    def __init__(self, timestamps, symbols, closes):
+        self.timestamps = list(timestamps)
+        self.symbols = list(symbols)
+        self.closes = np.asarray(closes, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class SyntheticPriceSource:
+    """Geometric Brownian motion daily bars, reproducible with a seed."""
+
+    def __init__(self, symbols=None, bars=252, seed=None, start_price=150.0, drift=0.0003, volatility=0.02):
+        self.symbols = symbols or DEFAULT_UNIVERSE
+        self.bars = bars
+        self.seed = seed
+        self.start_price = start_price
+        self.drift = drift
+        self.volatility = volatility
+
+    def load(self):
+        rng = np.random.default_rng(self.seed)
+        log_returns = rng.normal(self.drift, self.volatility, size=(self.bars, len(self.symbols)))
+        closes = self.start_price * np.exp(np.cumsum(log_returns, axis=0))
+        end = datetime.datetime.utcnow().replace(hour=21, minute=0, second=0, microsecond=0)
+        timestamps = [end - datetime.timedelta(days=self.bars - 1 - t) for t in range(self.bars)]
+        return PriceHistory(timestamps, self.symbols, closes)
+
+
+class FilePriceSource:
+    """
+    CSV bars in long format with a header: timestamp,symbol,close
+    (extra columns such as open/high/low/volume are ignored).
+    Only timestamps present for every symbol are kept.
+    """
+
+    def __init__(self, path, symbols=None):
+        self.path = path
+        self.symbols = symbols
+
+    def load(self):
+        rows = {}
+        with open(self.path, newline="") as f:
+            for row in csv.DictReader(f):
+                symbol = row["symbol"]
+                if self.symbols and symbol not in self.symbols:
+                    continue
+                rows.setdefault(symbol, {})[row["timestamp"]] = float(row["close"])
+
+        symbols = self.symbols or sorted(rows)
+        common = set.intersection(*(set(rows.get(s, {})) for s in symbols)) if symbols else set()
+        timestamps = sorted(common)
+        closes = [[rows[s][ts] for s in symbols] for ts in timestamps]
+        return PriceHistory(timestamps, symbols, np.array(closes).reshape(len(timestamps), len(symbols)))
+
+
+class AlpacaPriceSource:
+    """
+    Daily bars from the local bar store, first topped up from AlpacaClient with only
+    the missing bars, aligned on common timestamps.
+    """
+
+    def __init__(self, symbols=None, bars=252, client=None, store=None):
+        self.symbols = symbols or DEFAULT_UNIVERSE
+        self.bars = bars
+        self.client = client
+        self.store = store
+
+    def load(self):
+        from bar_store import BarStore, get_bar_store
+
+        store = self.store or (BarStore(client=self.client) if self.client else get_bar_store())
+        views = []
+        for symbol in self.symbols:
+            try:
+                store.refresh(symbol, limit=self.bars)
+            except Exception as e:
+                print(f"Error refreshing bars for {symbol}: {e}")
+            bars = store.read(symbol, limit=self.bars)
+            if bars is None:
+                raise RuntimeError(f"No bars returned for {symbol}")
+            views.append(bars)
+
+        common = views[0].timestamp
+        for bars in views[1:]:
+            common = np.intersect1d(common, bars.timestamp)
+        closes = np.column_stack([bars.close[np.searchsorted(bars.timestamp, common)] for bars in views])
+        complete = ~np.isnan(closes).any(axis=1)
+        timestamps = common[complete].astype("datetime64[us]").tolist()
+        return PriceHistory(timestamps, self.symbols, closes[complete])
+
+
+def sma(closes, window):
+    """Simple moving average down axis 0; NaN until `window` bars are available."""
+    out = np.full(closes.shape, np.nan)
+    if len(closes) < window:
+        return out
+    csum = np.cumsum(closes, axis=0)
+    out[window - 1] = csum[window - 1] / window
+    out[window:] = (csum[window:] - csum[:-window]) / window
+    return out
+
+
+def wilder_rsi(closes, period=14):
+    """Wilder's RSI down axis 0; NaN until `period` price changes are available."""
+    out = np.full(closes.shape, np.nan)
+    if len(closes) <= period:
+        return out
+    delta = np.diff(closes, axis=0)
+    gains = np.clip(delta, 0, None)
+    losses = np.clip(-delta, 0, None)
+
+    avg_gain = gains[:period].mean(axis=0)
+    avg_loss = losses[:period].mean(axis=0)
+    out[period] = rsi_from_averages(avg_gain, avg_loss)
+    for t in range(period + 1, len(closes)):
+        avg_gain = (avg_gain * (period - 1) + gains[t - 1]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[t - 1]) / period
+        out[t] = rsi_from_averages(avg_gain, avg_loss)
+    return out
+
+
+def random_dna(rng=random):
+    """DNA drawn from the same ranges seed.py uses."""
+    return {
+        "strategy": rng.choice(["momentum", "mean_reversion"]),
+        "rsi_limit": rng.randint(20, 35),
+        "rsi_period": rng.randint(10, 20),
+        "stop_loss_pct": round(rng.uniform(0.02, 0.08), 3),
+        "take_profit_pct": round(rng.uniform(0.05, 0.15), 3),
+        "max_position_size": 0.1,
+    }
+
+
+class BacktestResult:
+    def __init__(self, population, equity_curve, trade_count, elapsed, trades=None):
+        self.population = population
+        self.equity_curve = equity_curve  # (bars, agents)
+        self.trade_count = trade_count
+        self.elapsed = elapsed
+        self.trades = trades
+
+    @property
+    def final_equity(self):
+        return self.equity_curve[-1]
+
+    @property
+    def returns(self):
+        return self.final_equity / self.equity_curve[0] - 1.0
+
+    @property
+    def max_drawdown(self):
+        peaks = np.maximum.accumulate(self.equity_curve, axis=0)
+        return ((peaks - self.equity_curve) / peaks).max(axis=0)
+
+    def ranking(self):
+        """Agent indices ordered best to worst by final equity."""
+        return np.argsort(-self.final_equity, kind="stable")
+
+
+def compute_indicators(history, rsi_periods):
+    """SMA 20/50 and Wilder RSI for every period in `rsi_periods` (plus 14) over the whole history."""
+    return {
+        "sma_20": sma(history.closes, 20),
+        "sma_50": sma(history.closes, 50),
+        "rsi_by_period": {int(p): wilder_rsi(history.closes, int(p)) for p in set(rsi_periods) | {14}},
+    }
+
+
+def run_backtest(population, history, keep_trades=False, indicators=None):
+    """
+    Replays every bar of `history` through `population`, mutating its cash and
+    positions. Returns a BacktestResult with the per-bar equity curve.
+    `indicators` (from compute_indicators) can be shared across runs on the same
+    history; periods it lacks are computed here.
+    """
+    start = time.perf_counter()
+    col = [population.symbol_index[s] for s in history.symbols]
+    if indicators is None:
+        indicators = compute_indicators(history, population.rsi_period)
+    sma_20 = indicators["sma_20"]
+    sma_50 = indicators["sma_50"]
+    rsi_by_period = {}
+    for p in set(int(p) for p in population.rsi_period) | {14}:
+        rsi = indicators["rsi_by_period"].get(p)
+        rsi_by_period[p] = rsi if rsi is not None else wilder_rsi(history.closes, p)
+
+    equity_curve = np.empty((len(history), len(population)))
+    trades = [] if keep_trades else None
+    trade_count = 0
+
+    for t, timestamp in enumerate(history.timestamps):
+        snapshot = {}
+        for k, symbol in enumerate(history.symbols):
+            snapshot[symbol] = {
+                "symbol": symbol,
+                "price": float(history.closes[t, k]),
+                "rsi": _value(rsi_by_period[14][t, k]),
+                "rsi_by_period": {p: _value(rsi[t, k]) for p, rsi in rsi_by_period.items()},
+                "sma_20": _value(sma_20[t, k]),
+                "sma_50": _value(sma_50[t, k]),
+            }
+        bar_trades = population.step(snapshot, timestamp=timestamp)
+        trade_count += len(bar_trades)
+        if keep_trades:
+            trades.extend(bar_trades)
+        equity_curve[t] = population.cash + population.qty[:, col] @ history.closes[t]
+
+    return BacktestResult(population, equity_curve, trade_count, time.perf_counter() - start, trades)
+
+
+def _value(x):
+    return None if np.isnan(x) else float(x)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay bars through a population of agents.")
+    parser.add_argument("--source", choices=["synthetic", "file", "alpaca"], default="synthetic")
+    parser.add_argument("--file", help="CSV with timestamp,symbol,close columns (for --source file)")
+    parser.add_argument("--symbols", help="Comma separated symbols (default: the live universe, or all in --file)")
+    parser.add_argument("--bars", type=int, default=126)
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()] if args.symbols else None
+    if args.source == "file":
+        source = FilePriceSource(args.file, symbols)
+    elif args.source == "alpaca":
+        source = AlpacaPriceSource(symbols, bars=args.bars)
+    else:
+        source = SyntheticPriceSource(symbols, bars=args.bars, seed=args.seed)
+    history = source.load()
+
+    rng = random.Random(args.seed)
+    dnas = [random_dna(rng) for _ in range(args.agents)]
+    population = Population(
+        list(range(1, args.agents + 1)), dnas, [STARTING_CASH] * args.agents, [()] * args.agents, history.symbols
+    )
+    result = run_backtest(population, history)
+
+    print(f"Replayed {len(history)} bars x {len(history.symbols)} symbols for {args.agents} agents "
+          f"in {result.elapsed:.3f}s ({result.trade_count} trades)")
+    for rank, i in enumerate(result.ranking()[: args.top], start=1):
+        print(f"{rank}. agent {population.agent_ids[i]} return {result.returns[i]:+.2%} "
+              f"max_dd {result.max_drawdown[i]:.2%} dna {dnas[i]}")
+
+
+if __name__ == "__main__":
+    main()
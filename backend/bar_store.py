@@ -0,0 +1,268 @@
+"""
+Local columnar store for historical bars.
+
+Each symbol and timeframe is a directory of NumPy .npy columns (timestamp as
+datetime64[s], open, high, low, close, volume) plus a small meta.json whose
+length is the committed row count. Refreshing asks the client only for bars
+after the last stored timestamp and appends them in place (the .npy header is
+rewritten, the data is never copied). Readers memory-map the columns and get
+zero-copy array views for a time range, so indicators, backtests and charts
+read history without network round trips or building DataFrames.
+
+    python bar_store.py --symbols AAPL,SPY,TSLA --timeframe 1Day
+"""
+import argparse
+import collections
+import contextlib
+import datetime
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bars")
+DEFAULT_TIMEFRAME = "1Day"
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+COLUMNS = ("timestamp",) + PRICE_COLUMNS
+DTYPES = {"timestamp": np.dtype("datetime64[s]"), **{c: np.dtype(np.float64) for c in PRICE_COLUMNS}}
+
+Bars = collections.namedtuple("Bars", COLUMNS)
+
+
+def _header(length, dtype):
+    buffer = io.BytesIO()
+    np.lib.format.write_array_header_1_0(
+        buffer, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (length,)}
+    )
+    return buffer.getvalue()
+
+
+def _save(path, values):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, values)
+    os.replace(tmp_path, path)
+
+
+def append_column(path, length, values):
+    """
+    Appends `values` after the first `length` rows of the .npy column at `path` (rows past
+    `length` are from an interrupted append and are dropped). Only the header is rewritten,
+    unless the new shape no longer fits in it.
+    """
+    values = np.ascontiguousarray(values)
+    if length == 0 or not os.path.exists(path):
+        _save(path, values)
+        return
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            np.lib.format.read_array_header_1_0(f)
+            offset = f.tell()
+            header = _header(length + len(values), values.dtype)
+            if len(header) == offset:
+                f.seek(offset + length * values.dtype.itemsize)
+                f.truncate()
+                f.write(values.tobytes())
+                f.flush()
+                f.seek(0)
+                f.write(header)
+                return
+    existing = np.load(path, mmap_mode="r")[:length]
+    _save(path, np.concatenate([existing, values]))
+
+
+def bars_to_columns(frame):
+    """Columns (timestamp as naive UTC datetime64[s]) from a bars DataFrame indexed by time."""
+    import pandas as pd
+
+    index = pd.DatetimeIndex(frame.index)
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    columns = {"timestamp": index.values.astype(DTYPES["timestamp"])}
+    for name in PRICE_COLUMNS:
+        columns[name] = (
+            frame[name].to_numpy(dtype=np.float64) if name in frame else np.full(len(frame), np.nan)
+        )
+    return columns
+
+
+class BarStore:
+    """
+    store.refresh("AAPL")                      fetch and append only bars newer than the stored tail
+    bars = store.read("AAPL", start=dt)        Bars of memory-mapped views, no copies
+    """
+
+    def __init__(self, root=None, client=None):
+        self.root = root or os.getenv("BAR_STORE_DIR", DEFAULT_ROOT)
+        self.client = client
+        self._maps = {}  # (symbol, timeframe) -> (length, {column: memmap})
+        self._lock = threading.Lock()
+
+    def _dir(self, symbol, timeframe):
+        return os.path.join(self.root, str(timeframe), symbol)
+
+    def meta(self, symbol, timeframe=DEFAULT_TIMEFRAME):
+        path = os.path.join(self._dir(symbol, timeframe), "meta.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def symbols(self, timeframe=DEFAULT_TIMEFRAME):
+        directory = os.path.join(self.root, str(timeframe))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(s for s in os.listdir(directory) if self.meta(s, timeframe))
+
+    def last_timestamp(self, symbol, timeframe=DEFAULT_TIMEFRAME):
+        meta = self.meta(symbol, timeframe)
+        return datetime.datetime.fromisoformat(meta["last"]) if meta and meta["length"] else None
+
+    @contextlib.contextmanager
+    def _writer(self, directory):
+        """Serializes appends to one symbol across threads and processes."""
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, open(os.path.join(directory, ".lock"), "w") as lock:
+            try:
+                import fcntl
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            except ImportError:
+                pass
+            yield
+
+    def append(self, symbol, timeframe, columns):
+        """
+        Adds rows (a dict of column arrays, or a bars DataFrame) that are not stored yet.
+        Rows after the stored tail are appended in place; rows before the stored head
+        (a backfill) are merged with one rewrite. Returns the number of rows added.
+        """
+        if not isinstance(columns, dict):
+            columns = bars_to_columns(columns)
+        directory = self._dir(symbol, timeframe)
+        with self._writer(directory):
+            meta = self.meta(symbol, timeframe) or {"length": 0, "first": None, "last": None}
+            length = meta["length"]
+            timestamps = np.asarray(columns["timestamp"], dtype=DTYPES["timestamp"])
+            order = np.argsort(timestamps, kind="stable")
+            rows = order[np.unique(timestamps[order], return_index=True)[1]]
+            if length:
+                older = rows[timestamps[rows] < np.datetime64(meta["first"], "s")]
+                newer = rows[timestamps[rows] > np.datetime64(meta["last"], "s")]
+            else:
+                older, newer = rows[:0], rows
+            if len(older) == 0 and len(newer) == 0:
+                return 0
+
+            for name in COLUMNS:
+                values = np.asarray(columns.get(name, np.full(len(timestamps), np.nan)), dtype=DTYPES[name])
+                path = os.path.join(directory, f"{name}.npy")
+                if len(older):
+                    _save(path, np.concatenate([values[older], np.load(path, mmap_mode="r")[:length]]))
+                if len(newer):
+                    append_column(path, length + len(older), values[newer])
+
+            meta = {
+                "length": length + len(older) + len(newer),
+                "first": str(timestamps[older[0]]) if len(older) else meta["first"] or str(timestamps[newer[0]]),
+                "last": str(timestamps[newer[-1]]) if len(newer) else meta["last"],
+            }
+            tmp_path = os.path.join(directory, "meta.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, os.path.join(directory, "meta.json"))
+            return len(older) + len(newer)
+
+    def _client(self):
+        if self.client is None:
+            from alpaca_client import AlpacaClient
+            self.client = AlpacaClient()
+        return self.client
+
+    def refresh(self, symbol, timeframe=DEFAULT_TIMEFRAME, limit=1000, max_age=None, max_pages=20):
+        """
+        Makes at least the latest `limit` bars available locally. With fewer stored, fetches
+        the latest `limit` (backfilling older rows); otherwise fetches only bars after the
+        stored tail, following pages while the client returns full ones. Skips the network
+        when the tail is younger than `max_age` (a timedelta). Returns the rows added.
+        """
+        meta = self.meta(symbol, timeframe)
+        if not meta or meta["length"] < limit:
+            frame = self._client().get_bars(symbol, timeframe, limit=limit)
+            return 0 if frame is None or frame.empty else self.append(symbol, timeframe, frame)
+
+        last = datetime.datetime.fromisoformat(meta["last"])
+        if max_age is not None and datetime.datetime.utcnow() - last < max_age:
+            return 0
+        added = 0
+        for _ in range(max_pages):
+            frame = self._client().get_bars(symbol, timeframe, limit=limit, start=last + datetime.timedelta(seconds=1))
+            if frame is None or frame.empty:
+                break
+            page = self.append(symbol, timeframe, frame)
+            added += page
+            if page == 0 or len(frame) < limit:
+                break
+            last = self.last_timestamp(symbol, timeframe)
+        return added
+
+    def _columns(self, symbol, timeframe, length):
+        key = (symbol, str(timeframe))
+        with self._lock:
+            mapped = self._maps.get(key)
+            if mapped is None or mapped[0] < length:
+                directory = self._dir(symbol, timeframe)
+                mapped = (length, {c: np.load(os.path.join(directory, f"{c}.npy"), mmap_mode="r") for c in COLUMNS})
+                self._maps[key] = mapped
+            return mapped[1]
+
+    def read(self, symbol, timeframe=DEFAULT_TIMEFRAME, start=None, end=None, limit=None):
+        """
+        Bars in [start, end) (naive UTC datetimes), at most the last `limit` of them, as
+        read-only views of the memory-mapped columns; None when nothing is stored.
+        """
+        meta = self.meta(symbol, timeframe)
+        if not meta or not meta["length"]:
+            return None
+        length = meta["length"]
+        columns = self._columns(symbol, timeframe, length)
+        timestamps = columns["timestamp"][:length]
+        lo = int(np.searchsorted(timestamps, np.datetime64(start, "s"), "left")) if start else 0
+        hi = int(np.searchsorted(timestamps, np.datetime64(end, "s"), "left")) if end else length
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return Bars(*(columns[c][lo:hi] for c in COLUMNS))
+
+
+_store = None
+
+
+def get_bar_store(client=None):
+    """Process-wide store (one set of memory maps per process)."""
+    global _store
+    if _store is None:
+        _store = BarStore(client=client)
+    elif client is not None and _store.client is None:
+        _store.client = client
+    return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch and append the missing tail of stored bars.")
+    parser.add_argument("--symbols", required=True, help="Comma separated symbols")
+    parser.add_argument("--timeframe", default=DEFAULT_TIMEFRAME)
+    parser.add_argument("--limit", type=int, default=1000, help="Bars per request (and to seed an empty symbol)")
+    parser.add_argument("--root", help="Store directory (default: BAR_STORE_DIR or backend/bars)")
+    args = parser.parse_args()
+
+    store = BarStore(root=args.root)
+    for symbol in [s.strip() for s in args.symbols.split(",") if s.strip()]:
+        appended = store.refresh(symbol, args.timeframe, limit=args.limit)
+        meta = store.meta(symbol, args.timeframe) or {"length": 0, "last": None}
+        print(f"{symbol} {args.timeframe}: +{appended} bars, {meta['length']} stored through {meta['last']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Benchmarks for the cycle, evolution and dashboard hot paths.
+
+Seeds a synthetic population of each size into a scratch database (SQLite by
+default, or any DATABASE_URL such as a local/embedded Postgres), replaces the
+Alpaca client and quote backend with local mocks, uses an in-process Redis
+(fakeredis, if installed) unless --redis-url is given, and times each phase:
+
+    execute_logic     TradingAgent.execute_logic, one object per agent
+    population_step   Population.step over the same snapshot
+    market_cycle      run_market_cycle end to end (snapshot, step, bulk writes, leaderboard)
+    evolve            evolve_agents
+    dashboard         /api/dashboard/stats cold build, then the 304 revalidation
+
+For every phase it records wall time, the write statements run and rows they
+affected per table and statement type (so UPDATEs and upserts show up, not just
+net inserts), and peak traced memory, and prints one JSON document (or writes
+it with --output):
+
+    python benchmark.py --sizes 100,1000,10000
+    python benchmark.py --sizes 100000 --phases population_step,market_cycle --output bench.json
+    python benchmark.py --sizes 10000 --universe 500 --phases population_step,market_cycle
+    DATABASE_URL=postgresql://localhost/scratch python benchmark.py --env-database
+"""
+import argparse
+import collections
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PHASES = ["execute_logic", "population_step", "market_cycle", "evolve", "dashboard"]
+COUNTED_TABLES = ["agents", "positions", "trades", "portfolio_snapshots", "agent_metrics"]
+WRITE_STATEMENT = re.compile(r'\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?(\w+)', re.IGNORECASE)
+DEFAULT_SIZES = [100, 1000, 10000]
+
+
+class MockAlpacaClient:
+    """AlpacaClient stand-in: deterministic random-walk bars and prices, no network."""
+
+    def __init__(self, seed=0, start_price=150.0):
+        self.seed = seed
+        self.start_price = start_price
+
+    def _walk(self, symbol, limit):
+        import numpy as np
+        rng = np.random.default_rng([self.seed, sum(map(ord, symbol))])
+        return self.start_price * np.exp(np.cumsum(rng.normal(0.0003, 0.02, size=limit)))
+
+    def get_latest_price(self, symbol):
+        return float(self._walk(symbol, 1)[-1])
+
+    def get_bars(self, symbol, timeframe=None, limit=100, start=None):
+        import pandas as pd
+        end = datetime.datetime.utcnow().replace(hour=21, minute=0, second=0, microsecond=0)
+        index = pd.date_range(end=end, periods=limit, freq="D")
+        bars = pd.DataFrame({"close": self._walk(symbol, limit)}, index=index)
+        return bars[bars.index >= start] if start is not None else bars
+
+
+def configure_environment(database_url=None):
+    """
+    Points the app at a scratch database and local mocks. Must run before
+    importing database/worker, which bind their engine and clients at import.
+    """
+    scratch = tempfile.mkdtemp(prefix="agentarena-bench-")
+    os.environ["DATABASE_URL"] = database_url or f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ["MARKET_DATA_BACKEND"] = "mock"
+    os.environ["INDICATOR_SNAPSHOT_PATH"] = os.path.join(scratch, "indicator_state.json")
+    os.environ["BAR_STORE_DIR"] = os.path.join(scratch, "bars")
+    return scratch
+
+
+def configure_redis(redis_url=None):
+    """Real Redis at `redis_url`, else fakeredis in-process when installed. Returns what is in use."""
+    if redis_url:
+        os.environ["REDIS_URL"] = redis_url
+        return redis_url
+    try:
+        import fakeredis
+    except ImportError:
+        return os.getenv("REDIS_URL", "redis://localhost:6379")
+    import redis_client
+    server = fakeredis.FakeServer()
+    redis_client._client = fakeredis.FakeRedis(server=server)
+    redis_client._async_client = fakeredis.FakeAsyncRedis(server=server)
+    return "fakeredis"
+
+
+def generate_population(db, n, seed=0, symbols=None, holding_fraction=0.3, batch_size=5000):
+    """
+    Inserts `n` active agents with seed.py-style DNA and cash, and gives roughly
+    `holding_fraction` of them an open position in one universe symbol.
+    Returns the number of rows written.
+    """
+    import models
+    from backtest import DEFAULT_UNIVERSE, random_dna
+    from sqlalchemy import insert
+
+    rng = random.Random(seed)
+    symbols = symbols or DEFAULT_UNIVERSE
+    for start in range(0, n, batch_size):
+        rows = [
+            {
+                "name": f"Bench_{i}",
+                "dna": random_dna(rng),
+                "status": "active",
+                "generation": 1,
+                "current_cash": rng.uniform(95000, 105000),
+            }
+            for i in range(start, min(n, start + batch_size))
+        ]
+        db.execute(insert(models.Agent), rows)
+    ids = [i for (i,) in db.query(models.Agent.id).order_by(models.Agent.id)]
+
+    positions = [
+        {
+            "agent_id": agent_id,
+            "symbol": rng.choice(symbols),
+            "qty": float(rng.randint(1, 60)),
+            "avg_price": rng.uniform(100, 200),
+        }
+        for agent_id in ids if rng.random() < holding_fraction
+    ]
+    for start in range(0, len(positions), batch_size):
+        db.execute(insert(models.Position), positions[start:start + batch_size])
+    db.commit()
+    return len(ids) + len(positions)
+
+
+def market_snapshot(symbols, seed=0):
+    """One cycle's snapshot with the indicator fields the strategies read."""
+    rng = random.Random(seed)
+    snapshot = {}
+    for symbol in symbols:
+        price = rng.uniform(100, 200)
+        snapshot[symbol] = {
+            "symbol": symbol,
+            "price": price,
+            "rsi": rng.uniform(20, 80),
+            "rsi_by_period": {p: rng.uniform(20, 80) for p in range(10, 21)},
+            "sma_20": price * rng.uniform(0.95, 1.05),
+            "sma_50": price * rng.uniform(0.95, 1.05),
+        }
+    return snapshot
+
+
+def count_rows(db):
+    from sqlalchemy import text
+    return {t: db.execute(text(f"SELECT COUNT(*) FROM {t}")).scalar() for t in COUNTED_TABLES}
+
+
+class WriteCounter:
+    """
+    Write statements and the rows they affected per (table, verb), from SQLAlchemy
+    cursor events on `engines`. Drivers that report no rowcount for an executemany
+    count one row per parameter set; INSERT ... RETURNING reports none before its
+    rows are fetched, so measure() also checks inserts against table growth.
+    """
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.statements = collections.Counter()
+        self.rows = collections.Counter()
+
+    def __enter__(self):
+        from sqlalchemy import event
+        for engine in self.engines:
+            event.listen(engine, "after_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        for engine in self.engines:
+            event.remove(engine, "after_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        match = WRITE_STATEMENT.match(statement)
+        if not match:
+            return
+        key = (match.group(2).lower(), match.group(1).split()[0].lower())
+        rowcount = cursor.rowcount
+        if rowcount is None or rowcount < 0:
+            rowcount = len(parameters) if executemany and cursor.description is None else 0
+        self.statements[key] += 1
+        self.rows[key] += rowcount
+
+    @staticmethod
+    def by_table(counts):
+        tables = {}
+        for (table, verb), count in sorted(counts.items()):
+            tables.setdefault(table, {})[verb] = count
+        return tables
+
+
+def measure(db, fn, trace_memory=True):
+    """
+    Runs fn() and returns its wall time, write statements and rows affected per table
+    and verb, and peak traced memory.
+    """
+    from database import get_async_engine
+
+    before = count_rows(db)
+    db.expire_all()
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with WriteCounter([db.get_bind(), get_async_engine().sync_engine]) as writes, \
+                contextlib.redirect_stdout(sys.stderr):
+            fn()
+        elapsed = time.perf_counter() - start
+    finally:
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+    after = count_rows(db)
+    # COPY (on the raw DBAPI cursor) and RETURNING inserts go uncounted by the events; growth covers them
+    for table in COUNTED_TABLES:
+        inserted = after[table] - before[table] + writes.rows[(table, "delete")]
+        if inserted > writes.rows[(table, "insert")]:
+            writes.rows[(table, "insert")] = inserted
+    return {
+        "seconds": round(elapsed, 6),
+        "rows": WriteCounter.by_table(writes.rows),
+        "statements": WriteCounter.by_table(writes.statements),
+        "peak_mb": round(peak / 2 ** 20, 3) if peak is not None else None,
+    }
+
+
+def _execute_logic(db, snapshot):
+    import models
+    from agent import TradingAgent
+    from positions import PositionBook
+
+    by_agent = {}
+    for p in db.query(models.Position.agent_id, models.Position.symbol, models.Position.qty, models.Position.avg_price):
+        by_agent.setdefault(p.agent_id, []).append(p)
+    for agent_id, dna, cash in db.query(models.Agent.id, models.Agent.dna, models.Agent.current_cash):
+        agent = TradingAgent(agent_id, dna)
+        agent.portfolio_value = cash
+        agent.positions = PositionBook.from_rows(by_agent.get(agent_id, ()))
+        for data in snapshot.values():
+            agent.execute_logic(data)
+
+
+def _population_step(db, snapshot):
+    import models
+    from population import Population
+
+    agents = db.query(models.Agent.id, models.Agent.dna, models.Agent.current_cash).all()
+    positions = db.query(
+        models.Position.agent_id, models.Position.symbol, models.Position.qty, models.Position.avg_price
+    ).all()
+    Population.from_agents(agents, positions, list(snapshot)).step(snapshot)
+
+
+def _dashboard():
+    import asyncio
+    import httpx
+    import leaderboard
+    import main
+    from database import get_async_engine
+
+    async def requests():
+        transport = httpx.ASGITransport(app=main.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                response = await client.get("/api/dashboard/stats")
+                await client.get("/api/dashboard/stats", headers={"If-None-Match": response.headers.get("etag", "")})
+        finally:
+            # Pooled async connections are bound to this event loop
+            await get_async_engine().dispose()
+
+    # Cold path: drop the published snapshot so the handler rebuilds it
+    leaderboard._local_snapshot = None
+    leaderboard._redis().delete(leaderboard.LEADERBOARD_KEY)
+    asyncio.run(requests())
+
+
+def universe(size):
+    """The default five symbols padded with synthetic tickers (SYM0005, ...) up to `size`."""
+    from backtest import DEFAULT_UNIVERSE
+
+    return list(DEFAULT_UNIVERSE) + [f"SYM{k:04d}" for k in range(len(DEFAULT_UNIVERSE), size)]
+
+
+def run_size(n, phases, seed=0, trace_memory=True, symbols=None):
+    import models
+    import worker
+    from database import SessionLocal, engine
+
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    if os.path.exists(os.environ["INDICATOR_SNAPSHOT_PATH"]):
+        os.remove(os.environ["INDICATOR_SNAPSHOT_PATH"])
+
+    db = SessionLocal()
+    try:
+        symbols = symbols or universe(5)
+        worker.UNIVERSE = symbols
+        seed_result = measure(db, lambda: generate_population(db, n, seed=seed, symbols=symbols), trace_memory)
+        snapshot = market_snapshot(symbols, seed=seed)
+        steps = {
+            "execute_logic": lambda: _execute_logic(db, snapshot),
+            "population_step": lambda: _population_step(db, snapshot),
+            "market_cycle": worker.run_market_cycle,
+            "evolve": worker.evolve_agents,
+            "dashboard": _dashboard,
+        }
+        results = {"seed": seed_result}
+        for phase in phases:
+            results[phase] = measure(db, steps[phase], trace_memory)
+        return {"agents": n, "phases": results}
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cycle, evolution and dashboard paths.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma separated population sizes (default: %(default)s)")
+    parser.add_argument("--phases", default=",".join(PHASES), help="Comma separated subset of " + ", ".join(PHASES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--universe", type=int, default=5, help="Symbols traded (default: %(default)s)")
+    parser.add_argument("--database-url", help="Scratch database (default: a temporary SQLite file). Tables are dropped!")
+    parser.add_argument("--env-database", action="store_true", help="Use DATABASE_URL from the environment (tables are dropped!)")
+    parser.add_argument("--redis-url", help="Real Redis to use (default: in-process fakeredis when installed)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (lower overhead timings)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    phases = [p.strip() for p in args.phases.split(",") if p.strip()]
+    unknown = set(phases) - set(PHASES)
+    if unknown:
+        parser.error(f"unknown phases: {sorted(unknown)}")
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    configure_environment(args.database_url or (os.getenv("DATABASE_URL") if args.env_database else None))
+    redis = configure_redis(args.redis_url)
+    with contextlib.redirect_stdout(sys.stderr):
+        import main  # noqa: F401 (imported up front so the dashboard phase does not time the import)
+        import worker
+        from database import engine
+    worker.alpaca = worker.bar_store.client = MockAlpacaClient(seed=args.seed)
+    if redis == "fakeredis":
+        from redis_client import get_redis
+        worker.indicator_store._redis = get_redis()
+
+    report = {
+        "started_at": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": engine.dialect.name,
+        "redis": redis,
+        "seed": args.seed,
+        "universe": args.universe,
+        "memory_traced": not args.no_memory,
+        "results": [],
+    }
+    for n in sizes:
+        print(f"Benchmarking {n} agents...", file=sys.stderr)
+        report["results"].append(run_size(
+            n, phases, seed=args.seed, trace_memory=not args.no_memory, symbols=universe(args.universe)
+        ))
+
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(body + "\n")
+    else:
+        print(body)
+
+
+if __name__ == "__main__":
+    main()
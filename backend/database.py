@@ -18,8 +18,30 @@ def get_database_url():
         url = url.replace("postgres://", "postgresql://", 1)
     return url
 
+def get_async_database_url(url):
+    """Same database through an asyncio driver (asyncpg for Postgres)."""
+    scheme, rest = url.split("://", 1)
+    if scheme.startswith("postgresql"):
+        # asyncpg spells libpq's sslmode as ssl
+        return "postgresql+asyncpg://" + rest.replace("sslmode=", "ssl=")
+    if scheme.startswith("sqlite"):
+        return "sqlite+aiosqlite://" + rest
+    return url
+
+def get_pool_options(url):
+    """Connection pool settings, tunable per process type via environment."""
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+    }
+
 DATABASE_URL = get_database_url()
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **get_pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -30,3 +52,26 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Async engine for the API's read paths. Created on first use so that workers
+# and scripts never need the asyncio driver installed.
+_async_engine = None
+_AsyncSessionLocal = None
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        _async_engine = create_async_engine(get_async_database_url(DATABASE_URL), **get_pool_options(DATABASE_URL))
+    return _async_engine
+
+def get_async_sessionmaker():
+    global _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _AsyncSessionLocal = async_sessionmaker(get_async_engine(), expire_on_commit=False, autoflush=False)
+    return _AsyncSessionLocal
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -0,0 +1,115 @@
+"""
+Live dashboard deltas.
+
+Workers publish small change events (agent PnL/status changes, new trades,
+evolution results) on a Redis pub/sub channel. Each API process keeps one
+subscription and fans events out to its connected /api/stream clients.
+"""
+import asyncio
+import json
+
+EVENTS_CHANNEL = "arena:events"
+MAX_TRADES_PER_EVENT = 500
+SUMMARY_FIELDS = ("spx_price", "total_pnl_usd", "total_pnl_spx", "updated_at")
+
+
+def leaderboard_deltas(old_payload, new_payload):
+    """Events describing what changed between two leaderboard payloads."""
+    old_agents = {a["id"]: a for a in (old_payload or {}).get("agents", [])}
+    new_agents = {a["id"]: a for a in new_payload.get("agents", [])}
+
+    events = [{"type": "summary", **{k: new_payload.get(k) for k in SUMMARY_FIELDS}}]
+    for agent_id, agent in new_agents.items():
+        if old_agents.get(agent_id) != agent:
+            events.append({"type": "agent", "agent": agent})
+    for agent_id in old_agents.keys() - new_agents.keys():
+        events.append({"type": "agent_removed", "id": agent_id})
+    return events
+
+
+def trade_events(trades):
+    """Batches executed trades (dicts with agent_id/symbol/side/qty/price/timestamp) into events."""
+    rows = [
+        {
+            "agent_id": t["agent_id"],
+            "symbol": t["symbol"],
+            "side": t["side"],
+            "qty": t["qty"],
+            "price": round(t["price"], 4),
+            "timestamp": t["timestamp"].isoformat() + "Z",
+        }
+        for t in trades
+    ]
+    return [
+        {"type": "trades", "trades": rows[i:i + MAX_TRADES_PER_EVENT]}
+        for i in range(0, len(rows), MAX_TRADES_PER_EVENT)
+    ]
+
+
+def publish_events(events, redis=None):
+    if not events:
+        return
+    try:
+        if redis is None:
+            from redis_client import get_redis
+            redis = get_redis()
+        pipe = redis.pipeline(transaction=False)
+        for event in events:
+            pipe.publish(EVENTS_CHANNEL, json.dumps(event, separators=(",", ":")))
+        pipe.execute()
+    except Exception as e:
+        print(f"Error publishing {len(events)} events: {e}")
+
+
+def format_sse(event_type, data):
+    """One Server-Sent Events frame; `data` is an already serialized JSON string."""
+    return f"event: {event_type}\ndata: {data}\n\n"
+
+
+class EventBroadcaster:
+    """
+    Single Redis subscription per process, fanned out to per-client asyncio queues
+    of ready-to-send SSE frames. Slow clients drop events rather than holding up the others.
+    """
+
+    def __init__(self, redis_url, queue_size=256):
+        self.redis_url = redis_url
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self._task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    async def _listen(self):
+        import redis.asyncio as aioredis
+
+        while self.subscribers:
+            client = aioredis.Redis.from_url(self.redis_url)
+            try:
+                pubsub = client.pubsub()
+                await pubsub.subscribe(EVENTS_CHANNEL)
+                while self.subscribers:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    data = message["data"]
+                    data = data.decode() if isinstance(data, bytes) else data
+                    frame = format_sse(json.loads(data).get("type", "message"), data)
+                    for queue in list(self.subscribers):
+                        if queue.full():
+                            continue
+                        queue.put_nowait(frame)
+                await pubsub.unsubscribe(EVENTS_CHANNEL)
+            except Exception as e:
+                print(f"Event subscription error, retrying: {e}")
+                await asyncio.sleep(2)
+            finally:
+                await client.aclose()
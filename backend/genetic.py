@@ -0,0 +1,300 @@
+"""
+Offline genetic search.
+
+Evolves a population of DNAs for many generations against historical bars.
+Fitness is scored in parallel on a ProcessPoolExecutor: every worker receives
+the price history and precomputed indicators once (pool initializer), so each
+task only ships a chunk of DNAs out and an array of fitness values back.
+
+With --robust-paths N, fitness is instead the median return (minus the
+drawdown penalty times the 5th-percentile drawdown) over N Monte Carlo paths
+resampled from the history, scored by robustness.RobustnessEvaluator.
+
+    python genetic.py --population 1000 --generations 30 --workers 8
+    python genetic.py --source file --file bars.csv --write-back 4
+    python genetic.py --robust-paths 200 --drawdown-penalty 0.5
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backtest import (
+    AlpacaPriceSource, FilePriceSource, STARTING_CASH, SyntheticPriceSource,
+    compute_indicators, random_dna, run_backtest,
+)
+from population import Population
+
+STRATEGIES = ["momentum", "mean_reversion"]
+
+# Searchable DNA fields: (kind, low, high, decimals). worker.mutate_dna clamps to
+# the same bounds; rsi_limit stays under 50 since agents sell above 100 - rsi_limit.
+GENES = {
+    "strategy": ("choice", STRATEGIES, None, None),
+    "rsi_limit": ("int", 10, 45, None),
+    "rsi_period": ("int", 5, 30, None),
+    "stop_loss_pct": ("float", 0.01, 0.15, 3),
+    "take_profit_pct": ("float", 0.02, 0.30, 3),
+    "max_position_size": ("float", 0.02, 0.5, 3),
+}
+
+
+def clamp_gene(name, value):
+    """`value` clipped to the gene's bounds and rounded like the gene."""
+    kind, low, high, decimals = GENES[name]
+    value = min(high, max(low, value))
+    return int(round(value)) if kind == "int" else round(value, decimals)
+
+
+def crossover(a, b, rng=random):
+    """
+    Uniform crossover: each gene comes from either parent with equal odds. Fields
+    outside GENES (e.g. a watchlist) are kept from `a`.
+    """
+    child = dict(a)
+    for name in GENES:
+        source = a if rng.random() < 0.5 else b
+        if name in source:
+            child[name] = source[name]
+    return child
+
+
+def mutate(dna, rng=random, rate=0.2, scale=0.1):
+    """
+    Mutates each gene with probability `rate`. Numeric genes take a Gaussian step of
+    `scale` times their range, clipped to bounds; the strategy gene is redrawn.
+    """
+    child = dict(dna)
+    for name, (kind, low, high, decimals) in GENES.items():
+        if rng.random() >= rate:
+            continue
+        if kind == "choice":
+            child[name] = rng.choice(low)
+            continue
+        child[name] = clamp_gene(name, child.get(name, (low + high) / 2) + rng.gauss(0, scale * (high - low)))
+    return child
+
+
+def tournament_selection(fitness, count, rng=random, size=3):
+    """Indices of `count` parents, each the fittest of `size` random entrants."""
+    n = len(fitness)
+    return [max(rng.sample(range(n), min(size, n)), key=lambda i: fitness[i]) for _ in range(count)]
+
+
+def truncation_selection(fitness, count, rng=random, fraction=0.25):
+    """Parents drawn uniformly from the top `fraction` of the population."""
+    ranked = np.argsort(-np.asarray(fitness), kind="stable")
+    pool = ranked[: max(2, int(len(ranked) * fraction))].tolist()
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def roulette_selection(fitness, count, rng=random):
+    """Fitness-proportional selection (fitness shifted to be positive)."""
+    fitness = np.asarray(fitness, dtype=np.float64)
+    weights = fitness - fitness.min() + 1e-9
+    return rng.choices(range(len(fitness)), weights=weights.tolist(), k=count)
+
+
+SELECTION = {
+    "tournament": tournament_selection,
+    "truncation": truncation_selection,
+    "roulette": roulette_selection,
+}
+
+
+# Per worker process state, set once by _init_worker
+_history = None
+_indicators = None
+_drawdown_penalty = 0.0
+
+
+def _init_worker(history, indicators, drawdown_penalty):
+    global _history, _indicators, _drawdown_penalty
+    _history = history
+    _indicators = indicators
+    _drawdown_penalty = drawdown_penalty
+
+
+def score(dnas, history, indicators=None, drawdown_penalty=0.0):
+    """Fitness per DNA: total return minus `drawdown_penalty` x max drawdown."""
+    n = len(dnas)
+    population = Population(list(range(n)), dnas, [STARTING_CASH] * n, [()] * n, history.symbols)
+    result = run_backtest(population, history, indicators=indicators)
+    return result.returns - drawdown_penalty * result.max_drawdown
+
+
+def _score_chunk(dnas):
+    return score(dnas, _history, _indicators, _drawdown_penalty)
+
+
+class GeneticSearch:
+    """
+    Generational GA with elitism over backtested DNAs.
+    search.run(generations) returns [(fitness, dna)] for the final population, best first.
+    """
+
+    def __init__(self, history, population_size=200, elite=4, selection="tournament",
+                 mutation_rate=0.2, mutation_scale=0.1, crossover_rate=0.9,
+                 drawdown_penalty=0.0, workers=None, chunk_size=None, seed=None,
+                 robust_paths=0, robust_method="bootstrap"):
+        if selection not in SELECTION:
+            raise ValueError(f"selection must be one of {sorted(SELECTION)}")
+        self.history = history
+        self.population_size = population_size
+        self.elite = min(elite, population_size)
+        self.select = SELECTION[selection]
+        self.mutation_rate = mutation_rate
+        self.mutation_scale = mutation_scale
+        self.crossover_rate = crossover_rate
+        self.drawdown_penalty = drawdown_penalty
+        self.workers = workers or os.cpu_count() or 1
+        # One chunk per worker by default: run_backtest cost is dominated by the per-bar loop, not agents
+        self.chunk_size = chunk_size or max(1, -(-population_size // self.workers))
+        self.rng = random.Random(seed)
+        # Every rsi_period the genes can produce, so one indicator set serves all generations
+        self.rsi_periods = range(GENES["rsi_period"][1], GENES["rsi_period"][2] + 1)
+        self.robust = None
+        if robust_paths:
+            from robustness import RobustnessEvaluator
+            self.robust = RobustnessEvaluator(
+                history, paths=robust_paths, method=robust_method, rsi_periods=self.rsi_periods,
+                workers=self.workers, seed=seed,
+            )
+            self.indicators = None
+        else:
+            self.indicators = compute_indicators(history, self.rsi_periods)
+
+    def initial_population(self, seeds=()):
+        dnas = [dict(d) for d in seeds][: self.population_size]
+        while len(dnas) < self.population_size:
+            dnas.append(mutate(random_dna(self.rng), self.rng, rate=0.5, scale=0.2))
+        return dnas
+
+    def evaluate(self, dnas, pool=None):
+        if self.robust is not None:
+            return self.robust.evaluate(dnas).fitness(self.drawdown_penalty)
+        if pool is None:
+            return score(dnas, self.history, self.indicators, self.drawdown_penalty)
+        chunks = [dnas[i:i + self.chunk_size] for i in range(0, len(dnas), self.chunk_size)]
+        return np.concatenate(list(pool.map(_score_chunk, chunks)))
+
+    def breed(self, dnas, fitness):
+        ranked = np.argsort(-fitness, kind="stable")
+        children = [dnas[i] for i in ranked[: self.elite]]
+        while len(children) < self.population_size:
+            a, b = self.select(fitness, 2, self.rng)
+            child = crossover(dnas[a], dnas[b], self.rng) if self.rng.random() < self.crossover_rate else dict(dnas[a])
+            children.append(mutate(child, self.rng, self.mutation_rate, self.mutation_scale))
+        return children
+
+    def run(self, generations, seeds=(), verbose=True):
+        dnas = self.initial_population(seeds)
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.history, self.indicators, self.drawdown_penalty),
+        ) if self.workers > 1 and self.robust is None else None
+        try:
+            for generation in range(1, generations + 1):
+                start = time.perf_counter()
+                fitness = self.evaluate(dnas, pool)
+                if verbose:
+                    print(f"Generation {generation}: best {fitness.max():+.4f} "
+                          f"mean {fitness.mean():+.4f} ({time.perf_counter() - start:.2f}s)")
+                if generation < generations:
+                    dnas = self.breed(dnas, fitness)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if self.robust is not None:
+                self.robust.close()
+
+        ranked = np.argsort(-fitness, kind="stable")
+        return [(float(fitness[i]), dnas[i]) for i in ranked]
+
+
+def write_back(db, genomes, name_prefix="GA"):
+    """Adds the given DNAs as new active agents one generation past the current max. Returns them."""
+    import models
+    from sqlalchemy import func
+
+    generation = (db.query(func.max(models.Agent.generation)).scalar() or 0) + 1
+    agents = [
+        models.Agent(
+            name=f"{name_prefix}_Gen{generation}_{i}",
+            dna=dna,
+            generation=generation,
+            current_cash=STARTING_CASH,
+        )
+        for i, dna in enumerate(genomes, start=1)
+    ]
+    db.add_all(agents)
+    db.commit()
+    return agents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evolve DNAs offline against historical bars.")
+    parser.add_argument("--source", choices=["synthetic", "file", "alpaca"], default="synthetic")
+    parser.add_argument("--file", help="CSV with timestamp,symbol,close columns (for --source file)")
+    parser.add_argument("--symbols", help="Comma separated symbols (default: the live universe, or all in --file)")
+    parser.add_argument("--bars", type=int, default=252)
+    parser.add_argument("--population", type=int, default=200)
+    parser.add_argument("--generations", type=int, default=20)
+    parser.add_argument("--elite", type=int, default=4)
+    parser.add_argument("--selection", choices=sorted(SELECTION), default="tournament")
+    parser.add_argument("--mutation-rate", type=float, default=0.2)
+    parser.add_argument("--mutation-scale", type=float, default=0.1)
+    parser.add_argument("--crossover-rate", type=float, default=0.9)
+    parser.add_argument("--drawdown-penalty", type=float, default=0.0)
+    parser.add_argument("--robust-paths", type=int, default=0, metavar="N",
+                        help="Score fitness over N Monte Carlo paths instead of the one history")
+    parser.add_argument("--robust-method", choices=["bootstrap", "gbm"], default="bootstrap")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--write-back", type=int, default=0, metavar="N", help="Insert the best N DNAs as new agents")
+    args = parser.parse_args()
+
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()] if args.symbols else None
+    if args.source == "file":
+        source = FilePriceSource(args.file, symbols)
+    elif args.source == "alpaca":
+        source = AlpacaPriceSource(symbols, bars=args.bars)
+    else:
+        source = SyntheticPriceSource(symbols, bars=args.bars, seed=args.seed)
+    history = source.load()
+
+    search = GeneticSearch(
+        history,
+        population_size=args.population,
+        elite=args.elite,
+        selection=args.selection,
+        mutation_rate=args.mutation_rate,
+        mutation_scale=args.mutation_scale,
+        crossover_rate=args.crossover_rate,
+        drawdown_penalty=args.drawdown_penalty,
+        workers=args.workers,
+        seed=args.seed,
+        robust_paths=args.robust_paths,
+        robust_method=args.robust_method,
+    )
+    results = search.run(args.generations)
+    for rank, (fitness, dna) in enumerate(results[: args.top], start=1):
+        print(f"{rank}. fitness {fitness:+.4f} dna {dna}")
+
+    if args.write_back:
+        from database import SessionLocal
+        db = SessionLocal()
+        try:
+            agents = write_back(db, [dna for _, dna in results[: args.write_back]])
+            print(f"Inserted {len(agents)} agents: {[a.name for a in agents]}")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
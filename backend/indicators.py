@@ -0,0 +1,390 @@
+"""
+Streaming technical indicators.
+
+Keeps rolling state per symbol so each new price updates every indicator in
+O(1): simple moving averages over ring buffers and Wilder RSI for every
+distinct rsi_period in the population. State is snapshotted to Redis (or a
+local JSON file) between cycles so a worker restart resumes warm.
+
+Every sample is one bar of a single timeframe (INDICATOR_TIMEFRAME, default
+1Day, the bars state is warmed from). Prices arriving inside the current bar,
+from cycles or ticks, only replace that bar's provisional close: values are
+previewed with it, and it is folded into the state once a later bar starts.
+The timeframe is stored with the snapshot; a snapshot for another timeframe is
+discarded and rebuilt from bars.
+"""
+import datetime
+import json
+import os
+
+import numpy as np
+
+DEFAULT_RSI_PERIOD = 14
+SMA_WINDOWS = (20, 50)
+REDIS_KEY = "arena:indicators"
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "indicator_state.json")
+INDICATOR_TIMEFRAME = os.getenv("INDICATOR_TIMEFRAME", "1Day")
+
+_UNIT_SECONDS = {"Min": 60, "Hour": 3600}
+
+
+def bar_key(timestamp, timeframe=INDICATOR_TIMEFRAME):
+    """
+    Ordinal of the `timeframe` bar ("1Day", "5Min", "1Hour", ...) containing `timestamp`
+    (naive UTC, or aware); later bars have larger keys. Days are UTC dates, which
+    match the exchange date for daily bars and for prices during US market hours.
+    """
+    if not isinstance(timestamp, datetime.datetime):
+        timestamp = np.datetime64(timestamp, "us").astype(datetime.datetime)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    timestamp = timestamp.astimezone(datetime.timezone.utc)
+    timeframe = str(timeframe)
+    if timeframe.endswith("Day"):
+        return timestamp.date().toordinal()
+    for unit, seconds in _UNIT_SECONDS.items():
+        if timeframe.endswith(unit):
+            size = int(timeframe[: -len(unit)] or 1) * seconds
+            return int(timestamp.timestamp()) // size
+    raise ValueError(f"Unsupported indicator timeframe: {timeframe}")
+
+
+def rsi_from_averages(avg_gain, avg_loss):
+    """RSI from Wilder-smoothed average gain/loss; accepts floats or NumPy arrays."""
+    if isinstance(avg_gain, np.ndarray):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+        flat = np.where(avg_gain == 0, 50.0, 100.0)
+        return np.where(avg_loss == 0, flat, rsi)
+
+    if avg_loss == 0:
+        return 50.0 if avg_gain == 0 else 100.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+
+class RollingSMA:
+    """Simple moving average over a fixed-size ring buffer."""
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = [0.0] * window
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def update(self, price):
+        self.total += price - self.buffer[self.index]
+        self.buffer[self.index] = price
+        self.index = (self.index + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+        if self.index == 0:
+            # Re-sum once per lap so floating point drift cannot accumulate
+            self.total = sum(self.buffer)
+
+    @property
+    def value(self):
+        if self.count < self.window:
+            return None
+        return self.total / self.window
+
+    def preview(self, price):
+        """The value update(price) would give, without changing the state."""
+        if self.count < self.window - 1:
+            return None
+        dropped = self.buffer[self.index] if self.count == self.window else 0.0
+        return (self.total - dropped + price) / self.window
+
+    def history(self):
+        """Buffered prices, oldest first."""
+        if self.count < self.window:
+            return self.buffer[: self.count]
+        return self.buffer[self.index:] + self.buffer[: self.index]
+
+    def to_dict(self):
+        return {"window": self.window, "buffer": self.buffer, "index": self.index, "count": self.count}
+
+    @classmethod
+    def from_dict(cls, data):
+        sma = cls(data["window"])
+        sma.buffer = [float(x) for x in data["buffer"]]
+        sma.index = data["index"]
+        sma.count = data["count"]
+        sma.total = sum(sma.buffer)
+        return sma
+
+
+class WilderRSI:
+    """Wilder's RSI: seeded with a simple average of the first `period` changes, then smoothed."""
+
+    def __init__(self, period):
+        self.period = period
+        self.last_price = None
+        self.count = 0  # price changes seen, capped at period
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+
+    def update(self, price):
+        if self.last_price is not None:
+            change = price - self.last_price
+            gain = change if change > 0 else 0.0
+            loss = -change if change < 0 else 0.0
+            if self.count < self.period:
+                # Seeding: accumulate the simple average
+                self.count += 1
+                self.avg_gain += (gain - self.avg_gain) / self.count
+                self.avg_loss += (loss - self.avg_loss) / self.count
+            else:
+                self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+                self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+        self.last_price = price
+
+    @property
+    def value(self):
+        if self.count < self.period:
+            return None
+        return rsi_from_averages(self.avg_gain, self.avg_loss)
+
+    def preview(self, price):
+        """The value update(price) would give, without changing the state."""
+        if self.last_price is None or self.count < self.period - 1:
+            return None
+        change = price - self.last_price
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        if self.count < self.period:
+            avg_gain = self.avg_gain + (gain - self.avg_gain) / self.period
+            avg_loss = self.avg_loss + (loss - self.avg_loss) / self.period
+        else:
+            avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+        return rsi_from_averages(avg_gain, avg_loss)
+
+    def to_dict(self):
+        return {
+            "period": self.period,
+            "last_price": self.last_price,
+            "count": self.count,
+            "avg_gain": self.avg_gain,
+            "avg_loss": self.avg_loss,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        rsi = cls(data["period"])
+        rsi.last_price = data["last_price"]
+        rsi.count = data["count"]
+        rsi.avg_gain = data["avg_gain"]
+        rsi.avg_loss = data["avg_loss"]
+        return rsi
+
+
+class SymbolIndicators:
+    """Completed bars folded into the indicators, plus the open bar's provisional close."""
+
+    def __init__(self, rsi_periods, sma_windows=SMA_WINDOWS):
+        self.smas = {w: RollingSMA(w) for w in sma_windows}
+        self.rsis = {p: WilderRSI(p) for p in rsi_periods}
+        self.last_price = None
+        self.bar = None  # bar_key of the open bar
+        self.pending = None  # its latest price, not folded in yet
+
+    def update(self, price):
+        """Folds one completed bar's close into every indicator."""
+        for sma in self.smas.values():
+            sma.update(price)
+        for rsi in self.rsis.values():
+            rsi.update(price)
+        self.last_price = price
+
+    def observe(self, price, bar):
+        """A price inside bar `bar`: closes out the open bar when `bar` is a later one."""
+        if self.bar is not None and bar < self.bar:
+            return  # late price for a bar already closed
+        if self.bar is not None and bar > self.bar and self.pending is not None:
+            self.update(self.pending)
+        self.bar = bar
+        self.pending = price
+
+    def add_rsi_period(self, period):
+        """Adds an RSI period, warmed from the longest SMA buffer when it holds enough history."""
+        rsi = WilderRSI(period)
+        longest = self.smas[max(self.smas)] if self.smas else None
+        if longest is not None:
+            for price in longest.history():
+                rsi.update(price)
+        self.rsis[period] = rsi
+
+    def values(self):
+        """Indicator values with the open bar's provisional close as the latest sample."""
+        pending = self.pending
+        if pending is None:
+            rsi_by_period = {p: r.value for p, r in self.rsis.items()}
+        else:
+            rsi_by_period = {p: r.preview(pending) for p, r in self.rsis.items()}
+        values = {
+            "rsi": rsi_by_period.get(DEFAULT_RSI_PERIOD),
+            "rsi_by_period": rsi_by_period,
+        }
+        for window, sma in self.smas.items():
+            values[f"sma_{window}"] = sma.value if pending is None else sma.preview(pending)
+        return values
+
+    def to_dict(self):
+        return {
+            "last_price": self.last_price,
+            "bar": self.bar,
+            "pending": self.pending,
+            "smas": [s.to_dict() for s in self.smas.values()],
+            "rsis": [r.to_dict() for r in self.rsis.values()],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(())
+        state.smas = {s["window"]: RollingSMA.from_dict(s) for s in data["smas"]}
+        state.rsis = {r["period"]: WilderRSI.from_dict(r) for r in data["rsis"]}
+        state.last_price = data["last_price"]
+        state.bar = data.get("bar")
+        state.pending = data.get("pending")
+        return state
+
+
+class IndicatorEngine:
+    """
+    Per-symbol rolling indicator state for the whole universe.
+
+    engine.ensure_periods({10, 14, 20})
+    engine.warm("AAPL", bars.close, bars.timestamp)
+    engine.update("AAPL", 187.2)  ->  {"rsi": ..., "rsi_by_period": {...}, "sma_20": ..., "sma_50": ...}
+    """
+
+    def __init__(self, rsi_periods=(DEFAULT_RSI_PERIOD,), sma_windows=SMA_WINDOWS, timeframe=INDICATOR_TIMEFRAME):
+        self.rsi_periods = set(rsi_periods) | {DEFAULT_RSI_PERIOD}
+        self.sma_windows = tuple(sma_windows)
+        self.timeframe = str(timeframe)
+        self.symbols = {}
+
+    def __contains__(self, symbol):
+        return symbol in self.symbols
+
+    def ensure_periods(self, periods):
+        """Tracks RSI for any new periods (e.g. after evolution introduced new DNA)."""
+        new = set(periods) - self.rsi_periods
+        for period in new:
+            for state in self.symbols.values():
+                state.add_rsi_period(period)
+        self.rsi_periods |= new
+
+    def _state(self, symbol):
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = self.symbols[symbol] = SymbolIndicators(self.rsi_periods, self.sma_windows)
+        return state
+
+    def warm(self, symbol, closes, timestamps=None):
+        """
+        Replays historical bar closes (oldest first, of the engine's timeframe) into the
+        symbol's state. With `timestamps`, the last bar stays open: live prices inside it
+        replace its close instead of adding a bar.
+        """
+        state = self._state(symbol)
+        closes = [float(price) for price in closes]
+        if timestamps is None or not closes:
+            for price in closes:
+                state.update(price)
+            return
+        for price in closes[:-1]:
+            state.update(price)
+        state.bar = bar_key(timestamps[-1], self.timeframe)
+        state.pending = closes[-1]
+
+    def update(self, symbol, price, timestamp=None):
+        """
+        Records a price at `timestamp` (naive UTC, default now) and returns the symbol's
+        indicator values. Only the first price of a new bar closes the previous one.
+        """
+        state = self._state(symbol)
+        state.observe(float(price), bar_key(timestamp or datetime.datetime.utcnow(), self.timeframe))
+        return state.values()
+
+    def values(self, symbol):
+        """Current indicator values without feeding a price."""
+        return self._state(symbol).values()
+
+    def to_dict(self):
+        return {
+            "timeframe": self.timeframe,
+            "rsi_periods": sorted(self.rsi_periods),
+            "sma_windows": list(self.sma_windows),
+            "symbols": {s: state.to_dict() for s, state in self.symbols.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        engine = cls(data["rsi_periods"], data["sma_windows"], data["timeframe"])
+        engine.symbols = {s: SymbolIndicators.from_dict(d) for s, d in data["symbols"].items()}
+        return engine
+
+
+def normalize_snapshot(market_snapshot):
+    """Restores integer rsi_by_period keys after a JSON round trip (e.g. through Celery)."""
+    for data in market_snapshot.values():
+        if data.get("rsi_by_period"):
+            data["rsi_by_period"] = {int(p): v for p, v in data["rsi_by_period"].items()}
+    return market_snapshot
+
+
+class IndicatorStore:
+    """Persists IndicatorEngine snapshots in Redis, falling back to a local JSON file."""
+
+    def __init__(self, redis_url=None, path=None):
+        self.redis_url = redis_url
+        self.path = path or os.getenv("INDICATOR_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH)
+        self._redis = None
+
+    def _client(self):
+        if self._redis is None and self.redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def load(self, timeframe=INDICATOR_TIMEFRAME):
+        """The stored engine, or None when there is none or it samples another bar timeframe."""
+        raw = None
+        try:
+            client = self._client()
+            if client is not None:
+                raw = client.get(REDIS_KEY)
+        except Exception as e:
+            print(f"Error loading indicator state from Redis: {e}")
+
+        if raw is None and os.path.exists(self.path):
+            with open(self.path) as f:
+                raw = f.read()
+
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        if data.get("timeframe") != str(timeframe):
+            print(f"Discarding indicator state sampled at {data.get('timeframe') or 'unknown'} bars "
+                  f"(want {timeframe}); rebuilding from history.")
+            return None
+        return IndicatorEngine.from_dict(data)
+
+    def save(self, engine):
+        self.save_raw(json.dumps(engine.to_dict()))
+
+    def save_raw(self, raw):
+        """Stores an already serialized engine (e.g. dumped on the event loop, written from a thread)."""
+        try:
+            client = self._client()
+            if client is not None:
+                client.set(REDIS_KEY, raw)
+                return
+        except Exception as e:
+            print(f"Error saving indicator state to Redis: {e}")
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(raw)
+        os.replace(tmp_path, self.path)
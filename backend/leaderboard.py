@@ -0,0 +1,180 @@
+"""
+Materialized leaderboard.
+
+The worker builds the dashboard payload once per market cycle and publishes
+it as a versioned snapshot in Redis. /api/dashboard/stats serves the stored
+JSON as-is and answers If-None-Match with 304 while the version is unchanged.
+"""
+import datetime
+import json
+import time
+
+import events
+import models
+import performance
+from backtest import STARTING_CASH
+
+LEADERBOARD_KEY = "arena:leaderboard"
+
+# Used when Redis is unavailable (only visible to the publishing process, so kept briefly)
+LOCAL_SNAPSHOT_TTL = 5.0
+_local_snapshot = None
+
+
+def build_leaderboard(agents, spx_price, prices=None):
+    """
+    Dashboard payload for the given agents (with their positions and metrics loaded);
+    `prices` ({symbol: price}) marks open positions.
+    """
+    prices = prices or {}
+    total_pnl_usd = 0.0
+    agent_stats = []
+
+    for a in agents:
+        equity = a.current_cash
+        formatted_positions = []
+        for p in a.positions:
+            price = prices.get(p.symbol)
+            equity += p.qty * (price or p.avg_price)
+            pnl_pct = (price - p.avg_price) / p.avg_price * 100 if price and p.avg_price else 0.0
+            formatted_positions.append({
+                "symbol": p.symbol,
+                "qty": round(p.qty, 2),
+                "entry": round(p.avg_price, 2),
+                "pnl_pct": round(pnl_pct, 1)
+            })
+        pnl_usd = equity - STARTING_CASH
+        total_pnl_usd += pnl_usd
+
+        agent_stats.append({
+            "id": a.id,
+            "name": a.name,
+            "status": a.status,
+            "pnl_usd": round(pnl_usd, 2),
+            "pnl_spx": round(pnl_usd / spx_price, 3),
+            "balance_usd": round(a.current_cash, 2),
+            "balance_spx": round(a.current_cash / spx_price, 2),
+            "positions": formatted_positions[:4],
+            "generation": a.generation,
+            **performance.summarize(a.metrics),
+        })
+
+    agent_stats.sort(key=lambda x: x['pnl_usd'], reverse=True)
+
+    return {
+        "spx_price": round(spx_price, 2),
+        "total_pnl_usd": round(total_pnl_usd, 2),
+        "total_pnl_spx": round(total_pnl_usd / spx_price, 2),
+        "agents": agent_stats,
+        "updated_at": datetime.datetime.utcnow().isoformat() + "Z",
+    }
+
+
+def _redis():
+    try:
+        from redis_client import get_redis
+        return get_redis()
+    except Exception:
+        return None
+
+
+def publish_leaderboard(payload, redis=None):
+    """Stores the payload under a new version and returns the snapshot, as load_leaderboard would."""
+    global _local_snapshot
+    body = json.dumps(payload, separators=(",", ":"))
+    redis = redis or _redis()
+    try:
+        pipe = redis.pipeline()  # MULTI/EXEC so readers never see a new version with an old payload
+        pipe.hincrby(LEADERBOARD_KEY, "version", 1)
+        pipe.hset(LEADERBOARD_KEY, "payload", body)
+        version, _ = pipe.execute()
+        return {"version": version, "payload": body}
+    except Exception as e:
+        print(f"Error publishing leaderboard to Redis, keeping it in-process: {e}")
+        version = (_local_snapshot or {}).get("version", 0) + 1
+        _local_snapshot = {"version": version, "payload": body, "expires": time.monotonic() + LOCAL_SNAPSHOT_TTL}
+        return {"version": version, "payload": body}
+
+
+def load_leaderboard_version(redis=None):
+    redis = redis or _redis()
+    try:
+        version = redis.hget(LEADERBOARD_KEY, "version")
+        return int(version) if version is not None else None
+    except Exception:
+        return (_load_local() or {}).get("version")
+
+
+def load_leaderboard(redis=None):
+    """Latest snapshot as {"version": int, "payload": json_str}, or None if nothing was published."""
+    redis = redis or _redis()
+    try:
+        version, body = redis.hmget(LEADERBOARD_KEY, ["version", "payload"])
+        if version is None or body is None:
+            return None
+        return {"version": int(version), "payload": body.decode() if isinstance(body, bytes) else body}
+    except Exception:
+        return _load_local()
+
+
+async def aload_leaderboard_version():
+    """load_leaderboard_version for async handlers (no threadpool hop)."""
+    try:
+        from redis_client import get_async_redis
+        version = await get_async_redis().hget(LEADERBOARD_KEY, "version")
+        return int(version) if version is not None else None
+    except Exception:
+        return (_load_local() or {}).get("version")
+
+
+async def aload_leaderboard():
+    """load_leaderboard for async handlers (no threadpool hop)."""
+    try:
+        from redis_client import get_async_redis
+        version, body = await get_async_redis().hmget(LEADERBOARD_KEY, ["version", "payload"])
+        if version is None or body is None:
+            return None
+        return {"version": int(version), "payload": body.decode() if isinstance(body, bytes) else body}
+    except Exception:
+        return _load_local()
+
+
+def _load_local():
+    if _local_snapshot is None or _local_snapshot["expires"] < time.monotonic():
+        return None
+    return _local_snapshot
+
+
+def leaderboard_query():
+    """Active agents with their positions and metrics, as a select() for sync or async sessions."""
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+    return select(models.Agent).where(models.Agent.status == "active").options(
+        selectinload(models.Agent.positions), selectinload(models.Agent.metrics)
+    )
+
+
+def refresh_leaderboard(db, prices=None):
+    """Rebuilds the leaderboard from the database and publishes it. Returns the new snapshot."""
+    agents = db.execute(leaderboard_query()).scalars().all()
+    return publish_agents(agents, prices)
+
+
+def publish_agents(agents, prices=None):
+    """Builds and publishes the leaderboard for already loaded agents, plus delta events. Returns the snapshot."""
+    prices = dict(prices or {})
+    spx_price = prices.get("SPY")
+    if spx_price is None:
+        from market_data import get_gateway
+        spx_price = get_gateway().get_price("SPY") or 500.0
+        prices["SPY"] = spx_price
+
+    payload = build_leaderboard(agents, spx_price, prices)
+    previous = load_leaderboard()
+    snapshot = publish_leaderboard(payload)
+    events.publish_events(events.leaderboard_deltas(json.loads(previous["payload"]) if previous else None, payload))
+    return snapshot
+
+
+def etag_for(version):
+    return f'"leaderboard-{version}"'
@@ -1,16 +1,22 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
-from pydantic import BaseModel
+import datetime
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, ConfigDict, computed_field
 import models
-from database import engine, get_db
+from database import engine, get_db, get_async_db
 
 from fastapi.middleware.cors import CORSMiddleware
 
 # models.Base.metadata.create_all(bind=engine) # Moved to prevent startup crashes
 
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 import os
 
 class DNA(BaseModel):
@@ -23,18 +29,59 @@ class AgentCreate(BaseModel):
     name: str
     dna: DNA
 
+class PositionResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    symbol: str
+    qty: float
+    avg_price: float
+
 class AgentResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     name: str
     dna: DNA
     status: str
     generation: int
     current_cash: float
-    current_positions: Optional[dict] = {}
-    class Config:
-        orm_mode = True
+    positions: List[PositionResponse] = []
+
+    @computed_field
+    @property
+    def current_positions(self) -> dict:
+        # The pre-positions-table shape { "AAPL": 10, "AAPL_avg_price": 150.0 }, for existing clients
+        from positions import legacy_positions
+        return legacy_positions(self.positions)
+
+class TradeResponse(BaseModel):
+    id: int
+    agent_id: int
+    symbol: str
+    side: str
+    qty: float
+    price: float
+    timestamp: Optional[str]
+
+class TradePage(BaseModel):
+    trades: List[TradeResponse]
+    next_cursor: Optional[str]
+
+def migrate_positions():
+    # Legacy current_positions JSON into the positions table; a no-op once migrated
+    from database import SessionLocal
+    from positions import migrate_legacy_positions
+    try:
+        migrate_legacy_positions(SessionLocal)
+    except Exception as e:
+        print(f"Position migration failed: {e}")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    await run_in_threadpool(migrate_positions)
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -58,76 +105,175 @@ def create_agent(agent: AgentCreate, db: Session = Depends(get_db)):
     return db_agent
 
 @app.get("/api/agents/", response_model=List[AgentResponse])
-def read_agents(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    agents = db.query(models.Agent).offset(skip).limit(limit).all()
-    return agents
+async def read_agents(skip: int = 0, limit: int = 20, after_id: Optional[int] = None,
+                      db: AsyncSession = Depends(get_async_db)):
+    # after_id (the last id of the previous page) seeks on the primary key instead of OFFSET
+    query = select(models.Agent).options(selectinload(models.Agent.positions)).order_by(models.Agent.id)
+    if after_id is not None:
+        query = query.where(models.Agent.id > after_id)
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query.limit(limit))
+    return result.scalars().all()
 
 @app.get("/api/agents/{agent_id}", response_model=AgentResponse)
-def read_agent(agent_id: int, db: Session = Depends(get_db)):
-    db_agent = db.query(models.Agent).filter(models.Agent.id == agent_id).first()
+async def read_agent(agent_id: int, db: AsyncSession = Depends(get_async_db)):
+    db_agent = await db.get(models.Agent, agent_id, options=[selectinload(models.Agent.positions)])
     if db_agent is None:
         raise HTTPException(status_code=404, detail="Agent not found")
     return db_agent
 
+@app.get("/api/agents/{agent_id}/equity")
+def read_agent_equity(agent_id: int, interval: str = "hour", limit: int = 500, db: Session = Depends(get_db)):
+    from timescale import INTERVALS, equity_curve
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {sorted(INTERVALS)}")
+    return equity_curve(db, agent_id, interval=interval, limit=min(limit, 5000))
+
+@app.get("/api/agents/{agent_id}/metrics")
+async def read_agent_metrics(agent_id: int, db: AsyncSession = Depends(get_async_db)):
+    from performance import summarize
+    if await db.get(models.Agent, agent_id) is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return {"agent_id": agent_id, **summarize(await db.get(models.AgentMetrics, agent_id))}
+
+@app.get("/api/agents/{agent_id}/trades", response_model=TradePage)
+async def read_agent_trades(agent_id: int, limit: int = 100, cursor: Optional[str] = None, order: str = "desc",
+                            db: AsyncSession = Depends(get_async_db)):
+    import trade_history
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    if await db.get(models.Agent, agent_id) is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    try:
+        return await trade_history.read_page(db, agent_id, limit=limit, cursor=cursor, descending=order == "desc")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/trades/export")
+def export_trades(format: str = "ndjson", agent_id: Optional[int] = None, symbol: Optional[str] = None,
+                  start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+                  cursor: Optional[str] = None):
+    """Every matching trade in (timestamp, id) order, streamed from a server-side cursor."""
+    import trade_history
+    if format not in trade_history.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(trade_history.EXPORT_FORMATS)}")
+    try:
+        stmt = trade_history.export_query(agent_id=agent_id, symbol=symbol, start=start, end=end, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    body, media_type = trade_history.export_stream(stmt, format)
+    extension = {"ndjson": "ndjson", "arrow": "arrows", "parquet": "parquet"}[format]
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="trades.{extension}"'},
+    )
+
+@app.get("/api/bars/{symbol}")
+def read_bars(symbol: str, timeframe: str = "1Day", start: Optional[datetime.datetime] = None,
+              end: Optional[datetime.datetime] = None, limit: int = 500):
+    """Chart history from the local bar store (no broker round trip), as column arrays."""
+    import numpy as np
+    from bar_store import PRICE_COLUMNS, get_bar_store
+    bars = get_bar_store().read(symbol.upper(), timeframe, start=start, end=end, limit=min(limit, 5000))
+    if bars is None:
+        raise HTTPException(status_code=404, detail="No stored bars for this symbol")
+    body = {"symbol": symbol.upper(), "timeframe": timeframe}
+    body["timestamp"] = [str(t) + "Z" for t in bars.timestamp]
+    for name in PRICE_COLUMNS:
+        values = getattr(bars, name)
+        body[name] = np.where(np.isnan(values), None, values).tolist()
+    return body
+
 @app.post("/api/simulate/evolve")
 def trigger_evolution():
+    import scheduler
     from worker import evolve_agents
-    evolve_agents.delay()
-    return {"message": "Evolution task queued"}
+    # Coalesced: while a run is pending, further triggers join it
+    if scheduler.trigger(evolve_agents):
+        return {"message": "Evolution task queued", "queued": True}
+    return {"message": "Evolution already pending", "queued": False}
 
 @app.post("/api/simulate/cycle")
 def trigger_cycle():
+    import scheduler
     from worker import run_market_cycle
-    run_market_cycle.delay()
-    return {"message": "Market cycle task queued"}
+    if scheduler.trigger(run_market_cycle):
+        return {"message": "Market cycle task queued", "queued": True}
+    return {"message": "Market cycle already pending", "queued": False}
+
+@app.get("/api/simulate/status")
+def simulation_status():
+    """Cycle lock, pending runs, last queue lag and skip counts."""
+    import scheduler
+    return scheduler.status()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    import metrics
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 @app.get("/api/dashboard/stats")
-def get_dashboard_stats(db: Session = Depends(get_db)):
-    from alpaca_client import AlpacaClient
-    alpaca = AlpacaClient()
-    
-    spx_price = alpaca.get_latest_price("SPY") or 500.0
-    agents = db.query(models.Agent).all()
-    
-    total_pnl_usd = 0.0
-    agent_stats = []
-    
-    for a in agents:
-        pnl_usd = a.current_cash - 100000.0
-        total_pnl_usd += pnl_usd
-        
-        formatted_positions = []
-        if a.current_positions:
-            for symbol, qty in a.current_positions.items():
-                if not symbol.endswith("_avg_price"):
-                    avg_price = a.current_positions.get(f"{symbol}_avg_price", 0)
-                    formatted_positions.append({
-                        "symbol": symbol,
-                        "qty": round(qty, 2),
-                        "entry": round(avg_price, 2),
-                        "pnl_pct": round(random.uniform(-2, 5), 1)
-                    })
-
-        agent_stats.append({
-            "id": a.id,
-            "name": a.name,
-            "status": a.status,
-            "pnl_usd": round(pnl_usd, 2),
-            "pnl_spx": round(pnl_usd / spx_price, 3),
-            "balance_usd": round(a.current_cash, 2),
-            "balance_spx": round(a.current_cash / spx_price, 2),
-            "positions": formatted_positions[:4],
-            "generation": a.generation
-        })
-    
-    agent_stats.sort(key=lambda x: x['pnl_usd'], reverse=True)
-    
-    return {
-        "spx_price": round(spx_price, 2),
-        "total_pnl_usd": round(total_pnl_usd, 2),
-        "total_pnl_spx": round(total_pnl_usd / spx_price, 2),
-        "agents": agent_stats
-    }
+async def get_dashboard_stats(request: Request, db: AsyncSession = Depends(get_async_db)):
+    import leaderboard
+
+    # Cheap path: the client already has the current snapshot
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        version = await leaderboard.aload_leaderboard_version()
+        if version is not None and if_none_match == leaderboard.etag_for(version):
+            return Response(status_code=304, headers={"ETag": if_none_match})
+
+    snapshot = await leaderboard.aload_leaderboard()
+    if snapshot is None:
+        # Nothing published yet (no cycle has run): build it once here and serve what was built,
+        # even when it cannot be read back (Redis down and the in-process copy expired)
+        agents = (await db.execute(leaderboard.leaderboard_query())).scalars().all()
+        snapshot = await run_in_threadpool(leaderboard.publish_agents, agents)
+
+    return Response(
+        content=snapshot["payload"],
+        media_type="application/json",
+        headers={"ETag": leaderboard.etag_for(snapshot["version"]), "Cache-Control": "no-cache"},
+    )
+
+_broadcaster = None
+
+@app.get("/api/stream")
+async def stream_events(request: Request):
+    """
+    Server-sent events: one 'snapshot' with the full leaderboard, then only deltas
+    ('summary', 'agent', 'agent_removed', 'trades', 'evolution') as workers publish them.
+    """
+    import events
+    import leaderboard
+    from redis_client import get_redis_url
+
+    global _broadcaster
+    if _broadcaster is None:
+        _broadcaster = events.EventBroadcaster(get_redis_url())
+    queue = _broadcaster.subscribe()
+
+    async def event_stream():
+        try:
+            snapshot = await leaderboard.aload_leaderboard()
+            if snapshot:
+                yield events.format_sse("snapshot", snapshot["payload"])
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            _broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # Serve Frontend
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend", "out")
@@ -0,0 +1,232 @@
+"""
+Shared market data gateway.
+
+One place for the API and the workers to get quotes:
+- multi-symbol snapshots in a single request over a pooled HTTP session
+- the broker's request-rate budget enforced across processes (Redis) or locally
+- a short-TTL quote cache, in-process plus Redis
+- a local mock backend for offline use (MARKET_DATA_BACKEND=mock)
+
+    from market_data import get_gateway
+    prices = get_gateway().get_prices(["AAPL", "SPY"])
+"""
+import os
+import random
+import threading
+import time
+
+DEFAULT_DATA_URL = "https://data.alpaca.markets"
+SNAPSHOT_CHUNK_SIZE = 200  # symbols per snapshot request
+QUOTE_KEY = "arena:quote:{}"
+RATE_KEY = "arena:ratelimit:{}"
+
+
+class RateLimiter:
+    """
+    Requests-per-minute budget. Uses a shared fixed-window counter in Redis when
+    available so every process draws from the same budget, else a local token bucket.
+    """
+
+    def __init__(self, per_minute, redis=None):
+        self.per_minute = per_minute
+        self.redis = redis
+        self._lock = threading.Lock()
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        if self.redis is not None:
+            try:
+                return self._acquire_shared()
+            except Exception as e:
+                print(f"Shared rate limiter unavailable, using local budget: {e}")
+                self.redis = None
+        self._acquire_local()
+
+    def _acquire_shared(self):
+        while True:
+            now = time.time()
+            window = int(now // 60)
+            key = RATE_KEY.format(window)
+            pipe = self.redis.pipeline()
+            pipe.incr(key)
+            pipe.expire(key, 120)
+            count, _ = pipe.execute()
+            if count <= self.per_minute:
+                return
+            time.sleep((window + 1) * 60 - now)
+
+    def _acquire_local(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.per_minute, self._tokens + (now - self._updated) * self.per_minute / 60.0)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) * 60.0 / self.per_minute
+            time.sleep(wait)
+
+
+class QuoteCache:
+    """Short-TTL price cache: in-process dict in front of Redis (shared by API and workers)."""
+
+    def __init__(self, ttl, redis=None):
+        self.ttl = ttl
+        self.redis = redis
+        self._local = {}  # symbol -> (price, expires_at)
+
+    def get_many(self, symbols):
+        now = time.monotonic()
+        found = {}
+        for symbol in symbols:
+            entry = self._local.get(symbol)
+            if entry and entry[1] > now:
+                found[symbol] = entry[0]
+
+        missing = [s for s in symbols if s not in found]
+        if missing and self.redis is not None:
+            try:
+                for symbol, raw in zip(missing, self.redis.mget([QUOTE_KEY.format(s) for s in missing])):
+                    if raw is not None:
+                        found[symbol] = float(raw)
+                        self._local[symbol] = (float(raw), now + self.ttl)
+            except Exception as e:
+                print(f"Error reading quote cache from Redis: {e}")
+        return found
+
+    def set_many(self, prices):
+        expires = time.monotonic() + self.ttl
+        for symbol, price in prices.items():
+            self._local[symbol] = (price, expires)
+        if prices and self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                for symbol, price in prices.items():
+                    pipe.set(QUOTE_KEY.format(symbol), price, px=int(self.ttl * 1000))
+                pipe.execute()
+            except Exception as e:
+                print(f"Error writing quote cache to Redis: {e}")
+
+
+class AlpacaSnapshotBackend:
+    """Latest trade prices from Alpaca's multi-symbol snapshots endpoint over a pooled session."""
+
+    def __init__(self, api_key, secret_key, data_url=None, feed=None, pool_size=10):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.data_url = (data_url or os.getenv("ALPACA_DATA_URL", DEFAULT_DATA_URL)).rstrip("/")
+        self.feed = feed or os.getenv("ALPACA_DATA_FEED", "iex")
+        self.session = requests.Session()
+        self.session.headers.update({
+            "APCA-API-KEY-ID": api_key,
+            "APCA-API-SECRET-KEY": secret_key,
+        })
+        retry = Retry(total=2, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def fetch(self, symbols, acquire=None):
+        prices = {}
+        for start in range(0, len(symbols), SNAPSHOT_CHUNK_SIZE):
+            chunk = symbols[start:start + SNAPSHOT_CHUNK_SIZE]
+            if acquire:
+                acquire()
+            response = self.session.get(
+                f"{self.data_url}/v2/stocks/snapshots",
+                params={"symbols": ",".join(chunk), "feed": self.feed},
+                timeout=5,
+            )
+            response.raise_for_status()
+            for symbol, snapshot in response.json().items():
+                trade = (snapshot or {}).get("latestTrade") or {}
+                if trade.get("p"):
+                    prices[symbol] = float(trade["p"])
+        return prices
+
+
+class MockBackend:
+    """Offline backend: a bounded random walk per symbol, reproducible with a seed."""
+
+    def __init__(self, seed=None, start_price=150.0, volatility=0.002):
+        self.rng = random.Random(seed)
+        self.start_price = start_price
+        self.volatility = volatility
+        self.prices = {}
+        self.requests = 0
+
+    def fetch(self, symbols, acquire=None):
+        if acquire:
+            acquire()
+        self.requests += 1
+        for symbol in symbols:
+            price = self.prices.get(symbol, self.start_price)
+            self.prices[symbol] = round(max(1.0, price * (1 + self.rng.gauss(0, self.volatility))), 2)
+        return {s: self.prices[s] for s in symbols}
+
+
+class MarketDataGateway:
+    def __init__(self, backend, cache, rate_limiter=None):
+        self.backend = backend
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+
+    def get_prices(self, symbols):
+        """{symbol: price} for every symbol that could be priced; cache hits skip the network."""
+        symbols = list(dict.fromkeys(symbols))
+        prices = self.cache.get_many(symbols)
+        missing = [s for s in symbols if s not in prices]
+        if missing:
+            acquire = self.rate_limiter.acquire if self.rate_limiter else None
+            try:
+                fetched = self.backend.fetch(missing, acquire=acquire)
+            except Exception as e:
+                print(f"Error fetching snapshots for {len(missing)} symbols: {e}")
+                fetched = {}
+            self.cache.set_many(fetched)
+            prices.update(fetched)
+        return prices
+
+    def get_price(self, symbol):
+        return self.get_prices([symbol]).get(symbol)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def build_gateway(backend_name=None, redis=None):
+    api_key = os.getenv("ALPACA_API_KEY")
+    secret_key = os.getenv("ALPACA_SECRET_KEY")
+    backend_name = backend_name or os.getenv("MARKET_DATA_BACKEND") or ("alpaca" if api_key and secret_key else "mock")
+
+    if backend_name == "alpaca":
+        backend = AlpacaSnapshotBackend(api_key, secret_key, pool_size=int(os.getenv("MARKET_DATA_POOL_SIZE", "10")))
+    else:
+        backend = MockBackend()
+
+    cache = QuoteCache(float(os.getenv("QUOTE_CACHE_TTL", "2")), redis=redis)
+    rate_limiter = RateLimiter(int(os.getenv("ALPACA_RATE_LIMIT_PER_MIN", "200")), redis=redis)
+    return MarketDataGateway(backend, cache, rate_limiter)
+
+
+def get_gateway():
+    """Process-wide gateway (one pooled session, one local cache) shared by API routes and tasks."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                redis = None
+                try:
+                    from redis_client import get_redis
+                    redis = get_redis()
+                    redis.ping()
+                except Exception as e:
+                    print(f"Redis unavailable for market data cache, using in-process cache only: {e}")
+                    redis = None
+                _gateway = build_gateway(redis=redis)
+    return _gateway
@@ -0,0 +1,186 @@
+"""
+Cycle instrumentation.
+
+Market cycles and evolution runs time each phase (agent load, quote fetch,
+indicators, decision, persistence, commit, publish) into Prometheus
+histograms and count cycles, agents and trades; the tick pipeline records
+tick-to-decision latency and the scheduler queue lag and skipped cycles. The
+API serves them on /metrics and the Celery worker on METRICS_PORT. With
+several worker or API processes, set PROMETHEUS_MULTIPROC_DIR so every
+process's samples are aggregated.
+
+Set PROFILE_SAMPLE_RATE (0-1) to cProfile that fraction of cycles; stats
+are written to PROFILE_DIR and the top entries printed.
+"""
+import contextlib
+import contextvars
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import random
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, start_http_server,
+)
+from prometheus_client import multiprocess
+
+PHASE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CYCLE_SECONDS = Histogram(
+    "arena_cycle_seconds", "Wall time of a whole cycle task.", ["task"], buckets=PHASE_BUCKETS,
+)
+PHASE_SECONDS = Histogram(
+    "arena_cycle_phase_seconds", "Wall time of one phase of a cycle task.", ["task", "phase"], buckets=PHASE_BUCKETS,
+)
+CYCLES = Counter("arena_cycles_total", "Cycle tasks run, by outcome.", ["task", "status"])
+AGENTS_PROCESSED = Counter("arena_agents_processed_total", "Agents evaluated by cycle tasks.", ["task"])
+TRADES = Counter("arena_trades_total", "Trades executed by cycle tasks.", ["task"])
+LAST_CYCLE_AGENTS = Gauge(
+    "arena_last_cycle_agents", "Agents evaluated by the most recent cycle.", ["task"], multiprocess_mode="mostrecent",
+)
+LAST_CYCLE_TRADES = Gauge(
+    "arena_last_cycle_trades", "Trades executed by the most recent cycle.", ["task"], multiprocess_mode="mostrecent",
+)
+TICK_LATENCY_SECONDS = Histogram(
+    "arena_tick_latency_seconds", "Tick receipt to trading decision in the tick pipeline.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+TICKS = Counter("arena_ticks_total", "Price ticks received by the tick pipeline, by outcome.", ["status"])
+CYCLE_QUEUE_LAG = Histogram(
+    "arena_cycle_queue_lag_seconds", "Trigger to start of a scheduled or API-triggered cycle task.", ["task"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+)
+CYCLES_SKIPPED = Counter(
+    "arena_cycles_skipped_total", "Cycle runs not started (coalesced, stale, locked, market_closed, trading_mode).", ["task", "reason"],
+)
+ADVISOR_PROMPTS = Counter(
+    "arena_advisor_prompts_total", "Distinct advisor prompts per cycle, by how they were answered.", ["outcome"],
+)
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+_current = contextvars.ContextVar("arena_cycle", default=None)
+
+
+class CycleTimer:
+    """Phase durations of one running cycle; also recorded into the histograms."""
+
+    def __init__(self, task):
+        self.task = task
+        self.phases = {}
+        self.agents = 0
+        self.trades = 0
+
+    def record(self, agents=0, trades=0):
+        self.agents += agents
+        self.trades += trades
+
+    def summary(self):
+        return ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+
+
+@contextlib.contextmanager
+def cycle(task):
+    """Times a whole cycle task; phases and record() calls inside attach to it."""
+    timer = CycleTimer(task)
+    token = _current.set(timer)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        with _maybe_profile(task):
+            yield timer
+        status = "ok"
+    finally:
+        _current.reset(token)
+        CYCLE_SECONDS.labels(task).observe(time.perf_counter() - start)
+        for name, seconds in timer.phases.items():
+            PHASE_SECONDS.labels(task, name).observe(seconds)
+        CYCLES.labels(task, status).inc()
+        AGENTS_PROCESSED.labels(task).inc(timer.agents)
+        TRADES.labels(task).inc(timer.trades)
+        if status == "ok":
+            LAST_CYCLE_AGENTS.labels(task).set(timer.agents)
+            LAST_CYCLE_TRADES.labels(task).set(timer.trades)
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Times one phase of the current cycle. Repeated phases add up and are observed
+    once when the cycle ends; outside a cycle they are recorded under task 'adhoc'.
+    """
+    timer = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if timer is None:
+            PHASE_SECONDS.labels("adhoc", name).observe(elapsed)
+        else:
+            timer.phases[name] = timer.phases.get(name, 0.0) + elapsed
+
+
+def record(agents=0, trades=0):
+    """Adds agents evaluated / trades executed to the current cycle."""
+    timer = _current.get()
+    if timer is not None:
+        timer.record(agents, trades)
+
+
+@contextlib.contextmanager
+def _maybe_profile(task):
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+            path = os.path.join(PROFILE_DIR, f"{task}-{stamp}-{os.getpid()}.prof")
+            profiler.dump_stats(path)
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(15)
+            print(f"Profiled {task} cycle, stats in {path}\n{out.getvalue()}")
+        except Exception as e:
+            print(f"Error saving cycle profile: {e}")
+
+
+def _registry():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    from prometheus_client import REGISTRY
+    return REGISTRY
+
+
+def render():
+    """(body, content_type) of the Prometheus text exposition for this process (or all, in multiprocess mode)."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Drops a finished process's live gauges in multiprocess mode."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+
+def start_metrics_server(port=None):
+    """Serves /metrics over HTTP from a background thread (used by the Celery worker)."""
+    port = int(port or os.getenv("METRICS_PORT", "9100"))
+    try:
+        start_http_server(port, registry=_registry())
+        print(f"Serving worker metrics on :{port}/metrics")
+    except OSError as e:
+        print(f"Could not start metrics server on :{port}: {e}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -14,15 +14,38 @@ class Agent(Base):
     
     # Portfolio State
     current_cash = Column(Float, default=100000.0)
-    current_positions = Column(JSON, default={}) # { "AAPL": 10, "AAPL_avg_price": 150.0 }
+    # Legacy blob { "AAPL": 10, "AAPL_avg_price": 150.0 }; superseded by the positions
+    # table (positions.migrate_json_positions copies it over and leaves NULL)
+    current_positions = Column(JSON)
 
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     
     trades = relationship("Trade", back_populates="agent")
     snapshots = relationship("PortfolioSnapshot", back_populates="agent")
+    positions = relationship("Position", back_populates="agent", cascade="all, delete-orphan")
+    metrics = relationship("AgentMetrics", back_populates="agent", uselist=False, cascade="all, delete-orphan")
+
+class Position(Base):
+    __tablename__ = "positions"
+
+    agent_id = Column(Integer, ForeignKey("agents.id"), primary_key=True)
+    symbol = Column(String, primary_key=True, index=True)
+    qty = Column(Float, nullable=False, default=0.0)
+    avg_price = Column(Float, nullable=False)  # average cost of the open lots
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    agent = relationship("Agent", back_populates="positions")
 
 class Trade(Base):
     __tablename__ = "trades"
+    # Keyset pagination on (timestamp, id), per agent and across all agents; on
+    # Postgres the remaining columns are INCLUDEd so pages are index-only scans
+    __table_args__ = (
+        Index("ix_trades_agent_timestamp_id", "agent_id", "timestamp", "id",
+              postgresql_include=["symbol", "side", "qty", "price"]),
+        Index("ix_trades_timestamp_id", "timestamp", "id",
+              postgresql_include=["agent_id", "symbol", "side", "qty", "price"]),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     agent_id = Column(Integer, ForeignKey("agents.id"))
@@ -36,12 +59,37 @@ class Trade(Base):
 
 class PortfolioSnapshot(Base):
     __tablename__ = "portfolio_snapshots"
+    # TimescaleDB hypertable partitioned on timestamp (see timescale.py); the
+    # partition column has to be part of the primary key.
+    __table_args__ = (
+        Index("ix_portfolio_snapshots_agent_timestamp", "agent_id", "timestamp"),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    agent_id = Column(Integer, ForeignKey("agents.id"))
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    agent_id = Column(Integer, ForeignKey("agents.id"), primary_key=True)
+    timestamp = Column(DateTime, primary_key=True, default=datetime.datetime.utcnow)
     total_equity = Column(Float)
     cash = Column(Float)
     pnl = Column(Float)
     
     agent = relationship("Agent", back_populates="snapshots")
+
+class AgentMetrics(Base):
+    __tablename__ = "agent_metrics"
+    # Running performance state, folded in every cycle by performance.py
+
+    agent_id = Column(Integer, ForeignKey("agents.id"), primary_key=True)
+    # Welford accumulators over per-snapshot equity returns (Sharpe)
+    returns_count = Column(Integer, nullable=False, default=0)
+    returns_mean = Column(Float, nullable=False, default=0.0)
+    returns_m2 = Column(Float, nullable=False, default=0.0)
+    last_equity = Column(Float)
+    peak_equity = Column(Float)
+    max_drawdown = Column(Float, nullable=False, default=0.0)  # deepest drop below the peak, as a fraction
+    # FIFO lot matching of trades (win rate, realized PnL)
+    realized_pnl = Column(Float, nullable=False, default=0.0)
+    wins = Column(Integer, nullable=False, default=0)
+    losses = Column(Integer, nullable=False, default=0)
+    open_lots = Column(JSON, default={})  # { "AAPL": [[qty, price], ...] } oldest first
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    agent = relationship("Agent", back_populates="metrics")
@@ -0,0 +1,267 @@
+"""
+Order netting.
+
+At the end of a cycle every agent's BUY/SELL intents are summed per symbol.
+Opposing intents cross internally at the cycle's reference price and only the
+net remainder goes to the broker, as one market order per symbol. The broker's
+fill is then allocated back to the intents on the net side pro rata (whole
+shares, largest remainder), so each agent's Trade row carries its allocated
+quantity and blended price, and the population's cash and positions are
+corrected to match. All of a cycle's orders are submitted before any fill
+is awaited, so broker round trips overlap instead of adding up per symbol.
+Sharded cycles net the intents of every shard together (see
+worker.route_market_cycle) and hand each shard its allocations.
+
+Routing is off unless ORDER_ROUTING is set:
+    ORDER_ROUTING=simulated   local SimulatedBroker (ORDER_SLIPPAGE_BPS, ORDER_FILL_RATIO)
+    ORDER_ROUTING=alpaca      market orders on the paper account through AlpacaClient
+"""
+import collections
+import itertools
+import os
+import random
+import time
+
+import numpy as np
+
+NetOrder = collections.namedtuple("NetOrder", ["symbol", "side", "qty", "buy_qty", "sell_qty", "reference_price"])
+Fill = collections.namedtuple("Fill", ["order_id", "symbol", "side", "qty", "price"])
+
+TERMINAL_ORDER_STATUSES = {"filled", "canceled", "expired", "rejected", "done_for_day"}
+
+
+def net_order(symbol, intents):
+    """NetOrder for one symbol's intents; side is None when buys and sells cancel out."""
+    buy_qty = sum(t["qty"] for t in intents if t["side"] == "BUY")
+    sell_qty = sum(t["qty"] for t in intents if t["side"] == "SELL")
+    total = buy_qty + sell_qty
+    reference = sum(t["qty"] * t["price"] for t in intents) / total if total else intents[0]["price"]
+    net = buy_qty - sell_qty
+    side = "BUY" if net > 0 else "SELL" if net < 0 else None
+    return NetOrder(symbol, side, abs(net), buy_qty, sell_qty, reference)
+
+
+def allocate_pro_rata(total, requested):
+    """Splits `total` whole shares across `requested` in proportion (largest remainder), never above a request."""
+    requested = np.asarray(requested, dtype=np.int64)
+    wanted = int(requested.sum())
+    if total >= wanted:
+        return requested.copy()
+    if total <= 0:
+        return np.zeros_like(requested)
+    exact = requested * (total / wanted)
+    shares = np.floor(exact).astype(np.int64)
+    leftover = total - int(shares.sum())
+    shares[np.argsort(-(exact - shares), kind="stable")[:leftover]] += 1
+    return shares
+
+
+def settle(trades, broker):
+    """
+    Nets trade intents per symbol, submits one order per symbol with a non-zero net
+    and allocates the outcome back. Returns (allocated, orders): `allocated` mirrors
+    `trades` with each intent's filled qty and price (qty 0 when unfilled), `orders`
+    is [(NetOrder, Fill or None)].
+    """
+    allocated = [dict(t) for t in trades]
+    by_symbol = {}
+    for k, t in enumerate(trades):
+        by_symbol.setdefault(t["symbol"], []).append(k)
+
+    net = {symbol: net_order(symbol, [trades[k] for k in indices]) for symbol, indices in by_symbol.items()}
+    try:
+        fills = broker.submit_many([o for o in net.values() if o.side is not None])
+    except Exception as e:
+        print(f"Error routing net orders: {e}")
+        fills = {}
+    orders = []
+    for symbol, indices in by_symbol.items():
+        order = net[symbol]
+        fill = fills.get(symbol)
+        orders.append((order, fill))
+
+        crossed = min(order.buy_qty, order.sell_qty)
+        filled = int(fill.qty) if fill is not None else 0
+        for side in ("BUY", "SELL"):
+            side_indices = [k for k in indices if trades[k]["side"] == side]
+            if not side_indices:
+                continue
+            if side != order.side:
+                # Fully crossed against the other side at the reference price
+                qtys = [trades[k]["qty"] for k in side_indices]
+                price = order.reference_price
+            else:
+                total = crossed + filled
+                qtys = allocate_pro_rata(total, [trades[k]["qty"] for k in side_indices])
+                price = (crossed * order.reference_price + filled * fill.price) / total if filled else order.reference_price
+            for k, qty in zip(side_indices, qtys):
+                allocated[k]["qty"] = int(qty)
+                allocated[k]["price"] = price
+    return allocated, orders
+
+
+def allocation_rows(allocated):
+    """settle()'s allocations as JSON-friendly [agent_id, symbol, qty, price] rows (for shards)."""
+    return [[int(t["agent_id"]), t["symbol"], int(t["qty"]), float(t["price"])] for t in allocated]
+
+
+def allocate_from(trades, rows):
+    """
+    Allocations computed elsewhere (from every shard's intents) for this shard's
+    `trades`, in the shape settle() returns. Intents without a row were never routed
+    and stay unfilled. A filled row without an intent means shares the broker holds
+    for nobody, so it raises ValueError.
+    """
+    by_key = {(agent_id, symbol): (qty, price) for agent_id, symbol, qty, price in rows}
+    allocated = []
+    for t in trades:
+        qty, price = by_key.pop((int(t["agent_id"]), t["symbol"]), (0, t["price"]))
+        allocated.append({**t, "qty": min(int(qty), int(t["qty"])), "price": price})
+    unmatched = [key for key, (qty, _) in by_key.items() if qty]
+    if unmatched:
+        raise ValueError(f"{len(unmatched)} routed allocations have no matching intent, e.g. {unmatched[:3]}")
+    return allocated
+
+
+def apply_allocations(population, intents, allocated):
+    """Corrects the population's cash and positions from the intended fills to the allocated ones."""
+    index = {int(agent_id): i for i, agent_id in enumerate(population.agent_ids)}
+    for intent, fill in zip(intents, allocated):
+        if fill["qty"] == intent["qty"] and fill["price"] == intent["price"]:
+            continue
+        i = index[intent["agent_id"]]
+        j = population.symbol_index[intent["symbol"]]
+        intended = intent["qty"] * intent["price"]
+        actual = fill["qty"] * fill["price"]
+        if intent["side"] == "BUY":
+            population.cash[i] += intended - actual
+            population.qty[i, j] += fill["qty"] - intent["qty"]
+            population.avg_price[i, j] = fill["price"] if population.qty[i, j] else np.nan
+        else:
+            population.cash[i] += actual - intended
+            population.qty[i, j] += intent["qty"] - fill["qty"]
+        population.dirty[i] = True
+        population.dirty_cells[i, j] = True
+
+
+def route(population, trades, broker):
+    """
+    Nets and routes a cycle's trades through `broker`, applies the allocations to the
+    population and returns (filled trades, orders) ready for persist_cycle.
+    """
+    allocated, orders = settle(trades, broker)
+    apply_allocations(population, trades, allocated)
+    return [t for t in allocated if t["qty"] > 0], orders
+
+
+def apply_routed(population, trades, rows):
+    """route() for one shard, from allocation_rows() of the whole cycle. Returns the filled trades."""
+    allocated = allocate_from(trades, rows)
+    apply_allocations(population, trades, allocated)
+    return [t for t in allocated if t["qty"] > 0]
+
+
+class SimulatedBroker:
+    """
+    Local stand-in for the paper account. Market orders fill at the reference price
+    moved against the order by `slippage_bps`, for `fill_ratio` of the quantity
+    (whole shares). Every order is kept in `orders`.
+    """
+
+    def __init__(self, slippage_bps=0.0, fill_ratio=1.0, seed=None):
+        self.slippage_bps = slippage_bps
+        self.fill_ratio = fill_ratio
+        self.rng = random.Random(seed)
+        self.orders = []
+        self._ids = itertools.count(1)
+
+    def submit_many(self, orders):
+        """{symbol: Fill} for NetOrders."""
+        return {o.symbol: self.submit(o.symbol, o.side, o.qty, o.reference_price) for o in orders}
+
+    def submit(self, symbol, side, qty, reference_price):
+        slippage = reference_price * self.slippage_bps / 10000.0
+        price = reference_price + slippage if side == "BUY" else reference_price - slippage
+        filled = int(qty * self.fill_ratio)
+        fill = Fill(f"sim-{next(self._ids)}", symbol, side, filled, price)
+        self.orders.append(fill)
+        return fill
+
+
+class AlpacaBroker:
+    """
+    Market orders on the Alpaca (paper) account. A cycle's orders are all submitted first,
+    then polled together until filled or `timeout` seconds in total, then canceled.
+    """
+
+    def __init__(self, client=None, timeout=10.0, poll_interval=0.25):
+        if client is None:
+            from alpaca_client import AlpacaClient
+            client = AlpacaClient()
+        self.client = client
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    def submit_many(self, orders):
+        """{symbol: Fill} for NetOrders; symbols whose order could not be placed are left out."""
+        api = self.client.api
+        if api is None:
+            print("Error routing orders: Alpaca API credentials not configured")
+            return {}
+
+        placed = {}  # symbol -> (NetOrder, broker order)
+        for o in orders:
+            try:
+                placed[o.symbol] = (o, api.submit_order(
+                    symbol=o.symbol, qty=o.qty, side=o.side.lower(), type="market", time_in_force="day"
+                ))
+            except Exception as e:
+                print(f"Error submitting net {o.side} {o.qty} {o.symbol}: {e}")
+
+        deadline = time.monotonic() + self.timeout
+        open_orders = {s for s, (_, order) in placed.items() if order.status not in TERMINAL_ORDER_STATUSES}
+        while open_orders and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            for symbol in list(open_orders):
+                try:
+                    order = api.get_order(placed[symbol][1].id)
+                except Exception as e:
+                    print(f"Error polling order for {symbol}: {e}")
+                    continue
+                placed[symbol] = (placed[symbol][0], order)
+                if order.status in TERMINAL_ORDER_STATUSES:
+                    open_orders.discard(symbol)
+
+        fills = {}
+        for symbol, (net, order) in placed.items():
+            try:
+                if symbol in open_orders:
+                    # Keep what filled, give up on the rest so the cycle can be settled now
+                    api.cancel_order(order.id)
+                    order = api.get_order(order.id)
+            except Exception as e:
+                print(f"Error canceling order for {symbol}: {e}")
+            filled = int(float(order.filled_qty or 0))
+            price = float(order.filled_avg_price) if order.filled_avg_price else net.reference_price
+            fills[symbol] = Fill(order.id, symbol, net.side, filled, price)
+        return fills
+
+    def submit(self, symbol, side, qty, reference_price):
+        order = NetOrder(symbol, side, qty, 0, 0, reference_price)
+        fill = self.submit_many([order]).get(symbol)
+        if fill is None:
+            raise RuntimeError(f"Order for {symbol} was not placed")
+        return fill
+
+
+def get_broker(client=None):
+    """Broker selected by ORDER_ROUTING, or None to keep fills at the decision price (no routing)."""
+    routing = os.getenv("ORDER_ROUTING", "").lower()
+    if routing == "simulated":
+        return SimulatedBroker(
+            slippage_bps=float(os.getenv("ORDER_SLIPPAGE_BPS", "0")),
+            fill_ratio=float(os.getenv("ORDER_FILL_RATIO", "1")),
+        )
+    if routing == "alpaca":
+        return AlpacaBroker(client)
+    return None
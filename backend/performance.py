@@ -0,0 +1,316 @@
+"""
+Online performance metrics per agent.
+
+Every persisted cycle (and tick pipeline flush) folds its trades and equity
+snapshots into one compact agent_metrics row per agent, so the leaderboard's
+Sharpe ratio, drawdown, win rate and realized PnL stay current without ever
+rescanning the trades or portfolio_snapshots history:
+
+    Sharpe      Welford count / mean / M2 of the returns between consecutive snapshots
+    drawdown    running peak equity and the deepest drop below it
+    win rate    open lots per symbol, matched FIFO by every SELL; a SELL that realizes
+                a gain is a win, one that realizes a loss is a loss
+
+SHARPE_PERIODS_PER_YEAR annualizes the per-snapshot Sharpe (default 1: not annualized).
+
+    python performance.py   # rebuild every agent's state once from the stored history
+"""
+import datetime
+import itertools
+import json
+import math
+import os
+
+import numpy as np
+from sqlalchemy import delete, select, text
+
+import models
+from positions import Lot, Position, PositionBook, _dialect_insert
+
+SHARPE_PERIODS_PER_YEAR = float(os.getenv("SHARPE_PERIODS_PER_YEAR", "1"))
+STATE_COLUMNS = (
+    "returns_count", "returns_mean", "returns_m2", "last_equity", "peak_equity",
+    "max_drawdown", "realized_pnl", "wins", "losses",
+)
+PNL_EPSILON = 1e-6  # realized PnL closer to zero than this is a scratch trade, neither win nor loss
+REBUILD_BATCH_SIZE = 10000
+LOTS_QUERY_CHUNK = 5000
+
+
+class Accumulator:
+    """
+    Metrics state for a set of agents: one array per agent_metrics column plus each
+    agent's open lots as a PositionBook.
+
+        acc = Accumulator.load(db, agent_ids)
+        acc.add_trades(trades)              # trade dicts, in execution order
+        acc.add_equity(agent_ids, equity)   # at most one observation per agent per call
+        acc.save(db)
+    """
+
+    def __init__(self, agent_ids):
+        self.agent_ids = np.unique(np.asarray(list(agent_ids), dtype=np.int64))
+        self.index = {a: k for k, a in enumerate(self.agent_ids.tolist())}
+        n = len(self.agent_ids)
+        self.returns_count = np.zeros(n, dtype=np.int64)
+        self.returns_mean = np.zeros(n)
+        self.returns_m2 = np.zeros(n)
+        self.last_equity = np.full(n, np.nan)
+        self.peak_equity = np.full(n, np.nan)
+        self.max_drawdown = np.zeros(n)
+        self.realized_pnl = np.zeros(n)
+        self.wins = np.zeros(n, dtype=np.int64)
+        self.losses = np.zeros(n, dtype=np.int64)
+        self.lots = {}  # agent_id -> PositionBook of open lots
+        self.lots_changed = set()
+
+    @classmethod
+    def load(cls, db, agent_ids, lots_for=None):
+        """
+        State of `agent_ids` from agent_metrics, with the open lots of the agents in
+        `lots_for` (default all; only these may then be given trades). Agents without a
+        row yet start from their stored positions as opening lots.
+        """
+        acc = cls(agent_ids)
+        if not len(acc.agent_ids):
+            return acc
+        table = models.AgentMetrics
+        rows = db.query(
+            table.agent_id, *[getattr(table, c) for c in STATE_COLUMNS]
+        ).filter(table.agent_id.between(int(acc.agent_ids[0]), int(acc.agent_ids[-1]))).all()
+
+        stored = set()
+        if rows:
+            columns = list(zip(*rows))
+            ids = np.asarray(columns[0], dtype=np.int64)
+            k = np.searchsorted(acc.agent_ids, ids)
+            found = acc.agent_ids[np.minimum(k, len(acc.agent_ids) - 1)] == ids
+            k = k[found]
+            for name, values in zip(STATE_COLUMNS, columns[1:]):
+                values = np.array([np.nan if v is None else v for v in values], dtype=np.float64)[found]
+                getattr(acc, name)[k] = values
+            stored.update(ids[found].tolist())
+
+        wanted = sorted(stored if lots_for is None else stored & set(lots_for))
+        for start in range(0, len(wanted), LOTS_QUERY_CHUNK):
+            chunk = wanted[start:start + LOTS_QUERY_CHUNK]
+            for agent_id, lots in db.query(table.agent_id, table.open_lots).filter(table.agent_id.in_(chunk)):
+                if lots:
+                    acc.lots[agent_id] = PositionBook(
+                        Position(symbol, [Lot(q, p) for q, p in symbol_lots]) for symbol, symbol_lots in lots.items()
+                    )
+
+        new = sorted(acc.index.keys() - stored)
+        if new:
+            positions = db.query(
+                models.Position.agent_id, models.Position.symbol, models.Position.qty, models.Position.avg_price
+            ).filter(models.Position.agent_id.between(new[0], new[-1]))
+            by_agent = {}
+            new = set(new)
+            for p in positions:
+                if p.agent_id in new:
+                    by_agent.setdefault(p.agent_id, []).append(p)
+            for agent_id, agent_positions in by_agent.items():
+                acc.lots[agent_id] = PositionBook.from_rows(agent_positions)
+                acc.lots_changed.add(agent_id)
+        return acc
+
+    def add_trades(self, trades):
+        """Matches trades FIFO against the open lots, realizing PnL on every SELL."""
+        for t in trades:
+            k = self.index.get(t["agent_id"])
+            if k is None:
+                continue
+            book = self.lots.get(t["agent_id"])
+            if book is None:
+                book = self.lots[t["agent_id"]] = PositionBook()
+            self.lots_changed.add(t["agent_id"])
+            if t["side"] == "BUY":
+                book.buy(t["symbol"], t["qty"], t["price"])
+                continue
+
+            # Shares sold beyond the known lots have no cost basis and realize nothing
+            matched = min(t["qty"], book.qty(t["symbol"]))
+            pnl = matched * t["price"] - book.sell(t["symbol"], matched) if matched > 0 else 0.0
+            self.realized_pnl[k] += pnl
+            if pnl > PNL_EPSILON:
+                self.wins[k] += 1
+            elif pnl < -PNL_EPSILON:
+                self.losses[k] += 1
+
+    def add_equity(self, agent_ids, equity):
+        """Folds in one equity observation per agent: a return since the last one, the peak and drawdown."""
+        ids = np.asarray(agent_ids, dtype=np.int64)
+        equity = np.asarray(equity, dtype=np.float64)
+        if not len(ids) or not len(self.agent_ids):
+            return
+        k = np.searchsorted(self.agent_ids, ids)
+        known = self.agent_ids[np.minimum(k, len(self.agent_ids) - 1)] == ids
+        k, equity = k[known], equity[known]
+
+        last = self.last_equity[k]
+        has_return = last > 0  # False for the first observation (NaN)
+        kr = k[has_return]
+        r = equity[has_return] / last[has_return] - 1.0
+        count = self.returns_count[kr] + 1
+        delta = r - self.returns_mean[kr]
+        mean = self.returns_mean[kr] + delta / count
+        self.returns_m2[kr] += delta * (r - mean)
+        self.returns_mean[kr] = mean
+        self.returns_count[kr] = count
+
+        self.last_equity[k] = equity
+        peak = np.fmax(self.peak_equity[k], equity)
+        self.peak_equity[k] = peak
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drawdown = np.where(peak > 0, (peak - equity) / peak, 0.0)
+        self.max_drawdown[k] = np.maximum(self.max_drawdown[k], drawdown)
+
+    def _rows(self, positions):
+        now = datetime.datetime.utcnow()
+        values = {
+            name: [None if v != v else v for v in getattr(self, name)[positions].tolist()]  # NaN -> NULL
+            for name in STATE_COLUMNS
+        }
+        agent_ids = self.agent_ids[positions].tolist()
+        return [
+            {"agent_id": agent_id, **{name: values[name][r] for name in STATE_COLUMNS}, "updated_at": now}
+            for r, agent_id in enumerate(agent_ids)
+        ]
+
+    def save(self, db):
+        """Upserts every agent's row, rewriting open lots only where they changed. Returns rows written."""
+        if not len(self.agent_ids):
+            return 0
+        changed = np.array([a in self.lots_changed for a in self.agent_ids.tolist()], dtype=bool)
+
+        lot_rows = self._rows(np.flatnonzero(changed))
+        for row in lot_rows:
+            book = self.lots.get(row["agent_id"])
+            row["open_lots"] = {
+                p.symbol: [[lot.qty, lot.price] for lot in p.lots] for p in book
+            } if book else {}
+        _upsert(db, lot_rows, STATE_COLUMNS + ("open_lots", "updated_at"))
+        _upsert(db, self._rows(np.flatnonzero(~changed)), STATE_COLUMNS + ("updated_at",))
+        return len(self.agent_ids)
+
+
+def _upsert(db, rows, columns):
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_upsert(db, rows, columns)
+        return
+    stmt = _dialect_insert(db)(models.AgentMetrics)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["agent_id"], set_={c: stmt.excluded[c] for c in columns}
+    )
+    db.execute(stmt, rows)
+
+
+def _copy_upsert(db, rows, columns):
+    """COPY into a session temp table, then one INSERT ... ON CONFLICT from it."""
+    from persistence import _copy_rows
+
+    table = models.AgentMetrics.__tablename__
+    stage = f"{table}_stage"
+    db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    ))
+    if "open_lots" in columns:
+        rows = [{**r, "open_lots": json.dumps(r["open_lots"])} for r in rows]
+    names = ("agent_id",) + tuple(columns)
+    _copy_rows(db, stage, names, rows)
+    listed = ", ".join(names)
+    db.execute(text(
+        f"INSERT INTO {table} ({listed}) SELECT {listed} FROM {stage} "
+        f"ON CONFLICT (agent_id) DO UPDATE SET {', '.join(f'{c} = EXCLUDED.{c}' for c in columns)}"
+    ))
+    db.execute(text(f"TRUNCATE {stage}"))
+
+
+def update(db, trades=(), snapshots=()):
+    """
+    Folds one write's trade dicts and snapshot rows (persistence.snapshot_rows) into
+    agent_metrics, inside the caller's transaction. Call it before that write's positions
+    are upserted: agents new to agent_metrics take their opening lots from the stored
+    positions. Returns the number of rows written.
+    """
+    latest = {r["agent_id"]: r["total_equity"] for r in snapshots}
+    traded = {t["agent_id"] for t in trades}
+    agent_ids = traded | latest.keys()
+    if not agent_ids:
+        return 0
+    acc = Accumulator.load(db, agent_ids, lots_for=traded)
+    acc.add_trades(trades)
+    if latest:
+        acc.add_equity(list(latest.keys()), list(latest.values()))
+    return acc.save(db)
+
+
+def summarize(m, periods_per_year=None):
+    """Leaderboard figures from an agent_metrics row (None when the agent has none yet)."""
+    if m is None:
+        return {"sharpe": None, "max_drawdown_pct": None, "drawdown_pct": None, "win_rate": None,
+                "realized_pnl_usd": 0.0, "closed_trades": 0}
+    sharpe = None
+    if m.returns_count > 1:
+        std = math.sqrt(m.returns_m2 / (m.returns_count - 1))
+        if std > 0:
+            sharpe = m.returns_mean / std * math.sqrt(periods_per_year or SHARPE_PERIODS_PER_YEAR)
+    drawdown = None
+    if m.peak_equity and m.last_equity is not None:
+        drawdown = (m.peak_equity - m.last_equity) / m.peak_equity
+    closed = m.wins + m.losses
+    return {
+        "sharpe": round(sharpe, 3) if sharpe is not None else None,
+        "max_drawdown_pct": round(m.max_drawdown * 100, 2),
+        "drawdown_pct": round(drawdown * 100, 2) if drawdown is not None else None,
+        "win_rate": round(m.wins / closed * 100, 1) if closed else None,
+        "realized_pnl_usd": round(m.realized_pnl, 2),
+        "closed_trades": closed,
+    }
+
+
+def rebuild(db, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Recomputes every agent's state from the full trades and portfolio_snapshots history
+    (a one-off, e.g. after upgrading). Lots come from Trade rows only. Returns rows written.
+    """
+    acc = Accumulator(a for (a,) in db.query(models.Agent.id))
+
+    trades = db.execute(
+        select(models.Trade.agent_id, models.Trade.symbol, models.Trade.side, models.Trade.qty, models.Trade.price)
+        .order_by(models.Trade.timestamp, models.Trade.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for batch in trades.partitions(batch_size):
+        acc.add_trades(row._mapping for row in batch)
+
+    # One observation per agent per snapshot timestamp
+    snapshots = db.execute(
+        select(models.PortfolioSnapshot.timestamp, models.PortfolioSnapshot.agent_id,
+               models.PortfolioSnapshot.total_equity)
+        .order_by(models.PortfolioSnapshot.timestamp, models.PortfolioSnapshot.agent_id)
+        .execution_options(yield_per=batch_size)
+    )
+    for _, group in itertools.groupby(snapshots, key=lambda row: row.timestamp):
+        group = [row for row in group if row.total_equity is not None]
+        acc.add_equity([row.agent_id for row in group], [row.total_equity for row in group])
+
+    db.execute(delete(models.AgentMetrics))
+    acc.lots_changed = set(acc.index)
+    return acc.save(db)
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rows = rebuild(db)
+        db.commit()
+        print(f"Rebuilt performance metrics for {rows} agents.")
+    finally:
+        db.close()
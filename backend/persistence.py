@@ -0,0 +1,142 @@
+"""
+Bulk write stage for market cycles.
+
+Trades and portfolio snapshots are inserted with one batched statement each
+(COPY on Postgres), only agents whose cash changed are updated, with a single
+executemany UPDATE keyed on the primary key, only the (agent, symbol)
+positions that traded are upserted, and the cycle is folded into each agent's
+running performance metrics (performance.py).
+"""
+import csv
+import datetime
+import io
+
+import numpy as np
+from sqlalchemy import insert, update
+
+import models
+import performance
+import positions
+from backtest import STARTING_CASH
+
+TRADE_COLUMNS = ("agent_id", "symbol", "side", "qty", "price", "timestamp")
+SNAPSHOT_COLUMNS = ("agent_id", "timestamp", "total_equity", "cash", "pnl")
+
+
+def write_trades(db, trades):
+    """Inserts trade dicts in one round trip. Returns the number of rows written."""
+    return _bulk_insert(db, models.Trade, TRADE_COLUMNS, trades)
+
+
+def write_snapshots(db, population, prices, timestamp):
+    """One PortfolioSnapshot per agent, equity marked at this cycle's prices."""
+    return write_snapshot_rows(db, snapshot_rows(population, prices, timestamp))
+
+
+def snapshot_rows(population, prices, timestamp):
+    """PortfolioSnapshot rows for every agent of the population, equity marked at `prices`."""
+    equity = population.equity(prices)
+    return [
+        {
+            "agent_id": int(agent_id),
+            "timestamp": timestamp,
+            "total_equity": float(equity[i]),
+            "cash": population.cash_of(i),
+            "pnl": float(equity[i]) - STARTING_CASH,
+        }
+        for i, agent_id in enumerate(population.agent_ids)
+    ]
+
+
+def write_snapshot_rows(db, rows, upsert=False):
+    """
+    Bulk inserts snapshot rows. With `upsert`, a row for an (agent_id, timestamp)
+    already stored replaces it instead of violating the primary key.
+    """
+    if not (upsert and rows):
+        return _bulk_insert(db, models.PortfolioSnapshot, SNAPSHOT_COLUMNS, rows)
+    stmt = positions._dialect_insert(db)(models.PortfolioSnapshot)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["agent_id", "timestamp"],
+        set_={c: stmt.excluded[c] for c in ("total_equity", "cash", "pnl")},
+    )
+    db.execute(stmt, [{c: r[c] for c in SNAPSHOT_COLUMNS} for r in rows])
+    return len(rows)
+
+
+def _bulk_insert(db, model, columns, rows):
+    if not rows:
+        return 0
+
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_rows(db, model.__tablename__, columns, rows)
+    else:
+        db.execute(insert(model), [{c: r[c] for c in columns} for r in rows])
+    return len(rows)
+
+
+def _copy_rows(db, table, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for r in rows:
+        writer.writerow([_csv_value(r[c]) for c in columns])
+
+    # Raw DBAPI cursor on the session's own connection, so COPY joins the cycle's transaction
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    cursor = db.connection().connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+def _csv_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, float):
+        return repr(value)
+    return value
+
+
+def update_changed_agents(db, population):
+    """Writes cash for agents that traded this cycle. Returns the number of rows."""
+    changed = np.flatnonzero(population.dirty)
+    return write_agent_cash(db, [(int(population.agent_ids[i]), population.cash_of(i)) for i in changed])
+
+
+def write_agent_cash(db, rows):
+    """Executemany UPDATE of current_cash from (agent_id, cash) rows. Returns the number of rows."""
+    if not rows:
+        return 0
+    db.execute(update(models.Agent), [{"id": agent_id, "current_cash": cash} for agent_id, cash in rows])
+    return len(rows)
+
+
+def write_positions(db, population):
+    """Upserts positions that traded this cycle and deletes closed ones. Returns the number of rows."""
+    return positions.upsert_positions(db, list(population.changed_positions()))
+
+
+def persist_cycle(db, population, trades, prices=None, timestamp=None):
+    """
+    Bulk-writes a cycle's results (without committing). Pass `prices` to also record
+    a portfolio snapshot per agent. Returns rows written per table.
+    """
+    snapshots = []
+    if prices is not None:
+        snapshots = snapshot_rows(population, prices, timestamp or datetime.datetime.utcnow())
+    rows = {
+        "trades": write_trades(db, trades),
+        "agents": update_changed_agents(db, population),
+        # Before the positions are written: agents new to agent_metrics open from the stored ones
+        "metrics": performance.update(db, trades, snapshots),
+        "positions": write_positions(db, population),
+    }
+    if prices is not None:
+        rows["snapshots"] = write_snapshot_rows(db, snapshots)
+    return rows
@@ -0,0 +1,290 @@
+import datetime
+import logging
+
+import numpy as np
+
+from signals import SignalIndex, expand
+
+logger = logging.getLogger(__name__)
+
+# Strategy codes used in the packed DNA arrays
+MEAN_REVERSION = 0
+MOMENTUM = 1
+UNKNOWN_STRATEGY = -1
+
+STRATEGY_CODES = {
+    "mean_reversion": MEAN_REVERSION,
+    "momentum": MOMENTUM,
+}
+
+
+class Population:
+    """
+    Array-backed population of trading agents.
+
+    Packs every agent's DNA, cash and positions into NumPy arrays so a whole
+    market cycle is evaluated in a few vectorized passes instead of one
+    TradingAgent per agent. Entry signals come from a per-cycle SignalIndex
+    (see signals.py) and exits from the open positions, so the work grows with
+    the signals hit rather than with agents x symbols. Decisions and fills
+    mirror TradingAgent.execute_logic / place_order exactly, including an
+    optional DNA 'watchlist' (symbols an agent may enter; default all).
+    """
+
+    def __init__(self, agent_ids, dnas, cash, positions, symbols):
+        n = len(agent_ids)
+        self.agent_ids = np.asarray(agent_ids, dtype=np.int64)
+        self.symbols = list(symbols)
+        self.symbol_index = {symbol: j for j, symbol in enumerate(self.symbols)}
+
+        # DNA, with the same defaults TradingAgent applies
+        self.strategy = np.array(
+            [STRATEGY_CODES.get(d.get("strategy", "mean_reversion"), UNKNOWN_STRATEGY) for d in dnas],
+            dtype=np.int8,
+        )
+        self.rsi_limit = np.array([d.get("rsi_limit", 30) for d in dnas], dtype=np.float64)
+        self.rsi_period = np.array([d.get("rsi_period", 14) for d in dnas], dtype=np.int64)
+        self.rsi_periods, self._rsi_period_idx = np.unique(self.rsi_period, return_inverse=True)
+        self.stop_loss_pct = np.array([d.get("stop_loss_pct", 0.05) for d in dnas], dtype=np.float64)
+        self.take_profit_pct = np.array([d.get("take_profit_pct", 0.10) for d in dnas], dtype=np.float64)
+        self.max_position_size = np.array([d.get("max_position_size", 0.1) for d in dnas], dtype=np.float64)
+        # Mean reversion agents per rsi_period, by descending rsi_limit (see _decide)
+        self._mean_reversion_groups = []
+        for p in self.rsi_periods:
+            agents = np.flatnonzero((self.strategy == MEAN_REVERSION) & (self.rsi_period == p))
+            if len(agents):
+                agents = agents[np.argsort(-self.rsi_limit[agents], kind="stable")]
+                self._mean_reversion_groups.append((int(p), agents, -self.rsi_limit[agents]))
+        self._momentum_agents = np.flatnonzero(self.strategy == MOMENTUM)
+
+        # Watchlists: None when nobody has one, else (agent, symbol) -> may enter
+        self.watch = None
+        watchlists = [d.get("watchlist") for d in dnas]
+        if any(watchlists):
+            self.watch = np.ones((n, len(self.symbols)), dtype=bool)
+            for i, watchlist in enumerate(watchlists):
+                if watchlist:
+                    self.watch[i] = False
+                    self.watch[i, [self.symbol_index[s] for s in watchlist if s in self.symbol_index]] = True
+
+        # Portfolio state
+        self.cash = np.asarray(cash, dtype=np.float64).copy()
+        self.qty = np.zeros((n, len(self.symbols)), dtype=np.float64)
+        self.avg_price = np.full((n, len(self.symbols)), np.nan)  # NaN = no avg price recorded
+        self.dirty = np.zeros(n, dtype=bool)  # agents whose cash changed since load
+        self.dirty_cells = np.zeros((n, len(self.symbols)), dtype=bool)  # (agent, symbol) positions changed
+
+        # positions: per agent, (symbol, qty, avg_price) for symbols in the universe
+        for i, rows in enumerate(positions):
+            for symbol, qty, avg_price in rows:
+                j = self.symbol_index.get(symbol)
+                if j is None:
+                    continue
+                self.qty[i, j] = qty
+                if avg_price:
+                    self.avg_price[i, j] = avg_price
+
+    @classmethod
+    def from_agents(cls, db_agents, position_rows, symbols):
+        """
+        Build a population from agent rows (id, dna, current_cash) and
+        models.Position rows (agent_id, symbol, qty, avg_price).
+        """
+        by_agent = {}
+        for p in position_rows:
+            by_agent.setdefault(p.agent_id, []).append((p.symbol, p.qty, p.avg_price))
+        return cls(
+            [a.id for a in db_agents],
+            [a.dna or {} for a in db_agents],
+            [a.current_cash for a in db_agents],
+            [by_agent.get(a.id, ()) for a in db_agents],
+            symbols,
+        )
+
+    def __len__(self):
+        return len(self.agent_ids)
+
+    def step(self, market_snapshot, timestamp=None, symbols=None, review=None):
+        """
+        Runs one market cycle for every agent.
+        market_snapshot: {symbol: market_data} as passed to TradingAgent.execute_logic.
+        symbols: only evaluate these columns (e.g. the symbol that just ticked); default all.
+        review: optional review(population, decisions) -> decisions, called once with every
+        signalled symbol's (j, data, price, buy, sell) before anything is filled, buy and sell
+        being arrays of agent rows (see advisor.py).
+        Returns the executed trades as dicts (same shape as TradingAgent.pending_trades
+        plus 'agent_id'), ordered by agent then symbol.
+        """
+        timestamp = timestamp or datetime.datetime.utcnow()
+        fills = []  # (agent_idx, symbol_idx, side, qty, price)
+
+        if symbols is not None:
+            market_snapshot = {s: market_snapshot[s] for s in set(symbols) if s in market_snapshot}
+        # A column's decision only reads that column's positions, so deciding every
+        # symbol before filling any gives the same result as interleaving them
+        decisions = self._decide(SignalIndex(market_snapshot, self.symbols, self.symbol_index))
+
+        if review is not None and decisions:
+            decisions = review(self, decisions)
+        for j, data, price, buy, sell in decisions:
+            fills.extend(self._fill(j, price, buy, sell))
+
+        fills.sort(key=lambda f: (f[0], f[1]))
+        return [
+            {
+                "agent_id": int(self.agent_ids[i]),
+                "symbol": self.symbols[j],
+                "side": side,
+                "qty": qty,
+                "price": price,
+                "timestamp": timestamp,
+            }
+            for i, j, side, qty, price in fills
+        ]
+
+    def _decide(self, index):
+        """
+        [(j, data, price, buy, sell)] for every symbol column with a signal, in column
+        order; buy and sell are arrays of agent rows.
+        """
+        # Entries, symbol by symbol in column order. Mean reversion: the symbols under a
+        # group's highest rsi_limit are a prefix of the index's RSI order, and the agents
+        # whose limit is above a symbol's RSI a prefix of the group (limits descending).
+        # Momentum: the symbols above their SMA spread threshold, for every momentum agent.
+        pairs = []
+        for p, agents, neg_limits in self._mean_reversion_groups:
+            order, _ = index.rsi_sorted(p)
+            candidates = np.sort(order[:index.rsi_below(p, -neg_limits[0])])
+            counts = np.searchsorted(neg_limits, -index.rsi(p)[candidates], "left")
+            pairs.append(expand(candidates, counts, agents))
+        momentum = np.sort(index.momentum_buys())
+        pairs.append(expand(momentum, np.full(len(momentum), len(self._momentum_agents)), self._momentum_agents))
+        buy_j = np.concatenate([j for j, _ in pairs])
+        buy_i = np.concatenate([i for _, i in pairs])
+        keep = self.qty[buy_i, buy_j] == 0
+        if self.watch is not None:
+            keep &= self.watch[buy_i, buy_j]
+        buy_i, buy_j = buy_i[keep], buy_j[keep]
+
+        # Exits: stop-loss / take-profit or the strategy's sell rule, on open positions
+        columns = index.positions
+        if len(columns) == len(self.symbols):
+            sell_j, sell_i = np.nonzero(self.qty.T > 0)
+        else:
+            k, sell_i = np.nonzero(self.qty[:, columns].T > 0)
+            sell_j = columns[k]
+        price = index.price[sell_j]
+        avg = self.avg_price[sell_i, sell_j]
+        avg = np.where(np.isnan(avg), price, avg)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pnl_pct = (price - avg) / avg
+        strategy = self.strategy[sell_i]
+        rsi = self._rsi_table(index)[self._rsi_period_idx[sell_i], sell_j]
+        sell = (
+            (pnl_pct <= -self.stop_loss_pct[sell_i]) | (pnl_pct >= self.take_profit_pct[sell_i])
+            | ((strategy == MEAN_REVERSION) & (rsi > 100 - self.rsi_limit[sell_i]))
+            | ((strategy == MOMENTUM) & (index.spread[sell_j] < 0))
+        )
+        sell_i, sell_j = sell_i[sell], sell_j[sell]
+
+        # Group by column (runs are already in column order; sells come out sorted)
+        decisions = []
+        buys = np.argsort(buy_j, kind="stable")
+        buy_i, buy_j = buy_i[buys], buy_j[buys]
+        signalled = np.union1d(buy_j, sell_j)
+        buy_bounds = zip(np.searchsorted(buy_j, signalled, "left"), np.searchsorted(buy_j, signalled, "right"))
+        sell_bounds = zip(np.searchsorted(sell_j, signalled, "left"), np.searchsorted(sell_j, signalled, "right"))
+        for j, (b0, b1), (s0, s1) in zip(signalled, buy_bounds, sell_bounds):
+            data = index.data[j]
+            decisions.append((int(j), data, data["price"], buy_i[b0:b1], sell_i[s0:s1]))
+        return decisions
+
+    def _rsi_table(self, index):
+        """RSI per (rsi period, symbol column), rows in self.rsi_periods order."""
+        if len(self.rsi_periods) == 0:
+            return np.full((1, len(self.symbols)), np.nan)
+        return np.vstack([index.rsi(int(p)) for p in self.rsi_periods])
+
+    def _fill(self, j, price, buy, sell):
+        """Applies place_order semantics to the agent rows in buy / sell and returns the fills."""
+        fills = []
+
+        # SELL with size_pct=1.0 -> sell the whole (integer part of the) position
+        sell_qty = np.trunc(self.qty[sell, j])
+        ok = sell_qty > 0
+        idx, sell_qty = sell[ok], sell_qty[ok]
+        if len(idx):
+            self.qty[idx, j] -= sell_qty
+            self.cash[idx] += sell_qty * price
+            self.dirty[idx] = True
+            self.dirty_cells[idx, j] = True
+            fills.extend((i, j, "SELL", int(q), price) for i, q in zip(idx.tolist(), sell_qty.tolist()))
+
+        # BUY max_position_size of current cash, whole shares only
+        if len(buy):
+            idx = buy
+            buy_qty = np.trunc(self.cash[idx] * self.max_position_size[idx] / price)
+            cost = buy_qty * price
+            ok = (buy_qty > 0) & (self.cash[idx] >= cost)
+            idx, buy_qty, cost = idx[ok], buy_qty[ok], cost[ok]
+            self.cash[idx] -= cost
+            self.qty[idx, j] += buy_qty
+            self.avg_price[idx, j] = price
+            self.dirty[idx] = True
+            self.dirty_cells[idx, j] = True
+            fills.extend((i, j, "BUY", int(q), price) for i, q in zip(idx.tolist(), buy_qty.tolist()))
+
+        return fills
+
+    def apply_trades(self, trades):
+        """
+        Fills trades decided earlier (dicts as step() returns them) the way step() filled
+        them, e.g. a routed shard replaying its first-pass intents instead of deciding again.
+        """
+        index = {int(agent_id): i for i, agent_id in enumerate(self.agent_ids)}
+        for t in trades:
+            i, j = index[int(t["agent_id"])], self.symbol_index[t["symbol"]]
+            if t["side"] == "BUY":
+                self.cash[i] -= t["qty"] * t["price"]
+                self.qty[i, j] += t["qty"]
+                self.avg_price[i, j] = t["price"]
+            else:
+                self.cash[i] += t["qty"] * t["price"]
+                self.qty[i, j] -= t["qty"]
+            self.dirty[i] = True
+            self.dirty_cells[i, j] = True
+
+    def equity(self, prices):
+        """Cash plus open positions marked at `prices`, falling back to the recorded avg price."""
+        marks = np.array([prices.get(s, np.nan) for s in self.symbols], dtype=np.float64)
+        marks = np.where(np.isnan(marks), np.nan_to_num(self.avg_price), marks)
+        return self.cash + (self.qty * marks).sum(axis=1)
+
+    def cash_of(self, i):
+        return float(self.cash[i])
+
+    def positions_of(self, i):
+        """Open positions of agent i as [(symbol, qty, avg_price)]."""
+        return [
+            (symbol, float(self.qty[i, j]), float(np.nan_to_num(self.avg_price[i, j])))
+            for j, symbol in enumerate(self.symbols)
+            if self.qty[i, j] != 0
+        ]
+
+    def changed_positions(self):
+        """(agent_id, symbol, qty, avg_price) for every position touched since load; qty 0 = closed."""
+        for i, j in zip(*np.nonzero(self.dirty_cells)):
+            qty = float(self.qty[i, j])
+            avg_price = float(np.nan_to_num(self.avg_price[i, j])) if qty else 0.0
+            yield int(self.agent_ids[i]), self.symbols[j], qty, avg_price
+
+    def take_changes(self):
+        """
+        ([(agent_id, cash)], [(agent_id, symbol, qty, avg_price)]) changed since load or
+        the previous call, then clears the dirty flags (for populations kept across ticks).
+        """
+        cash = [(int(self.agent_ids[i]), self.cash_of(i)) for i in np.flatnonzero(self.dirty)]
+        positions = list(self.changed_positions())
+        self.dirty[:] = False
+        self.dirty_cells[:] = False
+        return cash, positions
@@ -0,0 +1,242 @@
+"""
+Structured positions.
+
+Positions live in the `positions` table, one row per (agent_id, symbol),
+instead of the legacy Agent.current_positions JSON blob with
+"{symbol}_avg_price" keys. In memory an agent's holdings are a PositionBook
+of Position objects with FIFO lots, so per-symbol reads and updates are O(1)
+and average cost comes from the lots themselves. The table keeps only each
+position's qty and average price, so a book loaded from it starts with one lot
+per symbol; FIFO order holds for the lots bought since.
+
+The web app and the worker migrate any legacy JSON at startup
+(migrate_legacy_positions); it can also be run by hand:
+
+    python positions.py   # migrate legacy current_positions JSON into the table
+"""
+import datetime
+from collections import namedtuple
+
+from sqlalchemy import delete, insert, null, tuple_
+
+import models
+
+LEGACY_AVG_PRICE_SUFFIX = "_avg_price"
+
+_legacy_migrated = False
+
+Lot = namedtuple("Lot", ["qty", "price"])
+
+
+class Position:
+    """Open lots in one symbol, oldest first."""
+
+    __slots__ = ("symbol", "lots", "qty", "cost_basis")
+
+    def __init__(self, symbol, lots=()):
+        self.symbol = symbol
+        self.lots = []
+        self.qty = 0.0
+        self.cost_basis = 0.0
+        for lot in lots:
+            self.buy(lot.qty, lot.price)
+
+    @property
+    def avg_price(self):
+        return self.cost_basis / self.qty if self.qty else None
+
+    def buy(self, qty, price):
+        self.lots.append(Lot(qty, price))
+        self.qty += qty
+        self.cost_basis += qty * price
+
+    def sell(self, qty):
+        """Closes `qty` shares FIFO. Returns the cost basis of the shares sold."""
+        remaining = qty
+        cost = 0.0
+        while remaining > 0 and self.lots:
+            lot = self.lots[0]
+            take = min(remaining, lot.qty)
+            cost += take * lot.price
+            remaining -= take
+            if take == lot.qty:
+                self.lots.pop(0)
+            else:
+                self.lots[0] = Lot(lot.qty - take, lot.price)
+        self.qty -= qty - remaining
+        self.cost_basis = sum(l.qty * l.price for l in self.lots)
+        return cost
+
+    def __repr__(self):
+        return f"Position({self.symbol!r}, qty={self.qty}, avg_price={self.avg_price})"
+
+
+class PositionBook:
+    """An agent's open positions keyed by symbol."""
+
+    def __init__(self, positions=()):
+        self._positions = {p.symbol: p for p in positions}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From models.Position rows (or any objects with symbol/qty/avg_price)."""
+        return cls(Position(r.symbol, [Lot(r.qty, r.avg_price)]) for r in rows if r.qty)
+
+    def get(self, symbol):
+        return self._positions.get(symbol)
+
+    def qty(self, symbol):
+        position = self._positions.get(symbol)
+        return position.qty if position else 0
+
+    def avg_price(self, symbol, default=None):
+        position = self._positions.get(symbol)
+        return position.avg_price if position else default
+
+    def buy(self, symbol, qty, price):
+        position = self._positions.get(symbol)
+        if position is None:
+            position = self._positions[symbol] = Position(symbol)
+        position.buy(qty, price)
+
+    def sell(self, symbol, qty):
+        """Sells FIFO and drops the position once flat. Returns the cost basis sold."""
+        position = self._positions.get(symbol)
+        if position is None:
+            return 0.0
+        cost = position.sell(qty)
+        if position.qty == 0:
+            del self._positions[symbol]
+        return cost
+
+    def __iter__(self):
+        return iter(self._positions.values())
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, symbol):
+        return symbol in self._positions
+
+
+def parse_legacy_positions(blob):
+    """[(symbol, qty, avg_price)] from a legacy current_positions dict; avg falls back to 0."""
+    rows = []
+    for key, qty in (blob or {}).items():
+        if key.endswith(LEGACY_AVG_PRICE_SUFFIX) or not qty:
+            continue
+        rows.append((key, float(qty), float(blob.get(f"{key}{LEGACY_AVG_PRICE_SUFFIX}", 0.0))))
+    return rows
+
+
+def legacy_positions(rows):
+    """The legacy current_positions dict for models.Position rows (the inverse of parse_legacy_positions)."""
+    blob = {}
+    for r in rows:
+        blob[r.symbol] = r.qty
+        blob[f"{r.symbol}{LEGACY_AVG_PRICE_SUFFIX}"] = r.avg_price
+    return blob
+
+
+def upsert_positions(db, rows):
+    """
+    Writes (agent_id, symbol, qty, avg_price) rows: insert-or-update open positions
+    and delete flat ones. Returns the number of rows touched.
+    """
+    if not rows:
+        return 0
+    now = datetime.datetime.utcnow()
+    open_rows = [
+        {"agent_id": a, "symbol": s, "qty": q, "avg_price": p, "updated_at": now}
+        for a, s, q, p in rows if q != 0
+    ]
+    closed = [(a, s) for a, s, q, _ in rows if q == 0]
+
+    if open_rows:
+        stmt = _dialect_insert(db)(models.Position)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["agent_id", "symbol"],
+            set_={
+                "qty": stmt.excluded.qty,
+                "avg_price": stmt.excluded.avg_price,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        db.execute(stmt, open_rows)
+    if closed:
+        db.execute(delete(models.Position).where(
+            tuple_(models.Position.agent_id, models.Position.symbol).in_(closed)
+        ))
+    return len(rows)
+
+
+def _dialect_insert(db):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert
+
+
+def migrate_json_positions(db, batch_size=1000):
+    """
+    Copies legacy current_positions JSON into the positions table (skipping agents
+    that already have rows) and clears the blob to NULL. Idempotent. Returns rows inserted.
+    """
+    migrated = {a for (a,) in db.query(models.Position.agent_id).distinct()}
+    inserted = 0
+    pending = []
+    agents = db.query(models.Agent.id, models.Agent.current_positions).filter(
+        models.Agent.current_positions.isnot(None)
+    )
+    for agent_id, blob in agents.all():
+        if not blob or agent_id in migrated:
+            continue
+        pending.extend(
+            {"agent_id": agent_id, "symbol": s, "qty": q, "avg_price": p}
+            for s, q, p in parse_legacy_positions(blob)
+        )
+        if len(pending) >= batch_size:
+            db.execute(insert(models.Position), pending)
+            inserted += len(pending)
+            pending = []
+    if pending:
+        db.execute(insert(models.Position), pending)
+        inserted += len(pending)
+
+    db.query(models.Agent).filter(models.Agent.current_positions.isnot(None)).update(
+        {models.Agent.current_positions: null()}, synchronize_session=False
+    )
+    db.commit()
+    return inserted
+
+
+def migrate_legacy_positions(session_factory):
+    """
+    Startup hook: migrate_json_positions, once. Migrated blobs are NULL and new agents
+    never get one, so after the first run this is a single LIMIT 1 probe per process.
+    """
+    global _legacy_migrated
+    if _legacy_migrated:
+        return 0
+    db = session_factory()
+    try:
+        pending = db.query(models.Agent.id).filter(models.Agent.current_positions.isnot(None)).first()
+        inserted = migrate_json_positions(db) if pending else 0
+        if inserted:
+            print(f"Migrated {inserted} positions from current_positions JSON.")
+        _legacy_migrated = True
+        return inserted
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(f"Migrated {migrate_json_positions(db)} positions from current_positions JSON.")
+    finally:
+        db.close()
@@ -0,0 +1,32 @@
+import os
+
+_client = None
+_async_client = None
+
+def get_redis_url():
+    # Standard Heroku Redis URL is REDIS_URL
+    redis_url = os.environ.get("REDIS_URL", os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379"))
+
+    # Heroku Redis SSL Fix: Some plans require rediss:// and cert verification off
+    if redis_url and redis_url.startswith("rediss://"):
+        if "ssl_cert_reqs" not in redis_url:
+            # Append params to handle self-signed certs common on Heroku
+            separator = "&" if "?" in redis_url else "?"
+            redis_url = f"{redis_url}{separator}ssl_cert_reqs=none"
+    return redis_url
+
+def get_redis():
+    """Shared Redis client for caches and state (connections are pooled by redis-py)."""
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(get_redis_url(), socket_connect_timeout=1, socket_timeout=2)
+    return _client
+
+def get_async_redis():
+    """Shared asyncio Redis client for API handlers running on the event loop."""
+    global _async_client
+    if _async_client is None:
+        import redis.asyncio as aioredis
+        _async_client = aioredis.Redis.from_url(get_redis_url(), socket_connect_timeout=1, socket_timeout=2)
+    return _async_client
@@ -0,0 +1,380 @@
+"""
+Monte Carlo robustness scoring.
+
+Ranking DNA by one realized path rewards luck. This scores every DNA across
+many price paths resampled from a history's daily log returns instead:
+
+    bootstrap   blocks of consecutive return rows drawn with replacement
+                (keeps cross-symbol correlation and short-range autocorrelation)
+    gbm         multivariate normal returns with the history's mean and covariance
+
+The paths and their indicators (SMA 20/50, RSI per period) are computed once
+and placed in multiprocessing.shared_memory blocks. Worker processes attach to
+them by name and backtest batches of DNAs with the Population rules across a
+range of paths, reading zero-copy views; only DNAs go out and (returns,
+drawdowns) come back. Scores report per-DNA distributions: median return and
+the 5th-percentile drawdown (the drawdown only 5% of paths exceed).
+
+    python robustness.py --agents 200 --paths 500 --workers 8
+    python robustness.py --source alpaca --symbols AAPL,SPY --paths 200 --method gbm
+
+evolve_agents ranks by these scores with EVOLVE_FITNESS=robust.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import models
+from backtest import (
+    AlpacaPriceSource, FilePriceSource, PriceHistory, STARTING_CASH, SyntheticPriceSource,
+    compute_indicators, random_dna, run_backtest,
+)
+from population import Population
+
+METHODS = ("bootstrap", "gbm")
+DEFAULT_PATHS = int(os.getenv("ROBUSTNESS_PATHS", "200"))
+DEFAULT_DRAWDOWN_PENALTY = float(os.getenv("ROBUSTNESS_DRAWDOWN_PENALTY", "0.5"))
+TAIL_PERCENTILE = 5
+# A backtest's cost is mostly per bar, not per agent: batch DNAs widely and split work over paths
+MAX_BATCH = 2000
+
+
+def simulate_paths(history, paths=DEFAULT_PATHS, bars=None, method="bootstrap", block_size=5, seed=None):
+    """
+    (paths, bars, symbols) closes resampled from `history`'s daily log returns, each
+    path starting from the last close of the history.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+    log_returns = np.diff(np.log(history.closes), axis=0)
+    if len(log_returns) < 2:
+        raise ValueError("history needs at least 3 bars to resample returns")
+    bars = bars or len(history)
+    rng = np.random.default_rng(seed)
+
+    if method == "gbm":
+        mean = log_returns.mean(axis=0)
+        cov = np.atleast_2d(np.cov(log_returns, rowvar=False))
+        sampled = rng.multivariate_normal(mean, cov, size=(paths, bars))
+    else:
+        block_size = max(1, min(block_size, len(log_returns)))
+        blocks = -(-bars // block_size)
+        starts = rng.integers(0, len(log_returns) - block_size + 1, size=(paths, blocks))
+        rows = (starts[:, :, None] + np.arange(block_size)).reshape(paths, blocks * block_size)[:, :bars]
+        sampled = log_returns[rows]
+
+    return history.closes[-1] * np.exp(np.cumsum(sampled, axis=1))
+
+
+class RobustnessScores:
+    """Per-DNA outcome distributions: returns[i, p] and drawdowns[i, p] of DNA i on path p."""
+
+    def __init__(self, dnas, returns, drawdowns):
+        self.dnas = dnas
+        self.returns = returns
+        self.drawdowns = drawdowns
+
+    def __len__(self):
+        return len(self.dnas)
+
+    @property
+    def median_return(self):
+        return np.median(self.returns, axis=1)
+
+    @property
+    def p5_return(self):
+        return np.percentile(self.returns, TAIL_PERCENTILE, axis=1)
+
+    @property
+    def median_drawdown(self):
+        return np.median(self.drawdowns, axis=1)
+
+    @property
+    def p5_drawdown(self):
+        """Drawdown in the worst 5% of paths (their 95th percentile, a positive fraction)."""
+        return np.percentile(self.drawdowns, 100 - TAIL_PERCENTILE, axis=1)
+
+    def fitness(self, drawdown_penalty=DEFAULT_DRAWDOWN_PENALTY):
+        """Median return minus `drawdown_penalty` x the 5th-percentile drawdown."""
+        return self.median_return - drawdown_penalty * self.p5_drawdown
+
+    def summary(self, i):
+        return {
+            "median_return": float(self.median_return[i]),
+            "p5_return": float(self.p5_return[i]),
+            "median_drawdown": float(self.median_drawdown[i]),
+            "p5_drawdown": float(self.p5_drawdown[i]),
+            "paths": int(self.returns.shape[1]),
+        }
+
+
+# Per worker process state, set once by _init_worker
+_arrays = None
+_segments = []
+_symbols = None
+_timestamps = None
+
+
+def _init_worker(layout, symbols, timestamps):
+    global _arrays, _segments, _symbols, _timestamps
+    _segments = []
+    _arrays = {}
+    for key, (name, shape, dtype) in layout.items():
+        segment = shared_memory.SharedMemory(name=name)
+        _segments.append(segment)
+        _arrays[key] = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    _symbols = symbols
+    _timestamps = timestamps
+
+
+def score_paths(dnas, arrays, symbols, timestamps, lo, hi):
+    """(returns, drawdowns), each (len(dnas), hi - lo), of `dnas` backtested on paths lo..hi-1."""
+    n = len(dnas)
+    periods = arrays["rsi_periods"]
+    returns = np.empty((n, hi - lo))
+    drawdowns = np.empty((n, hi - lo))
+    for p in range(lo, hi):
+        history = PriceHistory(timestamps, symbols, arrays["closes"][p])
+        indicators = {
+            "sma_20": arrays["sma_20"][p],
+            "sma_50": arrays["sma_50"][p],
+            "rsi_by_period": {int(period): arrays["rsi"][k, p] for k, period in enumerate(periods)},
+        }
+        population = Population(list(range(n)), dnas, [STARTING_CASH] * n, [()] * n, symbols)
+        result = run_backtest(population, history, indicators=indicators)
+        returns[:, p - lo] = result.returns
+        drawdowns[:, p - lo] = result.max_drawdown
+    return returns, drawdowns
+
+
+def _score_task(task):
+    dnas, lo, hi = task
+    return score_paths(dnas, _arrays, _symbols, _timestamps, lo, hi)
+
+
+class RobustnessEvaluator:
+    """
+    with RobustnessEvaluator(history, paths=200, workers=8, rsi_periods=range(5, 31)) as evaluator:
+        scores = evaluator.evaluate(dnas)
+        scores.median_return, scores.p5_drawdown, scores.fitness(drawdown_penalty=0.5)
+    The paths live in shared memory for the evaluator's lifetime, so repeated
+    evaluate() calls (e.g. one per GA generation) reuse them and the worker pool.
+    RSI periods not in `rsi_periods` still work but are recomputed per path.
+    """
+
+    def __init__(self, history, paths=DEFAULT_PATHS, bars=None, method="bootstrap", block_size=5,
+                 rsi_periods=(), workers=None, chunk_size=None, seed=None):
+        self.history = history
+        self.paths = paths
+        self.bars = bars or len(history)
+        self.method = method
+        self.block_size = block_size
+        self.rsi_periods = sorted({int(p) for p in rsi_periods} | {14})
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.arrays = None
+        self._segments = []
+        self._pool = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _share(self, values):
+        segment = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        self._segments.append(segment)
+        shared = np.ndarray(values.shape, dtype=values.dtype, buffer=segment.buf)
+        shared[...] = values
+        return shared, (segment.name, values.shape, values.dtype.str)
+
+    def open(self):
+        """Simulates the paths, computes their indicators and publishes both to shared memory."""
+        if self.arrays is not None:
+            return
+        closes = simulate_paths(self.history, self.paths, self.bars, self.method, self.block_size, self.seed)
+        paths, bars, width = closes.shape
+        symbols = list(self.history.symbols)
+        last = self.history.timestamps[-1] if self.history.timestamps else datetime.datetime.utcnow()
+        if not isinstance(last, datetime.datetime):
+            last = datetime.datetime.utcnow()
+        timestamps = [last + datetime.timedelta(days=t + 1) for t in range(bars)]
+
+        # Indicators run down axis 0, so every (path, symbol) is one column of a single pass
+        flat = PriceHistory(timestamps, range(paths * width), closes.transpose(1, 0, 2).reshape(bars, paths * width))
+        indicators = compute_indicators(flat, self.rsi_periods)
+        periods = sorted(indicators["rsi_by_period"])
+
+        def by_path(values):
+            return values.reshape(bars, paths, width).transpose(1, 0, 2)
+
+        self.arrays, layout = {}, {}
+        try:
+            values = {
+                "closes": closes,
+                "sma_20": by_path(indicators["sma_20"]),
+                "sma_50": by_path(indicators["sma_50"]),
+                "rsi": np.stack([by_path(indicators["rsi_by_period"][p]) for p in periods]),
+                "rsi_periods": np.asarray(periods, dtype=np.int64),
+            }
+            del indicators, flat
+            for key, array in values.items():
+                self.arrays[key], layout[key] = self._share(np.ascontiguousarray(array))
+            del values
+        except Exception:
+            self.close()
+            raise
+        self._symbols = symbols
+        self._timestamps = timestamps
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(layout, symbols, timestamps),
+            )
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self.arrays = None
+        for segment in self._segments:
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self._segments = []
+
+    def _tasks(self, dnas):
+        """DNA batches x path ranges, enough of them to keep every worker busy."""
+        chunk = self.chunk_size or MAX_BATCH
+        batches = [dnas[i:i + chunk] for i in range(0, len(dnas), chunk)]
+        splits = max(1, min(self.paths, -(-self.workers // len(batches))))
+        bounds = np.linspace(0, self.paths, splits + 1).astype(int)
+        return [(batch, int(lo), int(hi)) for batch in batches for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+    def evaluate(self, dnas):
+        """RobustnessScores of `dnas` over every path."""
+        self.open()
+        dnas = list(dnas)
+        returns = np.empty((len(dnas), self.paths))
+        drawdowns = np.empty((len(dnas), self.paths))
+        if not dnas:
+            return RobustnessScores(dnas, returns, drawdowns)
+        tasks = self._tasks(dnas)
+        if self._pool is None:
+            results = (score_paths(b, self.arrays, self._symbols, self._timestamps, lo, hi) for b, lo, hi in tasks)
+        else:
+            results = self._pool.map(_score_task, tasks)
+
+        offsets, row = {}, 0
+        for batch, lo, hi in tasks:
+            if id(batch) not in offsets:
+                offsets[id(batch)] = row
+                row += len(batch)
+        for (batch, lo, hi), (batch_returns, batch_drawdowns) in zip(tasks, results):
+            start = offsets[id(batch)]
+            returns[start:start + len(batch), lo:hi] = batch_returns
+            drawdowns[start:start + len(batch), lo:hi] = batch_drawdowns
+        return RobustnessScores(dnas, returns, drawdowns)
+
+
+def score_dnas(dnas, history, **kwargs):
+    """One-off RobustnessScores of `dnas` (kwargs as for RobustnessEvaluator)."""
+    with RobustnessEvaluator(history, **kwargs) as evaluator:
+        return evaluator.evaluate(dnas)
+
+
+def load_history(symbols, bars=252):
+    """Daily closes for `symbols` from the local bar store (topped up from Alpaca)."""
+    return AlpacaPriceSource(symbols, bars=bars).load()
+
+
+def robust_rank(db, symbols, k, drawdown_penalty=DEFAULT_DRAWDOWN_PENALTY, **kwargs):
+    """
+    (top k best first, bottom k worst last) active agents as [(agent id, fitness)], by
+    robust fitness over paths resampled from `symbols`' history. The two never share
+    an agent, so with fewer than 2k agents the bottom is shorter. Reads only (id, dna)
+    columns and scores each distinct DNA once. Raises when there is no history.
+    """
+    rows = (
+        db.query(models.Agent.id, models.Agent.dna)
+        .filter(models.Agent.status == "active")
+        .order_by(models.Agent.id)
+        .all()
+    )
+    unique = {}
+    agent_keys = []
+    for agent_id, dna in rows:
+        key = json.dumps(dna, sort_keys=True)
+        unique.setdefault(key, dna)
+        agent_keys.append((agent_id, key))
+    keys = list(unique)
+    dnas = [unique[key] for key in keys]
+    history = load_history(symbols, bars=int(os.getenv("ROBUSTNESS_BARS", "252")))
+    kwargs.setdefault("rsi_periods", {int(d.get("rsi_period", 14)) for d in dnas})
+    kwargs.setdefault("workers", int(os.getenv("ROBUSTNESS_WORKERS", "1")))
+    kwargs.setdefault("paths", int(os.getenv("ROBUSTNESS_PATHS", DEFAULT_PATHS)))
+    scores = score_dnas(dnas, history, **kwargs)
+    fitness = dict(zip(keys, scores.fitness(drawdown_penalty).tolist()))
+
+    # Ties keep id order, like the SQL ranking
+    ranked = sorted(((agent_id, fitness[key]) for agent_id, key in agent_keys), key=lambda x: -x[1])
+    return ranked[:k], ranked[max(k, len(ranked) - k):]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score DNAs across Monte Carlo price paths.")
+    parser.add_argument("--source", choices=["synthetic", "file", "alpaca"], default="synthetic")
+    parser.add_argument("--file", help="CSV with timestamp,symbol,close columns (for --source file)")
+    parser.add_argument("--symbols", help="Comma separated symbols (default: the live universe, or all in --file)")
+    parser.add_argument("--bars", type=int, default=252, help="Bars of history to resample")
+    parser.add_argument("--agents", type=int, default=100, help="Random DNAs to score")
+    parser.add_argument("--paths", type=int, default=DEFAULT_PATHS)
+    parser.add_argument("--path-bars", type=int, default=None, help="Bars per simulated path (default: --bars)")
+    parser.add_argument("--method", choices=METHODS, default="bootstrap")
+    parser.add_argument("--block-size", type=int, default=5)
+    parser.add_argument("--drawdown-penalty", type=float, default=DEFAULT_DRAWDOWN_PENALTY)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()] if args.symbols else None
+    if args.source == "file":
+        source = FilePriceSource(args.file, symbols)
+    elif args.source == "alpaca":
+        source = AlpacaPriceSource(symbols, bars=args.bars)
+    else:
+        source = SyntheticPriceSource(symbols, bars=args.bars, seed=args.seed)
+    history = source.load()
+
+    rng = random.Random(args.seed)
+    dnas = [random_dna(rng) for _ in range(args.agents)]
+    start = time.perf_counter()
+    scores = score_dnas(
+        dnas, history, paths=args.paths, bars=args.path_bars, method=args.method, block_size=args.block_size,
+        rsi_periods={d["rsi_period"] for d in dnas}, workers=args.workers, seed=args.seed,
+    )
+    fitness = scores.fitness(args.drawdown_penalty)
+    print(f"Scored {len(dnas)} DNAs over {args.paths} {args.method} paths resampled from {len(history)} bars "
+          f"in {time.perf_counter() - start:.2f}s")
+    for rank, i in enumerate(np.argsort(-fitness, kind="stable")[: args.top], start=1):
+        s = scores.summary(i)
+        print(f"{rank}. fitness {fitness[i]:+.4f} median {s['median_return']:+.2%} "
+              f"p5 return {s['p5_return']:+.2%} p5 drawdown {s['p5_drawdown']:.2%} dna {dnas[i]}")
+
+
+if __name__ == "__main__":
+    main()
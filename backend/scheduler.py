@@ -0,0 +1,276 @@
+"""
+Cycle scheduling.
+
+Celery beat fires schedule_market_cycle every CYCLE_INTERVAL seconds, which
+only queues a cycle while the market is open (MARKET_HOURS_ONLY=0 runs around
+the clock), and schedule_evolution once a week at the close (EVOLVE_DAY),
+which always queues. The API trigger endpoints go through the same path:
+
+    trigger(run_market_cycle)      queue a run unless one is already pending
+    lock = begin(task, at)         first thing a cycle task does; None means skip
+
+- Coalescing: a trigger sets a pending marker per task and queues the task
+  only when none is pending, so repeated triggers collapse into one run.
+- Overlap: run_market_cycle and evolve_agents share one Redis lock (SET NX
+  with a token and a TTL); a run that finds it taken is requeued after
+  CYCLE_LOCK_RETRY seconds while its pending marker keeps absorbing triggers.
+  The holder renews the TTL from a heartbeat thread, so only a dead holder's
+  lock expires, and checks it still holds the lock before committing.
+- Staleness: a run that starts more than its max lag (CYCLE_MAX_LAG, default
+  one interval; EVOLVE_MAX_LAG) after it was triggered is dropped.
+- Trading mode: with TRADING_MODE=ticks the tick pipeline (ticks.py) trades
+  instead of market cycles. It holds the cycle lock while it runs, and
+  market cycles are not queued at all; evolution still is, and the pipeline
+  hands it the lock between ticks.
+
+Queue lag (trigger to start) goes to arena_cycle_queue_lag_seconds and skips
+to arena_cycles_skipped_total by reason; the latest of both is kept in Redis
+for GET /api/simulate/status.
+
+    celery -A worker beat --loglevel=info
+"""
+import datetime
+import os
+import threading
+import time
+import uuid
+from zoneinfo import ZoneInfo
+
+import metrics
+from redis_client import get_redis
+
+CYCLE_INTERVAL = float(os.getenv("CYCLE_INTERVAL", "300"))
+MARKET_HOURS_ONLY = os.getenv("MARKET_HOURS_ONLY", "1") != "0"
+MARKET_TIMEZONE = os.getenv("MARKET_TIMEZONE", "America/New_York")
+MARKET_OPEN = os.getenv("MARKET_OPEN", "09:30")
+MARKET_CLOSE = os.getenv("MARKET_CLOSE", "16:00")
+# Comma separated YYYY-MM-DD dates the exchange is closed
+MARKET_HOLIDAYS = {d.strip() for d in os.getenv("MARKET_HOLIDAYS", "").split(",") if d.strip()}
+EVOLVE_DAY = os.getenv("EVOLVE_DAY", "fri")  # empty disables scheduled evolution
+TRADING_MODE = os.getenv("TRADING_MODE", "cycles")  # "cycles" (Celery) or "ticks" (ticks.py)
+
+MAX_LAG = {
+    "run_market_cycle": float(os.getenv("CYCLE_MAX_LAG", str(CYCLE_INTERVAL))),
+    "evolve_agents": float(os.getenv("EVOLVE_MAX_LAG", "3600")),
+}
+LOCK_TTL = int(os.getenv("CYCLE_LOCK_TTL", "120"))  # longest a crashed holder keeps the lock; renewed at a third
+LOCK_RETRY = float(os.getenv("CYCLE_LOCK_RETRY", "5"))
+
+LOCK_KEY = "arena:cycle:lock"
+PENDING_KEY = "arena:cycle:pending:{}"
+STATS_KEY = "arena:cycle:stats:{}"
+
+# Deletes the key only while it still holds our value
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+# Resets the key's TTL only while it still holds our value
+_EXTEND = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _clock(hhmm):
+    hour, minute = hhmm.split(":")
+    return datetime.time(int(hour), int(minute))
+
+
+def market_open(now=None):
+    """Whether `now` (aware datetime, default the current time) is inside regular trading hours."""
+    if not MARKET_HOURS_ONLY:
+        return True
+    local = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(ZoneInfo(MARKET_TIMEZONE))
+    if local.weekday() >= 5 or local.date().isoformat() in MARKET_HOLIDAYS:
+        return False
+    return _clock(MARKET_OPEN) <= local.time() < _clock(MARKET_CLOSE)
+
+
+def beat_schedule():
+    """Celery beat entries; stale beat messages expire instead of piling up behind a slow worker."""
+    from celery.schedules import crontab
+
+    schedule = {
+        "market-cycle": {
+            "task": "schedule_market_cycle",
+            "schedule": CYCLE_INTERVAL,
+            "options": {"expires": CYCLE_INTERVAL},
+        },
+    }
+    if EVOLVE_DAY:
+        close = _clock(MARKET_CLOSE)
+        schedule["weekly-evolution"] = {
+            "task": "schedule_evolution",
+            "schedule": crontab(minute=close.minute, hour=close.hour, day_of_week=EVOLVE_DAY),
+            "options": {"expires": MAX_LAG["evolve_agents"]},
+        }
+    return schedule
+
+
+class LockLost(RuntimeError):
+    """The cycle lock expired or was taken over while its holder was still running."""
+
+
+class CycleLock:
+    """
+    The shared cycle lock; `token` identifies the holder so only it can renew or release.
+    acquire() starts a heartbeat renewing the TTL; call ensure() before committing.
+    """
+
+    def __init__(self, token=None):
+        self.token = token or uuid.uuid4().hex
+        self.lost = False
+        self._stop = None
+
+    def acquire(self):
+        if not get_redis().set(LOCK_KEY, self.token, nx=True, ex=LOCK_TTL):
+            return False
+        self.keep_alive()
+        return True
+
+    def extend(self):
+        """Resets the TTL if we still hold the lock. Returns whether we do."""
+        if not get_redis().eval(_EXTEND, 1, LOCK_KEY, self.token, LOCK_TTL * 1000):
+            self.lost = True
+        return not self.lost
+
+    def keep_alive(self):
+        """Renews the TTL every third of it from a daemon thread until stop() or release()."""
+        if self._stop is not None:
+            return
+        self._stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(self._stop,), daemon=True, name="cycle-lock").start()
+
+    def _heartbeat(self, stop):
+        while not stop.wait(LOCK_TTL / 3):
+            try:
+                if not self.extend():
+                    print("Cycle lock lost; this run will not commit.")
+                    return
+            except Exception as e:
+                print(f"Error renewing cycle lock: {e}")
+
+    def ensure(self):
+        """Raises LockLost unless we still hold the lock."""
+        if self.lost or not self.extend():
+            raise LockLost("cycle lock lost before commit")
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def release(self):
+        self.stop()
+        try:
+            get_redis().eval(_RELEASE, 1, LOCK_KEY, self.token)
+        except Exception as e:
+            print(f"Error releasing cycle lock: {e}")
+
+
+def release(token):
+    """Releases the lock held under `token` (from a chord callback that did not acquire it)."""
+    if token:
+        CycleLock(token).release()
+
+
+def trigger(task, source="api"):
+    """
+    Queues `task` unless a run is already pending. Returns True when queued,
+    False when coalesced into the pending run.
+    """
+    if TRADING_MODE == "ticks" and task.name == "run_market_cycle":
+        skipped(task.name, "trading_mode", "TRADING_MODE=ticks, the tick pipeline trades instead")
+        return False
+    triggered_at = time.time()
+    ttl = int(MAX_LAG.get(task.name, CYCLE_INTERVAL) + LOCK_TTL)
+    if not get_redis().set(PENDING_KEY.format(task.name), repr(triggered_at), nx=True, ex=ttl):
+        skipped(task.name, "coalesced", f"a run is already pending ({source} trigger)")
+        return False
+    task.apply_async(kwargs={"triggered_at": triggered_at})
+    return True
+
+
+def pending(name):
+    """Whether a run of task `name` is queued and not started yet."""
+    return get_redis().exists(PENDING_KEY.format(name)) > 0
+
+
+def _clear_pending(name, triggered_at):
+    try:
+        get_redis().eval(_RELEASE, 1, PENDING_KEY.format(name), repr(triggered_at))
+    except Exception as e:
+        print(f"Error clearing pending {name}: {e}")
+
+
+def begin(task, triggered_at=None, retry_kwargs=None):
+    """
+    Start of a cycle task. Returns the held CycleLock, or None when this run is
+    dropped as stale or requeued (with retry_kwargs added) because another cycle
+    holds the lock. Runs not queued by trigger() (no triggered_at) only take the lock.
+    """
+    name = task.name
+    lag = None if triggered_at is None else max(0.0, time.time() - triggered_at)
+    if lag is not None and lag > MAX_LAG.get(name, CYCLE_INTERVAL):
+        _clear_pending(name, triggered_at)
+        skipped(name, "stale", f"started {lag:.1f}s after it was triggered")
+        return None
+
+    lock = CycleLock()
+    if not lock.acquire():
+        if lag is None:
+            skipped(name, "locked", "another cycle is running")
+        else:
+            # Still pending: duplicate triggers keep coalescing into this run
+            task.apply_async(kwargs={"triggered_at": triggered_at, **(retry_kwargs or {})}, countdown=LOCK_RETRY)
+            print(f"{name} waiting for the running cycle ({lag:.1f}s since trigger).")
+        return None
+
+    if lag is not None:
+        _clear_pending(name, triggered_at)
+        metrics.CYCLE_QUEUE_LAG.labels(name).observe(lag)
+        _update_stats(name, {"last_lag_seconds": round(lag, 3)})
+        print(f"{name} started {lag:.2f}s after it was triggered.")
+    _update_stats(name, {"last_started": datetime.datetime.utcnow().isoformat()})
+    return lock
+
+
+def skipped(name, reason, detail=""):
+    metrics.CYCLES_SKIPPED.labels(name, reason).inc()
+    _update_stats(name, {"last_skip": reason, "last_skipped": datetime.datetime.utcnow().isoformat()},
+                  counter=f"skipped_{reason}")
+    print(f"Skipped {name} ({reason}){': ' + detail if detail else ''}.")
+
+
+def _update_stats(name, fields, counter=None):
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hset(STATS_KEY.format(name), mapping=fields)
+        if counter:
+            pipe.hincrby(STATS_KEY.format(name), counter, 1)
+        pipe.execute()
+    except Exception as e:
+        print(f"Error recording scheduler stats: {e}")
+
+
+def status(names=("run_market_cycle", "evolve_agents")):
+    """Lock, pending runs and the latest lag/skip stats per task, for the API."""
+    redis = get_redis()
+    body = {
+        "trading_mode": TRADING_MODE,
+        "market_open": market_open(),
+        "interval_seconds": CYCLE_INTERVAL,
+        "running": redis.exists(LOCK_KEY) > 0,
+        "tasks": {},
+    }
+    for name in names:
+        stats = {k.decode(): v.decode() for k, v in redis.hgetall(STATS_KEY.format(name)).items()}
+        pending = redis.get(PENDING_KEY.format(name))
+        stats["pending_seconds"] = round(time.time() - float(pending), 3) if pending else None
+        body["tasks"][name] = stats
+    return body
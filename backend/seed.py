@@ -13,6 +13,27 @@ if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
 # Ensure tables are created
 models.Base.metadata.create_all(bind=engine)
 
+# Portfolio history as a TimescaleDB hypertable (no-op without the extension)
+try:
+    from timescale import setup_timescale
+    setup_timescale(engine)
+except Exception as e:
+    print(f"TimescaleDB setup failed: {e}")
+
+# Keyset pagination indexes on trades tables created before they were declared
+try:
+    from trade_history import ensure_indexes
+    ensure_indexes(engine)
+except Exception as e:
+    print(f"Trade index setup failed: {e}")
+
+# Move any legacy current_positions JSON into the positions table
+try:
+    from positions import migrate_legacy_positions
+    migrate_legacy_positions(SessionLocal)
+except Exception as e:
+    print(f"Position migration failed: {e}")
+
 def seed():
     db = SessionLocal()
     try:
@@ -44,7 +65,6 @@ def seed():
                 dna=dna,
                 generation=1,
                 current_cash=random.uniform(95000, 105000), # Some starting variance
-                current_positions={}
             )
             db.add(agent)
         
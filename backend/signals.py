@@ -0,0 +1,105 @@
+"""
+Per-cycle signal index.
+
+Built once from a market snapshot, it keeps the universe's symbols sorted by
+RSI (one ordering per RSI period, built on first use) and by SMA spread, so an
+agent's entry signals are found by bisecting at its own threshold instead of
+testing every symbol:
+
+    mean reversion BUY    symbols with rsi < rsi_limit      -> the prefix of the RSI order
+    momentum BUY          symbols with sma_20 > sma_50      -> the suffix of the spread order
+
+Population.step turns these ranges into (symbol, agent) pairs for all agents
+at once, so a cycle costs the signals the agents actually hit (plus their
+open positions), not agents x symbols.
+"""
+import numpy as np
+
+
+class SignalIndex:
+    """
+    index = SignalIndex(snapshot, population.symbols)
+    order, values = index.rsi_sorted(14)      positions with a 14-period RSI, ascending
+    n = index.rsi_below(14, 30)               how many of them have rsi < 30
+    order = index.momentum_buys()             positions with sma_20 > sma_50
+    Positions index into `symbols`; symbols without a price in the snapshot are left out.
+    `symbol_index` ({symbol: position}, e.g. Population.symbol_index) skips rebuilding it.
+    """
+
+    def __init__(self, market_snapshot, symbols, symbol_index=None):
+        self.symbols = list(symbols)
+        if symbol_index is None:
+            symbol_index = {symbol: j for j, symbol in enumerate(self.symbols)}
+        n = len(self.symbols)
+        self.data = [None] * n
+        self.price = np.full(n, np.nan)
+        self.spread = np.full(n, np.nan)  # (sma_20 - sma_50) / sma_50
+        self._rsi_default = np.full(n, np.nan)
+        self._rsi_by_period = []  # (position, {period: rsi})
+        for symbol, data in market_snapshot.items():
+            j = symbol_index.get(symbol)
+            if j is None or not data or not data.get("price"):
+                continue
+            self.data[j] = data
+            self.price[j] = data["price"]
+            if data.get("rsi") is not None:
+                self._rsi_default[j] = data["rsi"]
+            if data.get("rsi_by_period"):
+                self._rsi_by_period.append((j, data["rsi_by_period"]))
+            sma_short, sma_long = data.get("sma_20"), data.get("sma_50")
+            if sma_short and sma_long:
+                self.spread[j] = (sma_short - sma_long) / sma_long
+
+        self.positions = np.flatnonzero(~np.isnan(self.price))  # ascending
+        self._rsi = {}
+        self._rsi_sorted = {}
+        valid = ~np.isnan(self.spread)
+        order = np.flatnonzero(valid)
+        self._spread_order = order[np.argsort(self.spread[order], kind="stable")]
+        self._spread_sorted = self.spread[self._spread_order]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def rsi(self, period):
+        """RSI per position as agents with this rsi_period see it (NaN where unavailable)."""
+        values = self._rsi.get(period)
+        if values is None:
+            values = self._rsi_default.copy()
+            for j, by_period in self._rsi_by_period:
+                value = by_period.get(period, self._rsi_default[j])
+                values[j] = np.nan if value is None else value
+            self._rsi[period] = values
+        return values
+
+    def rsi_sorted(self, period):
+        """(positions, rsi values) in ascending RSI order, without NaNs."""
+        entry = self._rsi_sorted.get(period)
+        if entry is None:
+            values = self.rsi(period)
+            order = np.flatnonzero(~np.isnan(values))
+            order = order[np.argsort(values[order], kind="stable")]
+            entry = self._rsi_sorted[period] = (order, values[order])
+        return entry
+
+    def rsi_below(self, period, limits):
+        """Per limit, how many positions of rsi_sorted(period) have rsi < limit."""
+        return np.searchsorted(self.rsi_sorted(period)[1], limits, side="left")
+
+    def momentum_buys(self):
+        """Positions with sma_20 > sma_50, by increasing spread."""
+        return self._spread_order[np.searchsorted(self._spread_sorted, 0.0, side="right"):]
+
+
+def expand(keys, counts, order):
+    """
+    Pairs giving keys[k] the first counts[k] entries of `order`, as two flat arrays
+    (keys repeated, entries), built without a Python loop.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(keys, counts), order[np.arange(total) - starts]
@@ -0,0 +1,82 @@
+"""
+Backend test suite, against a scratch SQLite database (async tests need aiosqlite):
+
+    cd backend && python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+
+# Backend modules import each other by name and bind their database engine at import,
+# so point them at a scratch SQLite database and the mock market data before any import
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+_scratch = tempfile.mkdtemp(prefix="agentarena-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+os.environ["MARKET_DATA_BACKEND"] = "mock"
+os.environ["INDICATOR_SNAPSHOT_PATH"] = os.path.join(_scratch, "indicator_state.json")
+os.environ["BAR_STORE_DIR"] = os.path.join(_scratch, "bars")
+os.environ.pop("ADVISOR_MODEL", None)
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A session on a fresh in-memory SQLite database with every table."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import models
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def arena(monkeypatch, tmp_path):
+    """
+    The worker against its own empty SQLite database (database.SessionLocal is rebound
+    to it) and bar store, in-process fakeredis and the mock Alpaca client, with Celery tasks (and
+    chords) run eagerly.
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # the cycle lock's Lua scripts
+
+    import benchmark
+    import database
+    from bar_store import BarStore
+    import models
+    import redis_client
+    import worker
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_client, "_client", fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(redis_client, "_async_client", fakeredis.FakeAsyncRedis(server=server))
+    monkeypatch.setattr(worker.indicator_store, "_redis", redis_client._client)
+    mock = benchmark.MockAlpacaClient()
+    monkeypatch.setattr(worker, "alpaca", mock)
+    monkeypatch.setattr(worker, "bar_store", BarStore(root=str(tmp_path / "bars"), client=mock))
+    monkeypatch.setattr(worker, "broker", None)
+    monkeypatch.setattr(worker, "get_advisor", lambda: None)
+    eager = worker.celery.conf.task_always_eager
+    worker.celery.conf.task_always_eager = True
+
+    from sqlalchemy import create_engine
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'arena.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    database.SessionLocal.configure(bind=engine)
+    try:
+        yield worker
+    finally:
+        database.SessionLocal.configure(bind=database.engine)
+        worker.celery.conf.task_always_eager = eager
+        engine.dispose()
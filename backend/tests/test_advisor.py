@@ -0,0 +1,117 @@
+import asyncio
+import datetime
+
+from advisor import Advisor, StubModel, TTLCache, market_fingerprint, parse_verdict
+from population import Population
+
+NOW = datetime.datetime(2024, 1, 2, 15, 0)
+
+
+def _population(dnas, symbols=("AAPL", "MSFT")):
+    return Population(list(range(len(dnas))), dnas, [100000.0] * len(dnas), [()] * len(dnas), list(symbols))
+
+
+def _snapshot(rsi=50.0, rsi_by_period=None, trend=1.01):
+    return {
+        symbol: {
+            "symbol": symbol,
+            "price": price,
+            "rsi": rsi,
+            "rsi_by_period": rsi_by_period or {},
+            "sma_20": price * trend,
+            "sma_50": price,
+        }
+        for symbol, price in (("AAPL", 190.0), ("MSFT", 410.0))
+    }
+
+
+def _bought(trades):
+    return sorted((t["agent_id"], t["symbol"]) for t in trades if t["side"] == "BUY")
+
+
+def test_parse_verdict():
+    assert parse_verdict(" approve.") is True
+    assert parse_verdict("VETO") is False
+    assert parse_verdict("I would APPROVE, no, VETO") is False
+    assert parse_verdict("") is None and parse_verdict(None) is None
+
+
+def test_market_fingerprint_uses_the_agents_rsi_period():
+    data = _snapshot(rsi=50.0, rsi_by_period={10: 80.4})["AAPL"]
+    assert market_fingerprint("AAPL", data, 10) == ("AAPL", 190.0, 80.0, 10.0)
+    assert market_fingerprint("AAPL", data, 14) == ("AAPL", 190.0, 50.0, 10.0)
+    assert market_fingerprint("AAPL", data) == ("AAPL", 190.0, 50.0, 10.0)
+
+
+def test_review_vetoes_and_deduplicates_prompts():
+    dnas = [{"strategy": "momentum", "stop_loss_pct": 0.05, "max_position_size": 0.1}] * 6
+    model = StubModel(max_rsi=70)
+    advisor = Advisor(model)
+
+    trades = _population(dnas).step(_snapshot(rsi=80.0), timestamp=NOW, review=advisor.review)
+    assert _bought(trades) == []
+    # Identical agents share one prompt per symbol
+    assert model.calls == 2
+    assert advisor.last_stats["intents"] == 12 and advisor.last_stats["vetoed"] == 12
+
+    trades = _population(dnas).step(_snapshot(rsi=60.0), timestamp=NOW, review=advisor.review)
+    assert len(_bought(trades)) == 12
+    assert model.calls == 4
+
+    # Same market again: answered from the cache
+    _population(dnas).step(_snapshot(rsi=60.0), timestamp=NOW, review=advisor.review)
+    assert model.calls == 4
+    assert advisor.last_stats["cached"] == 2
+
+
+def test_review_judges_each_agent_on_its_own_rsi_period():
+    dnas = [
+        {"strategy": "mean_reversion", "rsi_period": 10, "rsi_limit": 30},
+        {"strategy": "mean_reversion", "rsi_period": 14, "rsi_limit": 30},
+    ]
+    snapshot = _snapshot(rsi=25.0, rsi_by_period={10: 15.0, 14: 25.0})
+    without = _population(dnas).step(snapshot, timestamp=NOW)
+    assert _bought(without) == [(0, "AAPL"), (0, "MSFT"), (1, "AAPL"), (1, "MSFT")]
+
+    advisor = Advisor(StubModel(max_rsi=20))
+    trades = _population(dnas).step(snapshot, timestamp=NOW, review=advisor.review)
+    assert _bought(trades) == [(0, "AAPL"), (0, "MSFT")]
+
+
+def test_review_falls_back_after_the_deadline():
+    dnas = [{"strategy": "momentum"}] * 3
+    slow = StubModel(latency=5.0, max_rsi=70)
+
+    approving = Advisor(slow, deadline=0.05)
+    trades = _population(dnas).step(_snapshot(rsi=80.0), timestamp=NOW, review=approving.review)
+    assert len(_bought(trades)) == 6
+    assert approving.last_stats["unanswered"] == 2
+    assert len(approving.cache) == 0  # no verdict, nothing cached
+
+    vetoing = Advisor(slow, deadline=0.05, fallback=False)
+    trades = _population(dnas).step(_snapshot(rsi=60.0), timestamp=NOW, review=vetoing.review)
+    assert _bought(trades) == []
+
+
+def test_review_inside_a_running_event_loop():
+    dnas = [{"strategy": "momentum"}] * 2
+    advisor = Advisor(StubModel(max_rsi=70))
+
+    async def tick():
+        return _population(dnas).step(_snapshot(rsi=80.0), timestamp=NOW, review=advisor.review)
+
+    assert _bought(asyncio.run(tick())) == []
+    assert advisor.last_stats["asked"] == 2
+
+
+def test_ttl_cache_evicts_least_recent_and_expired():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", True)
+    cache.set("b", False)
+    assert cache.get("a") is True
+    cache.set("c", True)
+    assert cache.get("b") is None and cache.get("a") is True
+
+    expired = TTLCache(ttl=0)
+    expired.set("a", True)
+    assert expired.get("a", "missing") == "missing"
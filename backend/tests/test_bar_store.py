@@ -0,0 +1,84 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BarStore, append_column
+
+START = datetime.datetime(2024, 1, 1)
+
+
+def _frame(first, n, tz=None):
+    index = pd.date_range(START + datetime.timedelta(days=first), periods=n, freq="D", tz=tz)
+    close = np.arange(first, first + n, dtype=np.float64) + 100.0
+    return pd.DataFrame({"open": close - 1, "high": close + 1, "low": close - 2, "close": close,
+                         "volume": close * 10}, index=index)
+
+
+class PagedClient:
+    """Serves bars from a fixed daily series, `limit` at a time after `start`."""
+
+    def __init__(self, total):
+        self.frame = _frame(0, total)
+        self.calls = []
+
+    def get_bars(self, symbol, timeframe=None, limit=100, start=None):
+        self.calls.append(start)
+        frame = self.frame if start is None else self.frame[self.frame.index >= pd.Timestamp(start)]
+        return frame.iloc[:limit] if start is not None else frame.iloc[-limit:]
+
+
+def test_append_and_read_round_trip_through_memmaps(tmp_path):
+    store = BarStore(root=str(tmp_path))
+    assert store.read("AAPL") is None
+    assert store.append("AAPL", "1Day", _frame(0, 10, tz="UTC")) == 10
+    assert store.append("AAPL", "1Day", _frame(5, 10)) == 5  # overlap: only the new tail
+    assert store.append("AAPL", "1Day", _frame(0, 15)) == 0
+
+    bars = store.read("AAPL")
+    assert isinstance(bars.close, np.memmap)
+    assert not bars.close.flags.writeable
+    assert bars.close.tolist() == [100.0 + k for k in range(15)]
+    assert bars.timestamp[0] == np.datetime64(START, "s")
+    assert store.last_timestamp("AAPL") == START + datetime.timedelta(days=14)
+
+    window = store.read("AAPL", start=START + datetime.timedelta(days=3), end=START + datetime.timedelta(days=6))
+    assert window.close.tolist() == [103.0, 104.0, 105.0]
+    assert store.read("AAPL", limit=2).close.tolist() == [113.0, 114.0]
+
+    # A reader holding older maps sees the appended rows after remapping
+    store.append("AAPL", "1Day", _frame(15, 3))
+    assert BarStore(root=str(tmp_path)).read("AAPL").close.tolist() == store.read("AAPL").close.tolist()
+    assert len(store.read("AAPL").close) == 18
+
+
+def test_backfill_merges_older_rows(tmp_path):
+    store = BarStore(root=str(tmp_path))
+    store.append("SPY", "1Day", _frame(10, 5))
+    assert store.append("SPY", "1Day", _frame(0, 12)) == 10
+    bars = store.read("SPY")
+    assert bars.close.tolist() == [100.0 + k for k in range(15)]
+    assert np.all(np.diff(bars.timestamp.astype(np.int64)) > 0)
+
+
+def test_append_column_drops_an_interrupted_tail(tmp_path):
+    path = str(tmp_path / "close.npy")
+    append_column(path, 0, np.array([1.0, 2.0, 3.0]))
+    append_column(path, 2, np.array([9.0]))  # row 3 was never committed
+    assert np.load(path).tolist() == [1.0, 2.0, 9.0]
+
+
+def test_refresh_fetches_only_the_missing_tail(tmp_path):
+    client = PagedClient(total=30)
+    store = BarStore(root=str(tmp_path), client=client)
+    client.frame = _frame(0, 20)
+    assert store.refresh("AAPL", limit=10) == 10
+    assert client.calls == [None]
+
+    client.frame = _frame(0, 30)
+    assert store.refresh("AAPL", limit=4) == 10  # pages of 4 after the stored tail
+    assert client.calls[1] == START + datetime.timedelta(days=19, seconds=1)
+    assert len(client.calls) == 4
+    assert store.read("AAPL").close[-1] == 129.0
+    assert store.refresh("AAPL", limit=4, max_age=datetime.timedelta(days=10 ** 5)) == 0
+    assert len(client.calls) == 4
@@ -0,0 +1,20 @@
+from sqlalchemy import update
+
+import benchmark
+import models
+
+
+def test_measure_counts_updates_and_upserts(db):
+    benchmark.generate_population(db, 30, symbols=["AAPL", "SPY"])
+    db.commit()
+
+    def write():
+        db.execute(update(models.Agent).where(models.Agent.id <= 10).values(current_cash=1.0))
+        db.add(models.Agent(name="New", dna={}))
+        db.flush()
+        db.execute(update(models.Agent).where(models.Agent.id > 1000).values(current_cash=2.0))
+        db.commit()
+
+    result = benchmark.measure(db, write, trace_memory=False)
+    assert result["rows"] == {"agents": {"insert": 1, "update": 10}}
+    assert result["statements"] == {"agents": {"insert": 1, "update": 2}}
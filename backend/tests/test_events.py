@@ -0,0 +1,65 @@
+import datetime
+import json
+
+import pytest
+
+import events
+
+
+def _agent(agent_id, pnl, status="active"):
+    return {"id": agent_id, "name": f"A{agent_id}", "status": status, "pnl_usd": pnl, "positions": []}
+
+
+def _payload(agents, total=0.0):
+    return {"spx_price": 500.0, "total_pnl_usd": total, "total_pnl_spx": total / 500.0,
+            "updated_at": "2024-01-02T15:00:00Z", "agents": agents}
+
+
+def test_first_leaderboard_sends_a_summary_and_every_agent():
+    deltas = events.leaderboard_deltas(None, _payload([_agent(1, 5.0), _agent(2, -3.0)], total=2.0))
+    assert deltas[0] == {"type": "summary", "spx_price": 500.0, "total_pnl_usd": 2.0, "total_pnl_spx": 0.004,
+                         "updated_at": "2024-01-02T15:00:00Z"}
+    assert deltas[1:] == [{"type": "agent", "agent": _agent(1, 5.0)}, {"type": "agent", "agent": _agent(2, -3.0)}]
+
+
+def test_deltas_carry_only_changed_and_removed_agents():
+    old = _payload([_agent(1, 5.0), _agent(2, -3.0), _agent(3, 0.0)])
+    new = _payload([_agent(1, 5.0), _agent(2, 4.0), _agent(4, 0.0)])
+    types = [(d["type"], d.get("agent", {}).get("id", d.get("id"))) for d in events.leaderboard_deltas(old, new)]
+    assert types == [("summary", None), ("agent", 2), ("agent", 4), ("agent_removed", 3)]
+
+
+def test_trade_events_batch_serializable_rows(monkeypatch):
+    monkeypatch.setattr(events, "MAX_TRADES_PER_EVENT", 2)
+    at = datetime.datetime(2024, 1, 2, 15, 0)
+    trades = [{"agent_id": i, "symbol": "AAPL", "side": "BUY", "qty": 1.0, "price": 150.123456, "timestamp": at,
+               "internal": "dropped"} for i in range(5)]
+
+    batches = events.trade_events(trades)
+    assert [len(b["trades"]) for b in batches] == [2, 2, 1]
+    assert batches[0]["type"] == "trades"
+    assert batches[0]["trades"][0] == {"agent_id": 0, "symbol": "AAPL", "side": "BUY", "qty": 1.0,
+                                       "price": 150.1235, "timestamp": "2024-01-02T15:00:00Z"}
+    assert events.trade_events([]) == []
+
+
+def test_published_events_arrive_as_sse_frames_named_by_type():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(events.EVENTS_CHANNEL)
+    pubsub.get_message()
+
+    events.publish_events([{"type": "agent_removed", "id": 3}, {"type": "evolution", "generation": 2}], redis=client)
+    messages = [pubsub.get_message(timeout=1) for _ in range(2)]
+    data = [m["data"].decode() for m in messages]
+    assert [json.loads(d) for d in data] == [{"type": "agent_removed", "id": 3}, {"type": "evolution", "generation": 2}]
+    assert events.format_sse("agent_removed", data[0]) == 'event: agent_removed\ndata: {"type":"agent_removed","id":3}\n\n'
+
+
+def test_publishing_without_redis_does_not_raise():
+    class Down:
+        def pipeline(self, transaction=True):
+            raise ConnectionError("redis down")
+
+    events.publish_events([{"type": "summary"}], redis=Down())
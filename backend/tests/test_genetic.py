@@ -0,0 +1,57 @@
+import random
+
+import genetic
+from genetic import GENES, crossover, mutate
+
+
+def _dna(**overrides):
+    dna = {"strategy": "momentum", "rsi_limit": 30, "rsi_period": 14, "stop_loss_pct": 0.05,
+           "take_profit_pct": 0.1, "max_position_size": 0.1, "watchlist": ["AAPL", "SPY"]}
+    dna.update(overrides)
+    return dna
+
+
+def test_crossover_keeps_fields_outside_the_genes():
+    a = _dna(watchlist=["NVDA"])
+    b = _dna(strategy="mean_reversion", rsi_limit=20, rsi_period=7, watchlist=["TSLA"])
+    rng = random.Random(0)
+    for _ in range(20):
+        child = crossover(a, b, rng)
+        assert child["watchlist"] == ["NVDA"]
+        assert set(child) == set(a)
+        assert all(child[name] in (a[name], b[name]) for name in GENES)
+
+
+def test_crossover_does_not_alias_the_parent():
+    a = _dna()
+    crossover(a, _dna(), random.Random(1))["rsi_limit"] = 99
+    assert a["rsi_limit"] == 30
+
+
+def _within_bounds(dna):
+    for name, (kind, low, high, _) in GENES.items():
+        if kind != "choice":
+            assert low <= dna[name] <= high, name
+
+
+def test_live_and_offline_mutation_share_bounds(monkeypatch):
+    import worker
+
+    monkeypatch.setattr(worker.random, "choice", lambda options: options[-1])
+    monkeypatch.setattr(worker.random, "uniform", lambda low, high: high)
+    dna = _dna(rsi_limit=44, rsi_period=29, stop_loss_pct=0.149)
+    for _ in range(5):
+        dna = worker.mutate_dna(dna)
+        _within_bounds(dna)
+    assert (dna["rsi_limit"], dna["rsi_period"], dna["stop_loss_pct"]) == (45, 30, 0.15)
+    assert dna["watchlist"] == ["AAPL", "SPY"]
+
+    rng = random.Random(3)
+    for _ in range(50):
+        _within_bounds(mutate(_dna(), rng, rate=1.0, scale=2.0))
+
+
+def test_clamp_gene_rounds_like_the_gene():
+    assert genetic.clamp_gene("rsi_period", 4.4) == 5
+    assert genetic.clamp_gene("rsi_limit", 22.6) == 23
+    assert genetic.clamp_gene("stop_loss_pct", 0.04567) == 0.046
@@ -0,0 +1,116 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from backtest import sma, wilder_rsi
+from indicators import IndicatorEngine, IndicatorStore, RollingSMA, WilderRSI, bar_key
+
+
+def _closes(n=300, seed=1):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+
+
+def _nan_or(value):
+    return np.nan if value is None else value
+
+
+def _assert_values_close(actual, expected):
+    assert actual.keys() == expected.keys()
+    assert actual["rsi_by_period"] == pytest.approx(expected["rsi_by_period"], rel=1e-12)
+    for key in expected.keys() - {"rsi_by_period"}:
+        assert actual[key] == pytest.approx(expected[key], rel=1e-12)
+
+
+@pytest.mark.parametrize("window", [5, 20, 50])
+def test_rolling_sma_matches_reference(window):
+    closes = _closes()
+    expected = sma(closes, window)
+    rolling = RollingSMA(window)
+    for t, price in enumerate(closes):
+        preview = rolling.preview(price)
+        rolling.update(price)
+        np.testing.assert_allclose(_nan_or(rolling.value), expected[t], rtol=1e-9)
+        np.testing.assert_allclose(_nan_or(preview), expected[t], rtol=1e-9)
+
+
+@pytest.mark.parametrize("period", [2, 14, 20])
+def test_wilder_rsi_matches_reference(period):
+    closes = _closes()
+    expected = wilder_rsi(closes, period)
+    rsi = WilderRSI(period)
+    for t, price in enumerate(closes):
+        preview = rsi.preview(price)
+        rsi.update(price)
+        np.testing.assert_allclose(_nan_or(rsi.value), expected[t], rtol=1e-9)
+        np.testing.assert_allclose(_nan_or(preview), expected[t], rtol=1e-9)
+
+
+def test_wilder_rsi_flat_prices():
+    rsi = WilderRSI(3)
+    for price in [10.0] * 5:
+        rsi.update(price)
+    assert rsi.value == 50.0
+
+
+def test_bar_key_orders_bars():
+    day = datetime.datetime(2024, 3, 4, 15, 0)
+    assert bar_key(day, "1Day") == bar_key(day.replace(hour=20), "1Day")
+    assert bar_key(day + datetime.timedelta(days=1), "1Day") == bar_key(day, "1Day") + 1
+    assert bar_key(day, "5Min") == bar_key(day + datetime.timedelta(minutes=4), "5Min")
+    assert bar_key(day + datetime.timedelta(minutes=5), "5Min") == bar_key(day, "5Min") + 1
+    assert bar_key(np.datetime64("2024-03-04T15:00"), "1Hour") == bar_key(day, "1Hour")
+    with pytest.raises(ValueError):
+        bar_key(day, "1Week")
+
+
+def test_engine_closes_a_bar_only_when_the_next_one_starts():
+    closes = _closes(80)
+    start = datetime.datetime(2024, 1, 1, 20, 0)
+    timestamps = [start + datetime.timedelta(days=t) for t in range(len(closes))]
+    engine = IndicatorEngine(rsi_periods=(10,), timeframe="1Day")
+    engine.warm("AAPL", closes[:-1], timestamps[:-1])
+
+    # Intraday prices replace the open bar's close instead of adding samples
+    for price in (1.0, 500.0, closes[-2]):
+        values = engine.update("AAPL", price, timestamps[-2] + datetime.timedelta(minutes=30))
+    np.testing.assert_allclose(values["sma_20"], sma(closes[:-1], 20)[-1], rtol=1e-9)
+    np.testing.assert_allclose(values["rsi_by_period"][10], wilder_rsi(closes[:-1], 10)[-1], rtol=1e-9)
+
+    # The next day's first price closes the previous bar
+    values = engine.update("AAPL", closes[-1], timestamps[-1])
+    np.testing.assert_allclose(values["sma_50"], sma(closes, 50)[-1], rtol=1e-9)
+    np.testing.assert_allclose(values["rsi"], wilder_rsi(closes, 14)[-1], rtol=1e-9)
+
+    # Late prices for a closed bar are ignored
+    assert engine.update("AAPL", 1.0, timestamps[-2]) == values
+
+
+def test_indicator_store_round_trip(tmp_path):
+    closes = _closes(60)
+    start = datetime.datetime(2024, 1, 1)
+    engine = IndicatorEngine(rsi_periods=(10, 20), timeframe="1Day")
+    engine.warm("AAPL", closes, [start + datetime.timedelta(days=t) for t in range(len(closes))])
+    engine.warm("MSFT", closes[::-1])
+
+    store = IndicatorStore(path=str(tmp_path / "state.json"))
+    assert store.load("1Day") is None
+    store.save(engine)
+    restored = store.load("1Day")
+
+    assert restored.to_dict() == engine.to_dict()
+    # Restoring re-sums the SMA buffers, so values agree to rounding
+    for symbol in ("AAPL", "MSFT"):
+        _assert_values_close(restored.values(symbol), engine.values(symbol))
+    tick = start + datetime.timedelta(days=len(closes))
+    _assert_values_close(restored.update("AAPL", 101.0, tick), engine.update("AAPL", 101.0, tick))
+
+
+def test_indicator_store_discards_other_timeframes(tmp_path):
+    store = IndicatorStore(path=str(tmp_path / "state.json"))
+    engine = IndicatorEngine(timeframe="5Min")
+    engine.warm("AAPL", _closes(30))
+    store.save(engine)
+    assert store.load("1Day") is None
+    assert store.load("5Min") is not None
@@ -0,0 +1,122 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import database
+import leaderboard
+import market_data
+import models
+import redis_client
+
+
+class Down:
+    """A Redis client whose server is unreachable."""
+
+    def __getattr__(self, name):
+        def unavailable(*args, **kwargs):
+            raise ConnectionError("redis down")
+        return unavailable
+
+
+@pytest.fixture
+def arena_db(monkeypatch, tmp_path):
+    """Sync and async sessions on one scratch database: two active agents and a terminated one."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    url = f"sqlite:///{tmp_path / 'leaderboard.db'}"
+    engine = create_engine(url)
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add_all([
+        models.Agent(name="Alive_1", dna={}, current_cash=101000.0),
+        models.Agent(name="Alive_2", dna={}, current_cash=99000.0),
+        models.Agent(name="Gone_3", dna={}, current_cash=50000.0, status="terminated"),
+    ])
+    db.commit()
+    db.close()
+
+    # NullPool: TestClient runs each request on its own event loop
+    async_engine = create_async_engine(database.get_async_database_url(url), poolclass=NullPool)
+    AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def get_async_db():
+        async with AsyncSession() as session:
+            yield session
+
+    import main
+    main.app.dependency_overrides[database.get_async_db] = get_async_db
+    monkeypatch.setattr(leaderboard, "_local_snapshot", None)
+    monkeypatch.setattr(market_data, "_gateway", None)
+    try:
+        yield Session
+    finally:
+        main.app.dependency_overrides.clear()
+        asyncio.run(async_engine.dispose())
+        engine.dispose()
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_client, "_client", fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(redis_client, "_async_client", fakeredis.FakeAsyncRedis(server=server))
+
+
+def test_dashboard_answers_if_none_match_with_304(arena_db, fake_redis, client):
+    first = client.get("/api/dashboard/stats")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert [a["name"] for a in first.json()["agents"]] == ["Alive_1", "Alive_2"]
+
+    cached = client.get("/api/dashboard/stats", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.headers["etag"] == etag and cached.content == b""
+
+    # A cycle publishes a new version; the old tag gets the new payload
+    db = arena_db()
+    try:
+        db.query(models.Agent).filter(models.Agent.name == "Alive_2").update({"current_cash": 120000.0})
+        db.commit()
+        leaderboard.refresh_leaderboard(db, prices={"SPY": 500.0})
+    finally:
+        db.close()
+    fresh = client.get("/api/dashboard/stats", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["etag"] != etag
+    assert [a["name"] for a in fresh.json()["agents"]] == ["Alive_2", "Alive_1"]
+
+
+def test_cold_start_serves_what_it_built_when_it_cannot_be_read_back(arena_db, monkeypatch, client):
+    # Redis is down and the in-process copy has already expired by the time it is read
+    monkeypatch.setattr(redis_client, "_client", Down())
+    monkeypatch.setattr(redis_client, "_async_client", Down())
+    monkeypatch.setattr(leaderboard, "LOCAL_SNAPSHOT_TTL", -1.0)
+
+    response = client.get("/api/dashboard/stats")
+    assert response.status_code == 200
+    assert response.headers["etag"] == leaderboard.etag_for(1)
+    assert len(response.json()["agents"]) == 2
+
+
+def test_refresh_leaderboard_skips_terminated_agents(arena_db, fake_redis):
+    db = arena_db()
+    try:
+        snapshot = leaderboard.refresh_leaderboard(db, prices={"SPY": 500.0})
+    finally:
+        db.close()
+    payload = json.loads(snapshot["payload"])
+    assert {a["name"] for a in payload["agents"]} == {"Alive_1", "Alive_2"}
+    assert payload["total_pnl_usd"] == 0.0
+    assert leaderboard.load_leaderboard() == snapshot
@@ -0,0 +1,134 @@
+import pytest
+
+import market_data
+from market_data import MarketDataGateway, MockBackend, QuoteCache, RateLimiter, build_gateway
+
+
+class FakeClock:
+    """Stands in for time.time/monotonic/sleep; sleeping advances the clock."""
+
+    def __init__(self, now=6000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(market_data.time, "time", clock.time)
+    monkeypatch.setattr(market_data.time, "monotonic", clock.time)
+    monkeypatch.setattr(market_data.time, "sleep", clock.sleep)
+    return clock
+
+
+@pytest.fixture
+def redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis()
+
+
+def test_local_rate_limit_refills_per_minute(clock):
+    limiter = RateLimiter(per_minute=60)
+    for _ in range(60):
+        limiter.acquire()
+    assert clock.sleeps == []
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_shared_rate_limit_waits_for_the_next_window(clock, redis):
+    limiter = RateLimiter(per_minute=3, redis=redis)
+    other = RateLimiter(per_minute=3, redis=redis)  # another process, same budget
+    limiter.acquire()
+    other.acquire()
+    limiter.acquire()
+    assert clock.sleeps == []
+
+    clock.now += 15
+    other.acquire()
+    assert clock.sleeps == [45.0]  # 6015 -> the window starting at 6060
+    assert int(redis.get(market_data.RATE_KEY.format(101))) == 1
+
+
+def test_shared_rate_limit_falls_back_to_local(clock):
+    class Down:
+        def pipeline(self):
+            raise ConnectionError("redis down")
+
+    limiter = RateLimiter(per_minute=2, redis=Down())
+    limiter.acquire()
+    assert limiter.redis is None
+    limiter.acquire()
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(30.0)
+
+
+def test_quote_cache_expires_after_ttl(clock):
+    cache = QuoteCache(ttl=2.0)
+    cache.set_many({"AAPL": 190.0})
+    assert cache.get_many(["AAPL", "SPY"]) == {"AAPL": 190.0}
+    clock.now += 1.9
+    assert cache.get_many(["AAPL"]) == {"AAPL": 190.0}
+    clock.now += 0.2
+    assert cache.get_many(["AAPL"]) == {}
+
+
+def test_quote_cache_is_shared_through_redis(clock, redis):
+    QuoteCache(ttl=2.0, redis=redis).set_many({"AAPL": 190.0})
+    assert QuoteCache(ttl=2.0, redis=redis).get_many(["AAPL", "SPY"]) == {"AAPL": 190.0}
+    assert redis.pttl(market_data.QUOTE_KEY.format("AAPL")) <= 2000
+
+
+def test_gateway_fetches_only_cache_misses(clock):
+    backend = MockBackend(seed=1)
+    gateway = MarketDataGateway(backend, QuoteCache(ttl=2.0), RateLimiter(per_minute=100))
+
+    first = gateway.get_prices(["AAPL", "SPY", "AAPL"])
+    assert set(first) == {"AAPL", "SPY"} and backend.requests == 1
+    assert gateway.get_prices(["SPY", "AAPL"]) == first
+    assert backend.requests == 1
+
+    gateway.get_prices(["AAPL", "MSFT"])
+    assert backend.requests == 2
+    clock.now += 3
+    gateway.get_prices(["AAPL"])
+    assert backend.requests == 3
+
+
+def test_gateway_survives_backend_errors(clock):
+    class Failing:
+        def fetch(self, symbols, acquire=None):
+            raise ConnectionError("data api down")
+
+    cache = QuoteCache(ttl=2.0)
+    cache.set_many({"AAPL": 190.0})
+    assert MarketDataGateway(Failing(), cache).get_prices(["AAPL", "SPY"]) == {"AAPL": 190.0}
+
+
+def test_gateway_defaults_to_the_mock_backend_without_keys(monkeypatch):
+    monkeypatch.delenv("ALPACA_API_KEY", raising=False)
+    monkeypatch.delenv("ALPACA_SECRET_KEY", raising=False)
+    monkeypatch.delenv("MARKET_DATA_BACKEND", raising=False)
+    gateway = build_gateway()
+    assert isinstance(gateway.backend, MockBackend)
+    assert gateway.get_price("AAPL") > 0
+
+
+def test_get_gateway_without_redis_uses_the_local_cache(monkeypatch):
+    import redis_client
+
+    def unavailable():
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(redis_client, "get_redis", unavailable)
+    monkeypatch.setattr(market_data, "_gateway", None)
+    gateway = market_data.get_gateway()
+    assert gateway.cache.redis is None and gateway.rate_limiter.redis is None
+    assert market_data.get_gateway() is gateway
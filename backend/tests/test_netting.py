@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+import netting
+from netting import Fill, SimulatedBroker, allocate_from, allocate_pro_rata, allocation_rows, net_order, settle
+
+
+@pytest.mark.parametrize("total, requested, expected", [
+    (10, [5, 5], [5, 5]),          # enough for everyone
+    (12, [5, 5], [5, 5]),          # never above a request
+    (0, [3, 4], [0, 0]),
+    (-2, [3, 4], [0, 0]),
+    (5, [3, 3, 3], [2, 2, 1]),     # equal remainders go to the earlier intents
+    (7, [1, 2, 7], [1, 1, 5]),     # largest remainders: 0.7, 1.4, 4.9
+    (1, [1, 1, 1, 1], [1, 0, 0, 0]),
+])
+def test_allocate_pro_rata(total, requested, expected):
+    np.testing.assert_array_equal(allocate_pro_rata(total, requested), expected)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_allocate_pro_rata_invariants(seed):
+    rng = np.random.default_rng(seed)
+    requested = rng.integers(0, 100, 25)
+    total = int(rng.integers(0, requested.sum() + 1))
+    shares = allocate_pro_rata(total, requested)
+    assert shares.sum() == total
+    assert (shares <= requested).all() and (shares >= 0).all()
+    # Each intent gets its exact share rounded down or up
+    exact = requested * total / requested.sum()
+    assert (shares >= np.floor(exact)).all() and (shares <= np.floor(exact) + 1).all()
+
+
+def _trade(agent_id, symbol, side, qty, price=100.0):
+    return {"agent_id": agent_id, "symbol": symbol, "side": side, "qty": qty, "price": price}
+
+
+def test_net_order_crosses_opposing_intents():
+    order = net_order("AAPL", [_trade(1, "AAPL", "BUY", 10), _trade(2, "AAPL", "SELL", 4, 110.0)])
+    assert (order.side, order.qty, order.buy_qty, order.sell_qty) == ("BUY", 6, 10, 4)
+    assert order.reference_price == pytest.approx((10 * 100 + 4 * 110) / 14)
+    assert net_order("AAPL", [_trade(1, "AAPL", "BUY", 3), _trade(2, "AAPL", "SELL", 3)]).side is None
+
+
+class PartialBroker:
+    """Fills `ratio` of every order at a fixed price."""
+
+    def __init__(self, ratio, price):
+        self.ratio = ratio
+        self.price = price
+        self.orders = []
+
+    def submit_many(self, orders):
+        self.orders += orders
+        return {o.symbol: Fill(None, o.symbol, o.side, int(o.qty * self.ratio), self.price) for o in orders}
+
+
+def test_settle_allocates_partial_fills_to_the_net_side():
+    trades = [
+        _trade(1, "AAPL", "BUY", 5),
+        _trade(2, "AAPL", "BUY", 5),
+        _trade(3, "AAPL", "SELL", 2),
+        _trade(4, "MSFT", "SELL", 3, 50.0),
+    ]
+    broker = PartialBroker(0.5, 101.0)
+    allocated, orders = settle(trades, broker)
+
+    assert [(o.symbol, o.side, o.qty) for o in broker.orders] == [("AAPL", "BUY", 8), ("MSFT", "SELL", 3)]
+    # AAPL: 2 crossed + 4 filled split over the buys; the sell crosses in full
+    assert [t["qty"] for t in allocated] == [3, 3, 2, 1]
+    reference = orders[0][0].reference_price
+    assert allocated[0]["price"] == pytest.approx((2 * reference + 4 * 101.0) / 6)
+    assert allocated[2]["price"] == reference
+    assert allocated[3]["price"] == 101.0  # nothing crossed: all at the fill price
+
+
+def test_settle_leaves_intents_unfilled_when_the_broker_fails():
+    class Failing:
+        def submit_many(self, orders):
+            raise ConnectionError("broker down")
+
+    allocated, orders = settle([_trade(1, "AAPL", "BUY", 5)], Failing())
+    assert allocated[0]["qty"] == 0
+    assert orders[0][1] is None
+
+
+def test_allocate_from_matches_settle():
+    trades = [_trade(i, s, "BUY" if i % 3 else "SELL", 1 + i % 7) for i in range(30) for s in ("AAPL", "SPY")]
+    allocated, _ = settle(trades, SimulatedBroker(fill_ratio=0.6, seed=1))
+    rows = allocation_rows(allocated)
+
+    # One shard's intents, in any order, get the same allocations back
+    shard = [t for t in trades if t["agent_id"] < 10][::-1]
+    expected = {(t["agent_id"], t["symbol"]): (t["qty"], t["price"]) for t in allocated}
+    for t in allocate_from(shard, [row for row in rows if row[0] < 10]):
+        assert (t["qty"], t["price"]) == expected[(t["agent_id"], t["symbol"])]
+
+
+def test_allocate_from_leaves_unrouted_intents_unfilled():
+    trades = [_trade(1, "AAPL", "BUY", 5), _trade(2, "AAPL", "BUY", 5)]
+    allocated = allocate_from(trades, [[1, "AAPL", 4, 99.0], [2, "MSFT", 0, 99.0]])
+    assert [(t["qty"], t["price"]) for t in allocated] == [(4, 99.0), (0, 100.0)]
+
+
+def test_allocate_from_rejects_allocations_without_an_intent():
+    with pytest.raises(ValueError, match="no matching intent"):
+        allocate_from([_trade(1, "AAPL", "BUY", 5)], [[1, "AAPL", 4, 99.0], [9, "AAPL", 3, 99.0]])
+
+
+def test_get_broker_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("ORDER_ROUTING", raising=False)
+    assert netting.get_broker() is None
@@ -0,0 +1,53 @@
+import datetime
+import statistics
+
+import pytest
+
+import models
+import performance
+
+START = datetime.datetime(2024, 1, 2, 15, 0)
+# (trades, equity) per cycle
+CYCLES = [
+    ([("BUY", 10, 100.0)], 100000.0),
+    ([("BUY", 10, 110.0)], 110000.0),
+    ([("SELL", 15, 120.0)], 99000.0),   # FIFO: 10 @ 100 + 5 @ 110 -> +250, a win
+    ([("SELL", 5, 100.0)], 120000.0),   # the last 5 @ 110 -> -50, a loss
+    ([], 108000.0),
+]
+
+
+def _run_cycles(db, agent_id):
+    for k, (fills, equity) in enumerate(CYCLES):
+        at = START + datetime.timedelta(minutes=5 * k)
+        trades = [{"agent_id": agent_id, "symbol": "AAPL", "side": side, "qty": qty, "price": price, "timestamp": at}
+                  for side, qty, price in fills]
+        db.add_all(models.Trade(**t) for t in trades)
+        db.add(models.PortfolioSnapshot(agent_id=agent_id, timestamp=at, total_equity=equity, cash=0.0, pnl=0.0))
+        performance.update(db, trades, [{"agent_id": agent_id, "total_equity": equity}])
+        db.commit()
+
+
+def test_incremental_metrics_match_closed_form_and_rebuild(db):
+    agent = models.Agent(name="A", dna={})
+    db.add(agent)
+    db.commit()
+    _run_cycles(db, agent.id)
+
+    summary = performance.summarize(db.get(models.AgentMetrics, agent.id), periods_per_year=1)
+    equity = [e for _, e in CYCLES]
+    returns = [b / a - 1 for a, b in zip(equity, equity[1:])]
+    assert summary["sharpe"] == pytest.approx(round(statistics.mean(returns) / statistics.stdev(returns), 3))
+    assert summary["max_drawdown_pct"] == pytest.approx(10.0)  # 110000 -> 99000
+    assert summary["drawdown_pct"] == pytest.approx(10.0)  # 120000 -> 108000
+    assert (summary["win_rate"], summary["closed_trades"], summary["realized_pnl_usd"]) == (50.0, 2, 200.0)
+
+    # Rebuilding from the stored history lands on the same state
+    performance.rebuild(db)
+    db.commit()
+    db.expire_all()
+    assert performance.summarize(db.get(models.AgentMetrics, agent.id), periods_per_year=1) == summary
+
+
+def test_summary_without_history():
+    assert performance.summarize(None)["win_rate"] is None
@@ -0,0 +1,63 @@
+import datetime
+
+from sqlalchemy import event
+
+import benchmark
+import models
+import persistence
+from population import Population
+
+SYMBOLS = ["AAPL", "MSFT", "SPY"]
+NOW = datetime.datetime(2024, 1, 2, 15, 0)
+
+
+def _load(db):
+    agents = db.query(models.Agent.id, models.Agent.dna, models.Agent.current_cash).order_by(models.Agent.id).all()
+    positions = db.query(models.Position.agent_id, models.Position.symbol, models.Position.qty,
+                         models.Position.avg_price).all()
+    return Population.from_agents(agents, positions, SYMBOLS)
+
+
+def test_persist_cycle_updates_only_agents_that_traded(db):
+    benchmark.generate_population(db, 80, symbols=SYMBOLS)
+    db.commit()
+    before = dict(db.query(models.Agent.id, models.Agent.current_cash))
+    population = _load(db)
+    snapshot = benchmark.market_snapshot(SYMBOLS, seed=3)
+    trades = population.step(snapshot, timestamp=NOW)
+    traded = {t["agent_id"] for t in trades}
+    assert traded and len(traded) < len(before)
+
+    updated = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("UPDATE AGENTS"):
+            updated.extend(parameters if executemany else [parameters])
+
+    engine = db.get_bind()
+    event.listen(engine, "after_cursor_execute", capture)
+    try:
+        prices = {s: d["price"] for s, d in snapshot.items()}
+        rows = persistence.persist_cycle(db, population, trades, prices=prices, timestamp=NOW)
+        db.commit()
+    finally:
+        event.remove(engine, "after_cursor_execute", capture)
+
+    assert rows["trades"] == len(trades) == db.query(models.Trade).count()
+    assert rows["agents"] == len(traded) == len(updated)
+    assert rows["snapshots"] == len(before) == db.query(models.PortfolioSnapshot).count()
+
+    after = dict(db.query(models.Agent.id, models.Agent.current_cash))
+    assert {a for a in after if after[a] != before[a]} == traded
+    assert all(after[int(a)] == population.cash_of(i) for i, a in enumerate(population.agent_ids))
+
+    # The stored positions reload into the same population state
+    reloaded = _load(db)
+    assert (reloaded.qty == population.qty).all()
+
+
+def test_persist_cycle_without_trades_writes_nothing(db):
+    benchmark.generate_population(db, 10, symbols=SYMBOLS)
+    db.commit()
+    rows = persistence.persist_cycle(db, _load(db), [])
+    assert rows == {"trades": 0, "agents": 0, "metrics": 0, "positions": 0}
@@ -0,0 +1,109 @@
+import collections
+import datetime
+import random
+
+import numpy as np
+import pytest
+
+from agent import TradingAgent
+from backtest import random_dna
+from population import Population
+from positions import PositionBook
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "SPY", "TSLA"]
+PositionRow = collections.namedtuple("PositionRow", ["agent_id", "symbol", "qty", "avg_price"])
+
+
+def _snapshot(rng, base):
+    snapshot = {}
+    for symbol in SYMBOLS:
+        price = base[symbol] * rng.uniform(0.85, 1.15)
+        snapshot[symbol] = {
+            "symbol": symbol,
+            "price": price,
+            "rsi": rng.uniform(10, 90),
+            "rsi_by_period": {p: rng.uniform(10, 90) for p in range(10, 21)},
+            "sma_20": price * rng.uniform(0.95, 1.05),
+            "sma_50": price * rng.uniform(0.95, 1.05),
+        }
+    return snapshot
+
+
+def _population(n, seed):
+    rng = random.Random(seed)
+    dnas = [random_dna(rng) for _ in range(n)]
+    for dna in dnas[::5]:
+        dna["watchlist"] = rng.sample(SYMBOLS, 2)
+    dnas[1] = {}  # all defaults
+    cash = [rng.uniform(5000, 150000) for _ in range(n)]
+    rows = [
+        PositionRow(i, symbol, rng.randint(1, 50), rng.uniform(80, 220))
+        for i in range(n) for symbol in SYMBOLS if rng.random() < 0.3
+    ]
+    return dnas, cash, rows
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_step_matches_trading_agent(seed):
+    n = 60
+    dnas, cash, rows = _population(n, seed)
+    by_agent = collections.defaultdict(list)
+    for row in rows:
+        by_agent[row.agent_id].append(row)
+
+    agents = []
+    for i in range(n):
+        agent = TradingAgent(i, dnas[i])
+        agent.portfolio_value = cash[i]
+        agent.positions = PositionBook.from_rows(by_agent[i])
+        agents.append(agent)
+    population = Population(
+        list(range(n)), dnas, cash, [[(r.symbol, r.qty, r.avg_price) for r in by_agent[i]] for i in range(n)],
+        SYMBOLS,
+    )
+
+    rng = random.Random(seed)
+    base = {symbol: rng.uniform(100, 200) for symbol in SYMBOLS}
+    for _ in range(20):
+        snapshot = _snapshot(rng, base)
+        trades = population.step(snapshot)
+
+        expected = []
+        for agent in agents:
+            agent.pending_trades = []
+            for symbol in SYMBOLS:
+                agent.execute_logic(snapshot[symbol])
+            expected += [(agent.agent_id, t["symbol"], t["side"], t["qty"], t["price"]) for t in agent.pending_trades]
+        assert [(t["agent_id"], t["symbol"], t["side"], t["qty"], t["price"]) for t in trades] == expected
+
+    np.testing.assert_allclose(population.cash, [a.portfolio_value for a in agents])
+    np.testing.assert_array_equal(
+        population.qty, [[a.positions.qty(symbol) for symbol in SYMBOLS] for a in agents]
+    )
+
+
+def test_step_only_evaluates_requested_symbols():
+    dnas, cash, rows = _population(30, seed=3)
+    positions = [[(r.symbol, r.qty, r.avg_price) for r in rows if r.agent_id == i] for i in range(30)]
+    snapshot = _snapshot(random.Random(3), {symbol: 150.0 for symbol in SYMBOLS})
+
+    now = datetime.datetime(2024, 1, 2, 15, 0)
+    only = Population(list(range(30)), dnas, cash, positions, SYMBOLS).step({"NVDA": snapshot["NVDA"]}, timestamp=now)
+    one = Population(list(range(30)), dnas, cash, positions, SYMBOLS).step(snapshot, timestamp=now, symbols=["NVDA"])
+    assert one and one == only
+
+
+def test_apply_trades_replays_step():
+    dnas, cash, rows = _population(40, seed=4)
+    positions = [[(r.symbol, r.qty, r.avg_price) for r in rows if r.agent_id == i] for i in range(40)]
+    snapshot = _snapshot(random.Random(4), {symbol: 150.0 for symbol in SYMBOLS})
+    stepped = Population(list(range(40)), dnas, cash, positions, SYMBOLS)
+    trades = stepped.step(snapshot)
+
+    replayed = Population(list(range(40)), dnas, cash, positions, SYMBOLS)
+    replayed.apply_trades(trades)
+    assert trades
+    np.testing.assert_allclose(replayed.cash, stepped.cash)
+    np.testing.assert_array_equal(replayed.qty, stepped.qty)
+    np.testing.assert_array_equal(replayed.avg_price, stepped.avg_price)
+    np.testing.assert_array_equal(replayed.dirty_cells, stepped.dirty_cells)
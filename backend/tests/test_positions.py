@@ -0,0 +1,46 @@
+from sqlalchemy.orm import sessionmaker
+
+import models
+import positions
+
+
+def _legacy_agents(db):
+    agents = [
+        models.Agent(name="Legacy", dna={}, current_positions={"AAPL": 10, "AAPL_avg_price": 150.0, "SPY": 0}),
+        models.Agent(name="Fresh", dna={}),
+    ]
+    db.add_all(agents)
+    db.commit()
+    return agents
+
+
+def test_startup_migration_runs_once(db, monkeypatch):
+    monkeypatch.setattr(positions, "_legacy_migrated", False)
+    legacy, fresh = _legacy_agents(db)
+    factory = sessionmaker(bind=db.get_bind())
+
+    assert positions.migrate_legacy_positions(factory) == 1
+    rows = db.query(models.Position).all()
+    assert [(p.agent_id, p.symbol, p.qty, p.avg_price) for p in rows] == [(legacy.id, "AAPL", 10, 150.0)]
+    db.expire_all()
+    assert legacy.current_positions is None and fresh.current_positions is None
+
+    # Later startups probe once and find nothing
+    monkeypatch.setattr(positions, "_legacy_migrated", False)
+    assert positions.migrate_legacy_positions(factory) == 0
+    assert positions._legacy_migrated
+
+
+def test_agent_response_keeps_current_positions(db):
+    from main import AgentResponse
+
+    agent = models.Agent(name="A", dna={"strategy": "momentum", "rsi_period": 14, "stop_loss_pct": 0.05,
+                                         "take_profit_pct": 0.1}, current_cash=1000.0, status="active", generation=1)
+    agent.positions = [models.Position(symbol="AAPL", qty=10, avg_price=150.0)]
+    db.add(agent)
+    db.commit()
+
+    body = AgentResponse.model_validate(agent).model_dump()
+    assert body["positions"] == [{"symbol": "AAPL", "qty": 10.0, "avg_price": 150.0}]
+    assert body["current_positions"] == {"AAPL": 10.0, "AAPL_avg_price": 150.0}
+    assert positions.parse_legacy_positions(body["current_positions"]) == [("AAPL", 10.0, 150.0)]
@@ -0,0 +1,61 @@
+import pytest
+
+import benchmark
+import database
+import models
+import robustness
+from backtest import SyntheticPriceSource, random_dna
+
+
+@pytest.fixture
+def history(monkeypatch):
+    """Synthetic daily bars instead of the bar store, and a handful of short paths."""
+    monkeypatch.setattr(robustness, "load_history", lambda symbols, bars=252: SyntheticPriceSource(
+        symbols, bars=120, seed=7).load())
+    monkeypatch.setenv("ROBUSTNESS_PATHS", "8")
+
+
+def _agents(db, n, seed=0):
+    import random
+
+    rng = random.Random(seed)
+    db.add_all(models.Agent(name=f"R{i}", dna=random_dna(rng), current_cash=100000.0) for i in range(n))
+    db.commit()
+
+
+@pytest.mark.parametrize("n", [3, 6, 12])
+def test_robust_rank_top_and_bottom_are_disjoint(db, history, n):
+    _agents(db, n)
+    top, bottom = robustness.robust_rank(db, ["AAPL", "SPY"], k=4, seed=1)
+
+    assert len(top) == min(4, n) and len(bottom) == min(4, max(0, n - 4))
+    assert not {i for i, _ in top} & {i for i, _ in bottom}
+    fitness = [f for _, f in top + bottom]
+    assert fitness == sorted(fitness, reverse=True)
+
+
+def test_evolve_agents_with_robust_fitness(arena, history, monkeypatch):
+    db = database.SessionLocal()
+    try:
+        benchmark.generate_population(db, 12, symbols=["AAPL", "SPY"])
+    finally:
+        db.close()
+    monkeypatch.setattr(arena, "EVOLVE_FITNESS", "robust")
+    ranked = []
+    rank = robustness.robust_rank
+    monkeypatch.setattr(robustness, "robust_rank", lambda *a, **kw: ranked.append(rank(*a, **kw)) or ranked[-1])
+
+    arena.evolve_agents()
+
+    assert len(ranked) == 1
+    top, bottom = ranked[0]
+    db = database.SessionLocal()
+    try:
+        status = dict(db.query(models.Agent.id, models.Agent.status))
+        children = db.query(models.Agent).filter(models.Agent.generation == 2).all()
+    finally:
+        db.close()
+    # The robust bottom 4 are retired, not the equity bottom 4
+    assert sorted(i for i, s in status.items() if s == "terminated") == sorted(i for i, _ in bottom)
+    assert all(status[i] == "active" for i, _ in top)
+    assert len(children) == 4
@@ -0,0 +1,123 @@
+import datetime
+import time
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import scheduler
+
+
+class FakeTask:
+    def __init__(self, name="run_market_cycle"):
+        self.name = name
+        self.queued = []
+
+    def apply_async(self, kwargs=None, countdown=None):
+        self.queued.append((kwargs, countdown))
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(scheduler, "get_redis", lambda: client)
+    monkeypatch.setattr(scheduler, "TRADING_MODE", "cycles")
+    return client
+
+
+def _stats(redis, name="run_market_cycle"):
+    return {k.decode(): v.decode() for k, v in redis.hgetall(scheduler.STATS_KEY.format(name)).items()}
+
+
+def test_cycle_lock_admits_one_holder(redis):
+    first, second = scheduler.CycleLock(), scheduler.CycleLock()
+    assert first.acquire()
+    assert not second.acquire()
+    second.release()  # not the holder: a no-op
+    assert redis.get(scheduler.LOCK_KEY) == first.token.encode()
+    first.ensure()
+
+    first.release()
+    assert second.acquire()
+    second.release()
+    assert not redis.exists(scheduler.LOCK_KEY)
+
+
+def test_a_lock_taken_over_is_lost_before_commit(redis):
+    lock = scheduler.CycleLock()
+    assert lock.acquire()
+    redis.set(scheduler.LOCK_KEY, "someone-else")  # expired and re-acquired elsewhere
+    with pytest.raises(scheduler.LockLost):
+        lock.ensure()
+    lock.release()
+    assert redis.get(scheduler.LOCK_KEY) == b"someone-else"
+
+
+def test_triggers_coalesce_while_a_run_is_pending(redis):
+    task = FakeTask()
+    assert scheduler.trigger(task)
+    assert not scheduler.trigger(task)
+    assert not scheduler.trigger(task, source="beat")
+    assert len(task.queued) == 1
+    assert scheduler.pending(task.name)
+    assert _stats(redis)["skipped_coalesced"] == "2"
+
+    # The run starting clears the marker, so the next trigger queues again
+    lock = scheduler.begin(task, task.queued[0][0]["triggered_at"])
+    assert lock is not None and not scheduler.pending(task.name)
+    assert scheduler.trigger(task)
+    lock.release()
+
+
+def test_a_run_behind_the_lock_is_requeued_and_keeps_absorbing_triggers(redis):
+    task = FakeTask("evolve_agents")
+    holder = scheduler.CycleLock()
+    holder.acquire()
+    scheduler.trigger(task)
+    triggered_at = task.queued[0][0]["triggered_at"]
+
+    assert scheduler.begin(task, triggered_at, retry_kwargs={"ranking": [[1, 0.5]]}) is None
+    assert task.queued[1] == ({"triggered_at": triggered_at, "ranking": [[1, 0.5]]}, scheduler.LOCK_RETRY)
+    assert scheduler.pending(task.name)
+    assert not scheduler.trigger(task)
+    holder.release()
+
+    # Unscheduled runs only take the lock, and skip when it is held
+    other = scheduler.CycleLock()
+    other.acquire()
+    assert scheduler.begin(task) is None
+    assert _stats(redis, task.name)["last_skip"] == "locked"
+    other.release()
+
+
+def test_stale_runs_are_dropped(redis):
+    task = FakeTask()
+    scheduler.trigger(task)
+    late = time.time() - scheduler.MAX_LAG[task.name] - 1
+    redis.set(scheduler.PENDING_KEY.format(task.name), repr(late))
+    assert scheduler.begin(task, late) is None
+    assert not scheduler.pending(task.name)
+    assert _stats(redis)["last_skip"] == "stale"
+    assert not redis.exists(scheduler.LOCK_KEY)
+
+
+def test_ticks_mode_never_queues_market_cycles(redis, monkeypatch):
+    monkeypatch.setattr(scheduler, "TRADING_MODE", "ticks")
+    cycle, evolve = FakeTask(), FakeTask("evolve_agents")
+    assert not scheduler.trigger(cycle) and cycle.queued == []
+    assert scheduler.trigger(evolve)
+
+
+@pytest.mark.parametrize("local, is_open", [
+    (datetime.datetime(2024, 1, 3, 10, 0), True),
+    (datetime.datetime(2024, 1, 3, 9, 29), False),
+    (datetime.datetime(2024, 1, 3, 16, 0), False),
+    (datetime.datetime(2024, 1, 6, 12, 0), False),  # Saturday
+    (datetime.datetime(2024, 7, 4, 12, 0), False),  # holiday
+])
+def test_market_hours(monkeypatch, local, is_open):
+    monkeypatch.setattr(scheduler, "MARKET_HOURS_ONLY", True)
+    monkeypatch.setattr(scheduler, "MARKET_HOLIDAYS", {"2024-07-04"})
+    now = local.replace(tzinfo=ZoneInfo(scheduler.MARKET_TIMEZONE)).astimezone(datetime.timezone.utc)
+    assert scheduler.market_open(now) is is_open
@@ -0,0 +1,96 @@
+import asyncio
+import datetime
+
+import benchmark
+import database
+import models
+import scheduler
+from ticks import ReplayFeed, Tick, TickPipeline
+
+START = datetime.datetime(2024, 1, 2, 14, 30)
+
+
+def _populate(agents=40):
+    db = database.SessionLocal()
+    try:
+        benchmark.generate_population(db, agents, symbols=["AAPL", "SPY"])
+    finally:
+        db.close()
+
+
+def _count(model):
+    db = database.SessionLocal()
+    try:
+        return db.query(model).count()
+    finally:
+        db.close()
+
+
+def _write_replay(path, rows):
+    path.write_text("timestamp,symbol,price\n" + "".join(f"{t.isoformat()}Z,{s},{p}\n" for t, s, p in rows))
+    return str(path)
+
+
+def test_replay_feed_trades_and_flushes_everything(arena, tmp_path):
+    _populate()
+    # A slide then a rally, so RSI crosses both mean reversion thresholds
+    rows = []
+    for k in range(120):
+        price = 150.0 * (0.99 ** k if k < 60 else 0.99 ** 60 * 1.012 ** (k - 60))
+        rows.append((START + datetime.timedelta(seconds=k), "AAPL", round(price, 2)))
+        rows.append((START + datetime.timedelta(seconds=k), "MSFT", 400.0))  # not traded here: skipped
+    pipeline = TickPipeline(["AAPL", "SPY"], flush_interval=0.01, snapshot_interval=0.0, leaderboard_interval=0.0)
+
+    stats = asyncio.run(pipeline.run(ReplayFeed(_write_replay(tmp_path / "ticks.csv", rows), speed=0)))
+
+    assert stats["evaluated"] + stats["coalesced"] == 120
+    assert stats["trades"] > 0 and _count(models.Trade) == stats["trades"]
+    assert _count(models.PortfolioSnapshot) >= 40
+    assert scheduler.CycleLock().acquire()  # released on the way out
+
+
+def test_replay_feed_paces_and_filters(tmp_path):
+    rows = [(START, "AAPL", 1.0), (START, "SPY", 2.0), (START + datetime.timedelta(seconds=1), "AAPL", 3.0)]
+    feed = ReplayFeed(_write_replay(tmp_path / "ticks.csv", rows), symbols=["AAPL"], speed=100)
+
+    async def collect():
+        return [tick async for tick in feed.ticks()]
+
+    ticks = asyncio.run(collect())
+    assert [(t.symbol, t.price, t.timestamp) for t in ticks] == [
+        ("AAPL", 1.0, START), ("AAPL", 3.0, START + datetime.timedelta(seconds=1))]
+
+
+def test_snapshots_at_the_same_tick_timestamp_replace_each_other(arena):
+    _populate()
+    pipeline = TickPipeline(["AAPL", "SPY"])
+    pipeline.load()
+
+    def tick(symbol, price):
+        return Tick(symbol, price, START, 0.0)
+
+    async def flushes():
+        pipeline._flush_lock = asyncio.Lock()
+        pipeline.on_tick(tick("AAPL", 150.0))
+        first = await pipeline.flush(snapshot=True)
+        pipeline.on_tick(tick("SPY", 480.0))  # same second, new prices
+        second = await pipeline.flush(snapshot=True)
+        third = await pipeline.flush(snapshot=True)  # no ticks since: nothing to write
+        return first, second, third
+
+    try:
+        first, second, third = asyncio.run(flushes())
+    finally:
+        pipeline._executor.shutdown()
+    assert first["snapshots"] == second["snapshots"] == 40
+    assert third == {}
+
+    db = database.SessionLocal()
+    try:
+        rows = db.query(models.PortfolioSnapshot).all()
+    finally:
+        db.close()
+    assert len(rows) == 40 and {r.timestamp for r in rows} == {START}
+    equity = pipeline.population.equity({"AAPL": 150.0, "SPY": 480.0})
+    stored = {r.agent_id: r.total_equity for r in rows}
+    assert [stored[int(a)] for a in pipeline.population.agent_ids] == [float(e) for e in equity]
@@ -0,0 +1,47 @@
+import datetime
+
+import models
+from timescale import _bucket, equity_curve, setup_timescale
+
+START = datetime.datetime(2024, 1, 2, 13, 0)
+
+
+def _snapshots(db, agent_id, points):
+    db.add_all(
+        models.PortfolioSnapshot(agent_id=agent_id, timestamp=START + datetime.timedelta(minutes=m),
+                                 total_equity=equity, cash=equity / 2, pnl=0.0)
+        for m, equity in points
+    )
+    db.commit()
+
+
+def test_equity_curve_buckets_raw_snapshots_newest_first(db):
+    agent = models.Agent(name="A", dna={})
+    other = models.Agent(name="B", dna={})
+    db.add_all([agent, other])
+    db.commit()
+    _snapshots(db, agent.id, [(0, 100.0), (20, 130.0), (40, 90.0), (59, 110.0), (60, 111.0), (150, 120.0)])
+    _snapshots(db, other.id, [(10, 5.0)])
+
+    curve = equity_curve(db, agent.id, interval="hour")
+    assert [row["bucket"] for row in curve] == [START + datetime.timedelta(hours=h) for h in (2, 1, 0)]
+    assert curve[2] == {"bucket": START, "open": 100.0, "high": 130.0, "low": 90.0, "close": 110.0, "cash": 55.0}
+    assert curve[1] == {"bucket": START + datetime.timedelta(hours=1), "open": 111.0, "high": 111.0,
+                        "low": 111.0, "close": 111.0, "cash": 55.5}
+
+    assert equity_curve(db, agent.id, interval="hour", limit=2) == curve[:2]
+    (day,) = equity_curve(db, agent.id, interval="day")
+    assert day["bucket"] == datetime.datetime(2024, 1, 2)
+    assert (day["open"], day["high"], day["low"], day["close"]) == (100.0, 130.0, 90.0, 120.0)
+    assert equity_curve(db, agent.id + 100) == []
+
+
+def test_buckets_align_on_the_epoch():
+    assert _bucket(datetime.datetime(2024, 1, 2, 13, 59, 59), 3600) == datetime.datetime(2024, 1, 2, 13)
+    assert _bucket(datetime.datetime(2024, 1, 2, 0, 0), 86400) == datetime.datetime(2024, 1, 2)
+    aware = datetime.datetime(2024, 1, 2, 13, 30, tzinfo=datetime.timezone.utc)
+    assert _bucket(aware, 3600) == datetime.datetime(2024, 1, 2, 13, tzinfo=datetime.timezone.utc)
+
+
+def test_setup_is_a_no_op_without_postgres(db):
+    assert setup_timescale(db.get_bind()) is False
@@ -0,0 +1,99 @@
+import asyncio
+import datetime
+import json
+
+import pytest
+
+import models
+import trade_history
+from database import SessionLocal, engine, get_async_engine, get_async_sessionmaker
+
+START = datetime.datetime(2024, 1, 2, 14, 30)
+
+
+@pytest.fixture(scope="module")
+def trades():
+    """Two agents' trades, with runs of equal timestamps so pages must break ties on id."""
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        agents = [models.Agent(name=f"History_{i}", dna={}) for i in range(2)]
+        db.add_all(agents)
+        db.flush()
+        rows = [
+            models.Trade(agent_id=agents[k % 2].id, symbol="AAPL", side="BUY", qty=k + 1, price=100.0 + k,
+                         timestamp=START + datetime.timedelta(minutes=k // 3))
+            for k in range(47)
+        ]
+        db.add_all(rows)
+        db.commit()
+        yield [a.id for a in agents]
+    finally:
+        db.close()
+
+
+def _run(coro):
+    async def run():
+        try:
+            return await coro
+        finally:
+            await get_async_engine().dispose()  # connections are bound to this event loop
+
+    return asyncio.run(run())
+
+
+async def _walk(agent_id, limit, descending):
+    pages = []
+    cursor = None
+    async with get_async_sessionmaker()() as db:
+        while True:
+            page = await trade_history.read_page(db, agent_id, limit=limit, cursor=cursor, descending=descending)
+            pages.append(page["trades"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("limit", [1, 5, 24, 100])
+def test_pages_cover_every_trade_once_in_order(trades, limit, descending):
+    agent_id = trades[0]
+    pages = _run(_walk(agent_id, limit, descending))
+    walked = [t for page in pages for t in page]
+
+    db = SessionLocal()
+    try:
+        order = (models.Trade.timestamp.desc(), models.Trade.id.desc()) if descending else (
+            models.Trade.timestamp, models.Trade.id)
+        expected = [t.id for t in db.query(models.Trade).filter(models.Trade.agent_id == agent_id).order_by(*order)]
+    finally:
+        db.close()
+    assert [t["id"] for t in walked] == expected
+    assert all(len(page) == limit for page in pages[:-1]) and 0 < len(pages[-1]) <= limit
+    assert {t["agent_id"] for t in walked} == {agent_id}
+
+
+def test_cursor_round_trip():
+    timestamp = datetime.datetime(2024, 5, 6, 7, 8, 9, 123456)
+    cursor = trade_history.encode_cursor(timestamp, 42)
+    assert "=" not in cursor
+    assert trade_history.decode_cursor(cursor) == (timestamp, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "bm8tc2VwYXJhdG9y"])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(ValueError):
+        trade_history.decode_cursor(cursor)
+
+
+def test_export_resumes_from_cursor(trades):
+    async def export(cursor=None):
+        body = b"".join([chunk async for chunk in trade_history.stream_ndjson(
+            trade_history.export_query(agent_id=trades[1], cursor=cursor), batch_size=7)])
+        return [json.loads(line) for line in body.decode().splitlines()]
+
+    everything = _run(export())
+    assert len(everything) == 23
+    middle = everything[10]
+    cursor = trade_history.encode_cursor(datetime.datetime.fromisoformat(middle["timestamp"].rstrip("Z")), middle["id"])
+    assert _run(export(cursor)) == everything[11:]
@@ -0,0 +1,43 @@
+import pytest
+
+import models
+import valuation
+
+
+def _agents(db, cash):
+    agents = [models.Agent(name=f"A{i}", dna={}, current_cash=c) for i, c in enumerate(cash)]
+    db.add_all(agents)
+    db.flush()
+    return agents
+
+
+def _ids(ranked):
+    return [agent.id for agent, _ in ranked]
+
+
+@pytest.mark.parametrize("n", [6, 8, 20])
+def test_top_and_bottom_never_overlap_on_equal_equity(db, n):
+    agents = _agents(db, [100000.0] * n)
+    top, bottom = valuation.top_and_bottom(db, {}, k=4)
+
+    assert not set(_ids(top)) & set(_ids(bottom))
+    assert len(top) == 4 and len(bottom) == min(4, n - 4)
+    # Ties keep id order like a stable sort: best are the first ids, worst the last
+    ids = [a.id for a in agents]
+    assert _ids(top) == ids[:4]
+    assert _ids(bottom) == ids[-len(bottom):]
+
+
+def test_top_and_bottom_mark_positions(db):
+    agents = _agents(db, [100000.0, 90000.0, 95000.0, 100000.0, 100000.0])
+    db.add_all([
+        models.Position(agent_id=agents[1].id, symbol="AAPL", qty=100, avg_price=150.0),
+        models.Position(agent_id=agents[3].id, symbol="MSFT", qty=10, avg_price=400.0),
+    ])
+    agents[4].status = "terminated"
+    db.flush()
+
+    # AAPL marked at 200: agent 1 is worth 110000; MSFT unquoted stays at cost
+    top, bottom = valuation.top_and_bottom(db, {"AAPL": 200.0}, k=2)
+    assert [(a.id, equity) for a, equity in top] == [(agents[1].id, 110000.0), (agents[3].id, 104000.0)]
+    assert [(a.id, equity) for a, equity in bottom] == [(agents[0].id, 100000.0), (agents[2].id, 95000.0)]
@@ -0,0 +1,123 @@
+import copy
+
+import pytest
+from sqlalchemy import create_engine
+
+import benchmark
+import database
+import models
+import netting
+from advisor import Advisor
+
+
+class FlipModel:
+    """Approves a prompt the first time it is asked and vetoes it afterwards."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seen = set()
+
+    async def complete(self, prompt):
+        self.calls += 1
+        verdict = "VETO" if prompt in self.seen else "APPROVE"
+        self.seen.add(prompt)
+        return verdict
+
+
+def _populate(agents=60):
+    db = database.SessionLocal()
+    try:
+        benchmark.generate_population(db, agents, symbols=["AAPL", "MSFT", "SPY"])
+    finally:
+        db.close()
+
+
+def _state():
+    db = database.SessionLocal()
+    try:
+        return {
+            "cash": sorted((a.id, round(a.current_cash, 6)) for a in db.query(models.Agent)),
+            "positions": sorted((p.agent_id, p.symbol, p.qty, round(p.avg_price, 6)) for p in db.query(models.Position)),
+            "trades": sorted((t.agent_id, t.symbol, t.side, t.qty, round(t.price, 6)) for t in db.query(models.Trade)),
+        }
+    finally:
+        db.close()
+
+
+def _routed_cycle(worker, monkeypatch, shards, advisor=None):
+    """One market cycle over a fixed snapshot with simulated partial fills."""
+    snapshot = benchmark.market_snapshot(worker.UNIVERSE, seed=3)
+    monkeypatch.setattr(worker, "CYCLE_SHARDS", shards)
+    monkeypatch.setattr(worker, "MIN_AGENTS_PER_SHARD", 5)
+    monkeypatch.setattr(worker, "broker", netting.SimulatedBroker(slippage_bps=10, fill_ratio=0.5, seed=1))
+    monkeypatch.setattr(worker, "get_advisor", lambda: advisor)
+    monkeypatch.setattr(worker, "build_market_snapshot", lambda db, universe: copy.deepcopy(snapshot))
+    worker.run_market_cycle()
+
+
+def test_routed_sharded_cycle_matches_unsharded(arena, monkeypatch, tmp_path):
+    _populate()
+    _routed_cycle(arena, monkeypatch, shards=3)
+    sharded = _state()
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'unsharded.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    database.SessionLocal.configure(bind=engine)
+    _populate()
+    _routed_cycle(arena, monkeypatch, shards=1)
+    unsharded = _state()
+    engine.dispose()
+
+    assert sharded["trades"], "the snapshot should produce trades"
+    assert sharded == unsharded
+
+
+def test_routed_sharded_cycle_decides_once(arena, monkeypatch):
+    _populate()
+    decided = []
+    decide = arena.decide
+    monkeypatch.setattr(arena, "decide", lambda *args, **kwargs: decided.append(args) or decide(*args, **kwargs))
+    model = FlipModel()
+    results = []
+    finalize = arena.finalize_market_cycle.run
+    monkeypatch.setattr(arena.finalize_market_cycle, "run", lambda r, *a: results.extend(r) or finalize(r, *a))
+
+    # A second pass would get vetoes for entries the broker already filled
+    _routed_cycle(arena, monkeypatch, shards=3, advisor=Advisor(model, cache_ttl=0))
+    assert len(decided) == 3
+    assert len(results) == 3 and not any(r.get("error") for r in results)
+    assert sum(r["rows"].get("trades", 0) for r in results) == len(_state()["trades"]) > 0
+
+
+def test_unmatched_allocation_fails_the_shard(arena, monkeypatch):
+    _populate(20)
+    snapshot = benchmark.market_snapshot(arena.UNIVERSE, seed=3)
+    db = database.SessionLocal()
+    lo, hi = db.query(models.Agent.id).order_by(models.Agent.id).first()[0], 10
+    db.close()
+
+    result = arena.run_cycle_shard(snapshot, "2024-01-02T15:00:00", lo, hi, None, [[lo, "AAPL", 5, 150.0]], [])
+    assert "no matching intent" in result["error"]
+    assert _state()["trades"] == []
+
+
+def test_keyless_mode_warms_indicators_and_trades(arena, monkeypatch):
+    from alpaca_client import AlpacaClient
+
+    monkeypatch.delenv("ALPACA_API_KEY", raising=False)
+    monkeypatch.delenv("ALPACA_SECRET_KEY", raising=False)
+    keyless = AlpacaClient()
+    monkeypatch.setattr(arena, "alpaca", keyless)
+    monkeypatch.setattr(arena.bar_store, "client", keyless)
+
+    engine = arena.load_indicator_engine(["AAPL", "SPY"], {10, 20})
+    for symbol in ("AAPL", "SPY"):
+        values = engine.values(symbol)
+        assert values["sma_50"] is not None
+        assert None not in values["rsi_by_period"].values()
+    assert engine.values("AAPL") != engine.values("SPY")
+
+    # The first cycle already trades
+    _populate()
+    arena.run_market_cycle()
+    assert _state()["trades"]
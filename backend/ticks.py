@@ -0,0 +1,518 @@
+"""
+Event-driven tick pipeline.
+
+A long-running asyncio consumer that trades on price ticks instead of
+scheduled market cycles. Ticks come from Alpaca's trade stream or, as a local
+stand-in, a replay file or a mock random walk. State stays in memory between
+ticks: each tick advances that symbol's rolling indicators by one sample and
+evaluates only that symbol's column of the population. Trades, cash and
+position changes, equity snapshots, events and the leaderboard are written
+from a background thread every flush interval, so the decision path never
+waits on the database.
+
+Tick-to-decision latency (feed receipt to decision made) is recorded into
+arena_tick_latency_seconds and reported against TICK_LATENCY_BUDGET_MS (500).
+When decisions fall behind the feed, queued ticks for the same symbol are
+coalesced to the latest price so a backlog cannot grow latency without bound.
+
+    python ticks.py --source replay --file ticks.csv --speed 10
+    python ticks.py --source mock --rate 50 --duration 60
+    python ticks.py --source alpaca --symbols AAPL,TSLA
+
+It replaces the scheduled run_market_cycle (both write cash and positions):
+set TRADING_MODE=ticks so beat and the API stop queueing cycles. While it
+runs it holds the shared cycle lock (scheduler.CycleLock), so a cycle can
+never overlap it. When an evolution is pending it flushes, hands over the
+lock and reloads the population after the evolution.
+"""
+import argparse
+import asyncio
+import collections
+import csv
+import datetime
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sqlalchemy import func
+
+import events
+import leaderboard
+import metrics
+import models
+import performance
+import persistence
+import scheduler
+import worker
+from database import SessionLocal
+from positions import upsert_positions
+
+TICK_LATENCY_BUDGET_MS = float(os.getenv("TICK_LATENCY_BUDGET_MS", "500"))
+
+Tick = collections.namedtuple("Tick", ["symbol", "price", "timestamp", "received"])
+
+
+def _parse_timestamp(value):
+    """ISO 8601 timestamp as a naive UTC datetime (the convention of the models)."""
+    timestamp = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+class ReplayFeed:
+    """
+    Ticks from a CSV file with a header: timestamp,symbol,price (a close column is
+    accepted instead of price). Rows are replayed in file order, paced by their
+    timestamps divided by `speed`; speed 0 replays as fast as the pipeline keeps up.
+    """
+
+    def __init__(self, path, symbols=None, speed=1.0):
+        self.path = path
+        self.symbols = set(symbols) if symbols else None
+        self.speed = speed
+
+    async def ticks(self):
+        previous = None
+        with open(self.path, newline="") as f:
+            for row in csv.DictReader(f):
+                symbol = row["symbol"]
+                if self.symbols and symbol not in self.symbols:
+                    continue
+                timestamp = _parse_timestamp(row["timestamp"])
+                delay = 0.0
+                if self.speed > 0 and previous is not None:
+                    delay = max(0.0, (timestamp - previous).total_seconds() / self.speed)
+                await asyncio.sleep(delay)
+                previous = timestamp
+                yield Tick(symbol, float(row.get("price") or row["close"]), timestamp, time.perf_counter())
+
+
+class MockFeed:
+    """Random-walk ticks (market_data.MockBackend) at `rate` ticks per second across `symbols`."""
+
+    def __init__(self, symbols, rate=10.0, seed=None):
+        self.symbols = list(symbols)
+        self.rate = rate
+        self.seed = seed
+
+    async def ticks(self):
+        from market_data import MockBackend
+
+        backend = MockBackend(seed=self.seed)
+        rng = random.Random(self.seed)
+        while True:
+            await asyncio.sleep(1.0 / self.rate)
+            symbol = rng.choice(self.symbols)
+            price = backend.fetch([symbol])[symbol]
+            yield Tick(symbol, price, datetime.datetime.utcnow(), time.perf_counter())
+
+
+class AlpacaStreamFeed:
+    """
+    Trade ticks from Alpaca's market data stream. The SDK runs its websocket on its
+    own event loop in a thread; ticks are handed to this loop as they arrive.
+    """
+
+    def __init__(self, symbols, api_key=None, secret_key=None, feed=None):
+        self.symbols = list(symbols)
+        self.api_key = api_key or os.getenv("ALPACA_API_KEY")
+        self.secret_key = secret_key or os.getenv("ALPACA_SECRET_KEY")
+        self.feed = feed or os.getenv("ALPACA_DATA_FEED", "iex")
+
+    async def ticks(self):
+        from alpaca_trade_api.stream import Stream
+
+        if not (self.api_key and self.secret_key):
+            raise RuntimeError("ALPACA_API_KEY and ALPACA_SECRET_KEY are required for the Alpaca stream")
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stream = Stream(
+            self.api_key, self.secret_key,
+            base_url=os.getenv("ALPACA_BASE_URL", "https://paper-api.alpaca.markets"),
+            data_feed=self.feed,
+        )
+
+        async def on_trade(trade):
+            received = time.perf_counter()
+            try:
+                timestamp = trade.timestamp.tz_convert("UTC").tz_localize(None).to_pydatetime()
+            except Exception:
+                timestamp = datetime.datetime.utcnow()
+            loop.call_soon_threadsafe(queue.put_nowait, Tick(trade.symbol, float(trade.price), timestamp, received))
+
+        stream.subscribe_trades(on_trade, *self.symbols)
+        threading.Thread(target=stream.run, name="alpaca-stream", daemon=True).start()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            stream.stop()
+
+
+class TickPipeline:
+    """
+    In-memory population and indicators driven by ticks.
+
+    pipeline = TickPipeline(["AAPL", "SPY"])
+    asyncio.run(pipeline.run(ReplayFeed("ticks.csv", speed=0)))
+    """
+
+    def __init__(self, symbols, flush_interval=1.0, snapshot_interval=60.0, leaderboard_interval=10.0,
+                 reload_interval=30.0, report_interval=60.0, latency_budget_ms=TICK_LATENCY_BUDGET_MS):
+        self.symbols = list(dict.fromkeys(symbols))
+        self._symbol_set = set(self.symbols)
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.leaderboard_interval = leaderboard_interval
+        self.reload_interval = reload_interval
+        self.report_interval = report_interval
+        self.latency_budget = latency_budget_ms / 1000.0
+
+        self.population = None
+        self.engine = None
+        self.market = {}  # symbol -> latest market data, as in a cycle snapshot
+        self.last_timestamp = None
+
+        self.latencies = collections.deque(maxlen=10000)  # seconds, most recent evaluated ticks
+        self.evaluated = 0
+        self.coalesced = 0
+        self.over_budget = 0
+        self.trade_count = 0
+
+        # Decided but not yet written; requeued when a flush fails
+        self._trades = []
+        self._pending_cash = {}  # agent_id -> cash
+        self._pending_positions = {}  # (agent_id, symbol) -> (agent_id, symbol, qty, avg_price)
+        self._ticks_since_flush = 0
+        self._roster = None
+        self._reload_due = False
+        self._yield_due = False
+        self.lock = None
+        self._flush_lock = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tick-writer")
+
+    def _roster_of(self, db):
+        """(count, max id) of active agents: changes when agents are born or terminated."""
+        return tuple(db.query(func.count(models.Agent.id), func.max(models.Agent.id))
+                     .filter(models.Agent.status == "active").one())
+
+    def check_roster(self):
+        db = SessionLocal()
+        try:
+            return self._roster_of(db) != self._roster
+        finally:
+            db.close()
+
+    def acquire_lock(self):
+        """Blocks until this pipeline holds the cycle lock (a running cycle or evolution finishes first)."""
+        lock = scheduler.CycleLock()
+        if not lock.acquire():
+            print("Tick pipeline waiting for the running cycle to release the cycle lock...")
+            while not lock.acquire():
+                time.sleep(scheduler.LOCK_RETRY)
+        self.lock = lock
+
+    def hand_over_lock(self, task="evolve_agents", timeout=60.0):
+        """Releases the cycle lock until the pending `task` has started (or `timeout`), then reclaims it."""
+        self.lock.release()
+        self.lock = None
+        deadline = time.monotonic() + timeout
+        while scheduler.pending(task) and time.monotonic() < deadline:
+            time.sleep(1.0)
+        self.acquire_lock()
+
+    def load(self):
+        """(Re)loads active agents and their positions, and restores or warms indicator state."""
+        db = SessionLocal()
+        try:
+            self.population = worker.load_population(db, self.symbols)
+            self._roster = self._roster_of(db)
+        finally:
+            db.close()
+        periods = self.population.rsi_periods.tolist() if self.population is not None else ()
+        if self.engine is None:
+            self.engine = worker.load_indicator_engine(self.symbols, periods)
+        else:
+            self.engine.ensure_periods(periods)
+        print(f"Tick pipeline loaded {len(self.population) if self.population is not None else 0} agents "
+              f"for {len(self.symbols)} symbols.")
+
+    def on_tick(self, tick):
+        """Advances the symbol's indicators and evaluates the population on that symbol. Returns the trades."""
+        indicators = self.engine.update(tick.symbol, tick.price, tick.timestamp)
+        data = {"symbol": tick.symbol, "price": tick.price, **indicators}
+        self.market[tick.symbol] = data
+        self.last_timestamp = tick.timestamp
+        self._ticks_since_flush += 1
+
+        trades = []
+        if self.population is not None:
+            trades = self.population.step({tick.symbol: data}, timestamp=tick.timestamp, symbols=[tick.symbol])
+            self._trades.extend(trades)
+            self.trade_count += len(trades)
+
+        latency = time.perf_counter() - tick.received
+        self.latencies.append(latency)
+        self.evaluated += 1
+        if latency > self.latency_budget:
+            self.over_budget += 1
+        metrics.TICK_LATENCY_SECONDS.observe(latency)
+        metrics.TICKS.labels("evaluated").inc()
+        return trades
+
+    def latency_stats(self):
+        """Percentiles (ms) over the most recent evaluated ticks, plus lifetime counters."""
+        stats = {
+            "evaluated": self.evaluated,
+            "coalesced": self.coalesced,
+            "trades": self.trade_count,
+            "over_budget": self.over_budget,
+            "budget_ms": self.latency_budget * 1000,
+        }
+        if self.latencies:
+            ms = np.asarray(self.latencies) * 1000
+            stats.update(p50_ms=float(np.percentile(ms, 50)), p99_ms=float(np.percentile(ms, 99)),
+                         max_ms=float(ms.max()))
+        return stats
+
+    def report(self):
+        s = self.latency_stats()
+        if not s["evaluated"]:
+            print("Tick pipeline: no ticks evaluated yet.")
+            return
+        print(f"Tick pipeline: {s['evaluated']} ticks evaluated, {s['coalesced']} coalesced, {s['trades']} trades; "
+              f"tick-to-decision p50 {s['p50_ms']:.2f}ms p99 {s['p99_ms']:.2f}ms max {s['max_ms']:.2f}ms, "
+              f"{s['over_budget']} over the {s['budget_ms']:.0f}ms budget.")
+
+    async def flush(self, snapshot=False, refresh=False):
+        """Hands everything decided since the last flush to the writer thread. Returns rows written."""
+        async with self._flush_lock:
+            if self.population is not None:
+                cash, positions = self.population.take_changes()
+                self._pending_cash.update(cash)
+                self._pending_positions.update({(a, s): (a, s, q, p) for a, s, q, p in positions})
+            if not (self._trades or self._pending_cash or self._pending_positions or self._ticks_since_flush):
+                return {}
+
+            trades, cash, positions = self._trades, self._pending_cash, self._pending_positions
+            self._trades, self._pending_cash, self._pending_positions = [], {}, {}
+            self._ticks_since_flush = 0
+
+            # Everything read from the loop-owned state is copied here, before leaving the loop
+            prices = {s: d["price"] for s, d in self.market.items()}
+            snapshots = []
+            if snapshot and prices and self.population is not None:
+                # Keyed on market time: a later snapshot at the same tick timestamp replaces the earlier one
+                timestamp = self.last_timestamp or datetime.datetime.utcnow()
+                snapshots = persistence.snapshot_rows(self.population, prices, timestamp)
+            indicator_state = json.dumps(self.engine.to_dict())
+
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(
+                    self._executor, self._write, trades, list(cash.items()), list(positions.values()),
+                    snapshots, indicator_state, prices if refresh else None,
+                )
+            except scheduler.LockLost:
+                raise
+            except Exception as e:
+                print(f"Error flushing tick pipeline, retrying next flush: {e}")
+                self._trades = trades + self._trades
+                self._pending_cash = {**cash, **self._pending_cash}
+                self._pending_positions = {**positions, **self._pending_positions}
+                return {}
+
+    def _write(self, trades, cash, positions, snapshots, indicator_state, prices):
+        """Writer thread: one transaction per flush, then events, indicator state and the leaderboard."""
+        db = SessionLocal()
+        try:
+            with metrics.cycle("tick_flush"):
+                with metrics.phase("persist"):
+                    rows = {
+                        "trades": persistence.write_trades(db, trades),
+                        "agents": persistence.write_agent_cash(db, cash),
+                        "metrics": performance.update(db, trades, snapshots),
+                        "positions": upsert_positions(db, positions),
+                        "snapshots": persistence.write_snapshot_rows(db, snapshots, upsert=True),
+                    }
+                with metrics.phase("commit"):
+                    if self.lock is not None:
+                        self.lock.ensure()
+                    db.commit()
+                metrics.record(agents=len(cash), trades=len(trades))
+
+                with metrics.phase("publish"):
+                    events.publish_events(events.trade_events(trades))
+                    worker.indicator_store.save_raw(indicator_state)
+                    if prices is not None:
+                        leaderboard.refresh_leaderboard(db, prices=prices)
+            return rows
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _reload(self):
+        """Picks up agents born or terminated elsewhere (e.g. evolution); ticks wait meanwhile."""
+        self._reload_due = False
+        await self.flush()
+        async with self._flush_lock:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.load)
+
+    async def _yield_lock(self):
+        """Lets a pending evolution take the cycle lock, then reclaims it and reloads agents."""
+        self._yield_due = False
+        await self.flush()
+        async with self._flush_lock:
+            loop = asyncio.get_running_loop()
+            print("Tick pipeline pausing for a pending evolution.")
+            await loop.run_in_executor(self._executor, self.hand_over_lock)
+            await loop.run_in_executor(self._executor, self.load)
+
+    async def _read(self, feed, queue):
+        try:
+            async for tick in feed.ticks():
+                queue.put_nowait(tick)
+        except Exception as e:
+            print(f"Tick feed stopped: {e}")
+        finally:
+            queue.put_nowait(None)
+
+    async def _consume(self, queue):
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            if self._yield_due:
+                await self._yield_lock()
+            elif self._reload_due:
+                await self._reload()
+
+            # Behind the feed: only the latest price per symbol is evaluated
+            latest = {}
+            finished = False
+            for tick in batch:
+                if tick is None:
+                    finished = True
+                    break
+                if tick.symbol not in self._symbol_set:
+                    continue
+                if tick.symbol in latest:
+                    self.coalesced += 1
+                    metrics.TICKS.labels("coalesced").inc()
+                latest[tick.symbol] = tick
+            for tick in latest.values():
+                self.on_tick(tick)
+            if finished:
+                return
+
+    async def _housekeeping(self):
+        loop = asyncio.get_running_loop()
+        last_snapshot = last_leaderboard = last_reload = last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            now = time.monotonic()
+            snapshot = now - last_snapshot >= self.snapshot_interval
+            refresh = now - last_leaderboard >= self.leaderboard_interval
+            await self.flush(snapshot=snapshot, refresh=refresh)
+            if snapshot:
+                last_snapshot = now
+            if refresh:
+                last_leaderboard = now
+            if now - last_reload >= self.reload_interval:
+                last_reload = now
+                try:
+                    self._reload_due = await loop.run_in_executor(self._executor, self.check_roster)
+                    self._yield_due = await loop.run_in_executor(self._executor, scheduler.pending, "evolve_agents")
+                except Exception as e:
+                    print(f"Error checking for agent changes: {e}")
+            if now - last_report >= self.report_interval:
+                last_report = now
+                self.report()
+
+    async def run(self, feed, duration=None):
+        """Consumes `feed` until it ends (or `duration` seconds), then flushes and reports."""
+        self._flush_lock = asyncio.Lock()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.acquire_lock)
+        await loop.run_in_executor(self._executor, self.load)
+
+        queue = asyncio.Queue()
+        consumer = asyncio.create_task(self._consume(queue))
+        housekeeping = asyncio.create_task(self._housekeeping())
+        tasks = [asyncio.create_task(self._read(feed, queue)), consumer, housekeeping]
+        try:
+            # Ends with the feed, or early when a flush finds the cycle lock lost
+            done, _ = await asyncio.wait([consumer, housekeeping], timeout=duration,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                if self.lock is not None and not self.lock.lost:
+                    await self.flush(snapshot=True, refresh=True)
+                else:
+                    print("Tick pipeline lost the cycle lock; unflushed decisions were dropped.")
+            finally:
+                if self.lock is not None:
+                    self.lock.release()
+                self._executor.shutdown()
+            self.report()
+        return self.latency_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trade on streaming (or replayed) price ticks.")
+    parser.add_argument("--source", choices=["replay", "mock", "alpaca"], default="replay")
+    parser.add_argument("--file", help="CSV with timestamp,symbol,price columns (for --source replay)")
+    parser.add_argument("--symbols", help="Comma separated symbols (default: the market cycle universe)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier, 0 = as fast as possible")
+    parser.add_argument("--rate", type=float, default=10.0, help="Mock ticks per second")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--snapshot-interval", type=float, default=60.0)
+    parser.add_argument("--leaderboard-interval", type=float, default=10.0)
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve /metrics (default: METRICS_PORT if set)")
+    args = parser.parse_args()
+
+    symbols = [s.strip() for s in args.symbols.split(",") if s.strip()] if args.symbols else worker.UNIVERSE
+    if args.source == "replay":
+        if not args.file:
+            parser.error("--file is required for --source replay")
+        feed = ReplayFeed(args.file, symbols if args.symbols else None, speed=args.speed)
+    elif args.source == "mock":
+        feed = MockFeed(symbols, rate=args.rate, seed=args.seed)
+    else:
+        feed = AlpacaStreamFeed(symbols)
+
+    if scheduler.TRADING_MODE != "ticks":
+        print("TRADING_MODE is not 'ticks': scheduled market cycles will be deferred while this pipeline "
+              "holds the cycle lock and eventually skipped as stale.")
+    if args.metrics_port or os.getenv("METRICS_PORT"):
+        metrics.start_metrics_server(args.metrics_port)
+
+    pipeline = TickPipeline(
+        symbols,
+        flush_interval=args.flush_interval,
+        snapshot_interval=args.snapshot_interval,
+        leaderboard_interval=args.leaderboard_interval,
+    )
+    try:
+        asyncio.run(pipeline.run(feed, duration=args.duration))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
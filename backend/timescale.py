@@ -0,0 +1,168 @@
+"""
+TimescaleDB setup for portfolio history.
+
+Turns portfolio_snapshots into a hypertable partitioned on timestamp, adds
+compression and retention policies, and maintains hourly/daily equity
+continuous aggregates per agent. Safe to re-run; a no-op on databases
+without the timescaledb extension.
+
+    python timescale.py
+"""
+import datetime
+import os
+
+from sqlalchemy import text
+
+import models
+
+SNAPSHOTS = models.PortfolioSnapshot.__tablename__
+
+# Continuous aggregate name -> bucket width, refresh window and schedule
+EQUITY_AGGREGATES = {
+    "agent_equity_hourly": ("1 hour", "3 hours", "1 hour", "30 minutes"),
+    "agent_equity_daily": ("1 day", "3 days", "1 hour", "1 hour"),
+}
+INTERVALS = {"hour": "agent_equity_hourly", "day": "agent_equity_daily"}
+BUCKET_SECONDS = {"hour": 3600, "day": 86400}
+
+
+def setup_timescale(engine):
+    """Idempotently converts snapshots to a hypertable with policies and aggregates."""
+    if engine.dialect.name != "postgresql":
+        print("TimescaleDB setup skipped: not a PostgreSQL database.")
+        return False
+
+    chunk_interval = os.getenv("SNAPSHOT_CHUNK_INTERVAL", "1 day")
+    compress_after = os.getenv("SNAPSHOT_COMPRESS_AFTER", "7 days")
+    retain_for = os.getenv("SNAPSHOT_RETENTION", "365 days")
+
+    with engine.begin() as conn:
+        available = conn.execute(
+            text("SELECT 1 FROM pg_available_extensions WHERE name = 'timescaledb'")
+        ).first()
+        if not available:
+            print("TimescaleDB setup skipped: extension not available.")
+            return False
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
+
+        _ensure_primary_key(conn)
+        conn.execute(text(
+            f"SELECT create_hypertable('{SNAPSHOTS}', 'timestamp', "
+            f"chunk_time_interval => INTERVAL '{chunk_interval}', "
+            f"if_not_exists => TRUE, migrate_data => TRUE)"
+        ))
+        conn.execute(text(
+            f"ALTER TABLE {SNAPSHOTS} SET (timescaledb.compress, "
+            f"timescaledb.compress_segmentby = 'agent_id', "
+            f"timescaledb.compress_orderby = 'timestamp DESC')"
+        ))
+        conn.execute(text(
+            f"SELECT add_compression_policy('{SNAPSHOTS}', INTERVAL '{compress_after}', if_not_exists => TRUE)"
+        ))
+        conn.execute(text(
+            f"SELECT add_retention_policy('{SNAPSHOTS}', INTERVAL '{retain_for}', if_not_exists => TRUE)"
+        ))
+
+    # Continuous aggregates cannot be created inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for view, (bucket, start_offset, end_offset, schedule) in EQUITY_AGGREGATES.items():
+            conn.execute(text(
+                f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view} "
+                f"WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS "
+                f"SELECT agent_id, time_bucket(INTERVAL '{bucket}', timestamp) AS bucket, "
+                f"first(total_equity, timestamp) AS open, max(total_equity) AS high, "
+                f"min(total_equity) AS low, last(total_equity, timestamp) AS close, "
+                f"last(cash, timestamp) AS cash "
+                f"FROM {SNAPSHOTS} GROUP BY agent_id, bucket WITH NO DATA"
+            ))
+            conn.execute(text(
+                f"SELECT add_continuous_aggregate_policy('{view}', "
+                f"start_offset => INTERVAL '{start_offset}', end_offset => INTERVAL '{end_offset}', "
+                f"schedule_interval => INTERVAL '{schedule}', if_not_exists => TRUE)"
+            ))
+
+    print(f"TimescaleDB ready: {SNAPSHOTS} hypertable with {', '.join(EQUITY_AGGREGATES)}.")
+    return True
+
+
+def _ensure_primary_key(conn):
+    """
+    Tables created before the hypertable switch were keyed on a serial id; re-key on
+    (agent_id, timestamp) and drop id, which nothing reads and would otherwise keep
+    its sequence and a NOT NULL column in every chunk.
+    """
+    columns = [row[0] for row in conn.execute(text(
+        "SELECT a.attname FROM pg_index i "
+        "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+        "WHERE i.indrelid = CAST(:table AS regclass) AND i.indisprimary"
+    ), {"table": SNAPSHOTS})]
+    has_id = conn.execute(text(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = 'id'"
+    ), {"table": SNAPSHOTS}).first()
+    if sorted(columns) == ["agent_id", "timestamp"] and not has_id:
+        return
+    if sorted(columns) != ["agent_id", "timestamp"]:
+        conn.execute(text(f"ALTER TABLE {SNAPSHOTS} DROP CONSTRAINT IF EXISTS {SNAPSHOTS}_pkey"))
+        if has_id:
+            # Keep the latest of any rows sharing an (agent_id, timestamp) so the new key fits
+            conn.execute(text(
+                f"DELETE FROM {SNAPSHOTS} a USING {SNAPSHOTS} b "
+                f"WHERE a.agent_id = b.agent_id AND a.timestamp = b.timestamp AND a.id < b.id"
+            ))
+        conn.execute(text(f"ALTER TABLE {SNAPSHOTS} ADD PRIMARY KEY (agent_id, timestamp)"))
+    if has_id:
+        conn.execute(text(f"ALTER TABLE {SNAPSHOTS} DROP COLUMN id"))
+
+
+def equity_curve(db, agent_id, interval="hour", limit=500):
+    """
+    Bucketed equity (open/high/low/close, cash) for one agent, newest first.
+    Reads the continuous aggregates on TimescaleDB and buckets raw snapshots elsewhere.
+    """
+    view = INTERVALS[interval]
+    if db.get_bind().dialect.name == "postgresql" and db.execute(
+        text("SELECT to_regclass(:view)"), {"view": view}
+    ).scalar():
+        rows = db.execute(text(
+            f"SELECT bucket, open, high, low, close, cash FROM {view} "
+            f"WHERE agent_id = :agent_id ORDER BY bucket DESC LIMIT :limit"
+        ), {"agent_id": agent_id, "limit": limit}).mappings().all()
+        return [dict(r) for r in rows]
+
+    # No aggregates: bucket raw snapshots here, streamed newest first until `limit` buckets are complete
+    seconds = BUCKET_SECONDS[interval]
+    snapshots = (
+        db.query(models.PortfolioSnapshot.timestamp, models.PortfolioSnapshot.total_equity,
+                 models.PortfolioSnapshot.cash)
+        .filter(models.PortfolioSnapshot.agent_id == agent_id)
+        .order_by(models.PortfolioSnapshot.timestamp.desc())
+        .yield_per(1000)
+    )
+    buckets = []
+    for timestamp, equity, cash in snapshots:
+        bucket = _bucket(timestamp, seconds)
+        if not buckets or buckets[-1]["bucket"] != bucket:
+            if len(buckets) == limit:
+                break
+            buckets.append({"bucket": bucket, "open": equity, "high": equity,
+                            "low": equity, "close": equity, "cash": cash})
+            continue
+        row = buckets[-1]
+        row["open"] = equity  # older rows come later
+        row["high"] = max(row["high"], equity)
+        row["low"] = min(row["low"], equity)
+    return buckets
+
+
+def _bucket(timestamp, seconds):
+    """Start of the `seconds` wide bucket holding `timestamp`, aligned on the epoch like time_bucket."""
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=timestamp.tzinfo)
+    offset = (timestamp - epoch).total_seconds() % seconds
+    return timestamp - datetime.timedelta(seconds=offset)
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+    setup_timescale(engine)
@@ -0,0 +1,172 @@
+"""
+Trade history and audit export.
+
+Pages walk trades by keyset on (timestamp, id) instead of OFFSET, so every
+page costs the same however deep it is, served from covering indexes on
+trades (agent_id, timestamp, id) and (timestamp, id). The export streams
+from a server-side cursor in batches as NDJSON, Arrow IPC or Parquet, never
+holding the whole result in memory:
+
+    GET /api/agents/42/trades?limit=100            newest first, then &cursor=<next_cursor>
+    GET /api/trades/export?format=ndjson&start=2024-01-01T00:00:00
+    GET /api/trades/export?format=parquet&agent_id=42 > trades.parquet
+"""
+import base64
+import datetime
+import io
+import json
+
+from sqlalchemy import select, tuple_
+
+import models
+
+MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 10000
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+TRADE_FIELDS = ("id", "agent_id", "symbol", "side", "qty", "price", "timestamp")
+
+_columns = [getattr(models.Trade, f) for f in TRADE_FIELDS]
+
+
+def encode_cursor(timestamp, trade_id):
+    """Opaque cursor for the keyset position just after (timestamp, id)."""
+    raw = f"{timestamp.isoformat()}|{trade_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from encode_cursor; raises ValueError when malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, trade_id = raw.rsplit("|", 1)
+        return datetime.datetime.fromisoformat(timestamp), int(trade_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def _keyset(after, descending):
+    key = tuple_(models.Trade.timestamp, models.Trade.id)
+    return key < after if descending else key > after
+
+
+def page_query(agent_id, limit, cursor=None, descending=True):
+    """One page of an agent's trades, newest first by default; fetch limit + 1 to detect a next page."""
+    stmt = select(*_columns).where(models.Trade.agent_id == agent_id)
+    if cursor:
+        stmt = stmt.where(_keyset(decode_cursor(cursor), descending))
+    if descending:
+        stmt = stmt.order_by(models.Trade.timestamp.desc(), models.Trade.id.desc())
+    else:
+        stmt = stmt.order_by(models.Trade.timestamp, models.Trade.id)
+    return stmt.limit(limit + 1)
+
+
+def trade_dict(row):
+    return {
+        "id": row.id,
+        "agent_id": row.agent_id,
+        "symbol": row.symbol,
+        "side": row.side,
+        "qty": row.qty,
+        "price": row.price,
+        "timestamp": row.timestamp.isoformat() + "Z" if row.timestamp else None,
+    }
+
+
+async def read_page(db, agent_id, limit=100, cursor=None, descending=True):
+    """{"trades": [...], "next_cursor": str or None} for an agent."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = (await db.execute(page_query(agent_id, limit, cursor, descending))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].timestamp, rows[-1].id) if has_more else None
+    return {"trades": [trade_dict(r) for r in rows], "next_cursor": next_cursor}
+
+
+def export_query(agent_id=None, symbol=None, start=None, end=None, cursor=None):
+    """All matching trades in (timestamp, id) order; `cursor` resumes after a previous export's last row."""
+    stmt = select(*_columns)
+    if agent_id is not None:
+        stmt = stmt.where(models.Trade.agent_id == agent_id)
+    if symbol:
+        stmt = stmt.where(models.Trade.symbol == symbol)
+    if start is not None:
+        stmt = stmt.where(models.Trade.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(models.Trade.timestamp < end)
+    if cursor:
+        stmt = stmt.where(_keyset(decode_cursor(cursor), descending=False))
+    return stmt.order_by(models.Trade.timestamp, models.Trade.id)
+
+
+async def _batches(stmt, batch_size):
+    """Row batches from a server-side cursor on its own pooled connection."""
+    from database import get_async_engine
+
+    async with get_async_engine().connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=batch_size))
+        async for batch in result.partitions(batch_size):
+            yield batch
+
+
+async def stream_ndjson(stmt, batch_size=EXPORT_BATCH_SIZE):
+    async for batch in _batches(stmt, batch_size):
+        yield "".join(json.dumps(trade_dict(r), separators=(",", ":")) + "\n" for r in batch).encode()
+
+
+def arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("agent_id", pa.int64()),
+        ("symbol", pa.string()),
+        ("side", pa.string()),
+        ("qty", pa.float64()),
+        ("price", pa.float64()),
+        ("timestamp", pa.timestamp("us")),
+    ])
+
+
+async def stream_arrow(stmt, batch_size=EXPORT_BATCH_SIZE, parquet=False):
+    """Arrow IPC stream (or Parquet, one row group per batch) written batch by batch into a reusable buffer."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema()
+    sink = io.BytesIO()
+    writer = pq.ParquetWriter(sink, schema) if parquet else pa.ipc.new_stream(sink, schema)
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    try:
+        async for batch in _batches(stmt, batch_size):
+            columns = list(zip(*batch))
+            table = pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, schema)], schema=schema)
+            writer.write_table(table)
+            yield drain()
+    finally:
+        writer.close()
+    # Parquet footer / Arrow end-of-stream marker
+    yield drain()
+
+
+def export_stream(stmt, fmt):
+    """(async byte iterator, media type) for an export format."""
+    if fmt == "ndjson":
+        return stream_ndjson(stmt), EXPORT_FORMATS[fmt]
+    return stream_arrow(stmt, parquet=fmt == "parquet"), EXPORT_FORMATS[fmt]
+
+
+def ensure_indexes(engine):
+    """Creates the keyset indexes on an existing trades table (create_all only covers new tables)."""
+    for index in models.Trade.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
@@ -0,0 +1,71 @@
+"""
+Mark-to-market valuation.
+
+Equity is cash plus every open position marked at one shared quote snapshot
+(falling back to the position's average cost for symbols without a quote).
+The sum and the ranking run in SQL, so picking the best and worst k agents
+is an ORDER BY ... LIMIT k over one aggregate instead of loading and sorting
+every agent in Python.
+"""
+from sqlalchemy import case, func
+
+import models
+
+
+def quote_snapshot(db, gateway=None):
+    """{symbol: price} for every symbol held by an active agent, fetched in one batched call."""
+    symbols = [
+        s for (s,) in db.query(models.Position.symbol).join(models.Agent)
+        .filter(models.Agent.status == "active").distinct()
+    ]
+    if not symbols:
+        return {}
+    if gateway is None:
+        from market_data import get_gateway
+        gateway = get_gateway()
+    return {s: p for s, p in gateway.get_prices(symbols).items() if p is not None}
+
+
+def mark_expression(prices):
+    """Per-share mark for a positions row: the snapshot price, else its average cost."""
+    if not prices:
+        return models.Position.avg_price
+    return case(prices, value=models.Position.symbol, else_=models.Position.avg_price)
+
+
+def equity_query(db, prices):
+    """Query of (Agent, equity) for active agents, equity marked at `prices`."""
+    holdings = (
+        db.query(
+            models.Position.agent_id.label("agent_id"),
+            func.sum(models.Position.qty * mark_expression(prices)).label("value"),
+        )
+        .group_by(models.Position.agent_id)
+        .subquery()
+    )
+    equity = (models.Agent.current_cash + func.coalesce(holdings.c.value, 0.0)).label("equity")
+    return (
+        db.query(models.Agent, equity)
+        .outerjoin(holdings, holdings.c.agent_id == models.Agent.id)
+        .filter(models.Agent.status == "active")
+    ), equity
+
+
+def rank_agents(db, prices, k, best=True, exclude=()):
+    """
+    [(Agent, equity)] for the k best (or worst) active agents by marked equity, leaving
+    out the ids in `exclude`. Ties rank by id, lower ids first, so the worst end of
+    a tie is its highest ids.
+    """
+    query, equity = equity_query(db, prices)
+    if exclude:
+        query = query.filter(models.Agent.id.notin_(list(exclude)))
+    order = (equity.desc(), models.Agent.id) if best else (equity.asc(), models.Agent.id.desc())
+    return query.order_by(*order).limit(k).all()
+
+
+def top_and_bottom(db, prices, k):
+    """(top k best first, bottom k worst last) active agents with their marked equity; never overlapping."""
+    top = rank_agents(db, prices, k, best=True)
+    bottom = rank_agents(db, prices, k, best=False, exclude=[agent.id for agent, _ in top])
+    return top, bottom[::-1]
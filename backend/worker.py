@@ -1,178 +1,564 @@
-from celery import Celery
+from celery import Celery, chord
+from celery.signals import worker_process_shutdown, worker_ready
 import os
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from database import SessionLocal
 import models
-from agent import TradingAgent
+import events
+import leaderboard
+import metrics
+import netting
+import persistence
+import scheduler
+import valuation
+from advisor import get_advisor
+from indicators import INDICATOR_TIMEFRAME, IndicatorEngine, IndicatorStore, normalize_snapshot
+from population import Population
+from backtest import DEFAULT_UNIVERSE, STARTING_CASH
 from alpaca_client import AlpacaClient
+from bar_store import get_bar_store
+from market_data import get_gateway
+from redis_client import get_redis_url
 import datetime
 import random
+import time
 
 celery = Celery(__name__)
-# Standard Heroku Redis URL is REDIS_URL
-redis_url = os.environ.get("REDIS_URL", os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379"))
-
-# Heroku Redis SSL Fix: Some plans require rediss:// and cert verification off
-if redis_url and redis_url.startswith("rediss://"):
-    if "ssl_cert_reqs" not in redis_url:
-        # Append params to handle self-signed certs common on Heroku
-        separator = "&" if "?" in redis_url else "?"
-        redis_url = f"{redis_url}{separator}ssl_cert_reqs=none"
+redis_url = get_redis_url()
 
 celery.conf.broker_url = redis_url
 celery.conf.result_backend = redis_url
+# Beat (celery -A worker beat) queues cycles every CYCLE_INTERVAL during market hours
+celery.conf.beat_schedule = scheduler.beat_schedule()
+celery.conf.timezone = scheduler.MARKET_TIMEZONE
+
+# Sharded cycles: fan agents out over up to CYCLE_SHARDS tasks, each with at least MIN_AGENTS_PER_SHARD
+CYCLE_SHARDS = int(os.environ.get("CYCLE_SHARDS", "1"))
+MIN_AGENTS_PER_SHARD = int(os.environ.get("MIN_AGENTS_PER_SHARD", "500"))
+
+# Bars (of INDICATOR_TIMEFRAME) replayed into a symbol's indicators the first time it is seen
+WARM_BARS = 100
+
+# evolve_agents ranking: "equity" (marked-to-market) or "robust" (Monte Carlo, see robustness.py)
+EVOLVE_FITNESS = os.environ.get("EVOLVE_FITNESS", "equity")
+
+def load_universe():
+    """
+    Symbols traded by the market cycle and the tick pipeline: UNIVERSE (comma separated)
+    or UNIVERSE_FILE (one symbol per line, # comments), else DEFAULT_UNIVERSE.
+    Agents narrow it with a DNA 'watchlist'.
+    """
+    symbols = [s.strip() for s in os.environ.get("UNIVERSE", "").split(",")]
+    path = os.environ.get("UNIVERSE_FILE")
+    if path:
+        with open(path) as f:
+            symbols += [line.split("#", 1)[0].strip() for line in f]
+    symbols = list(dict.fromkeys(s.upper() for s in symbols if s))
+    return symbols or list(DEFAULT_UNIVERSE)
+
+UNIVERSE = load_universe()
 
 alpaca = AlpacaClient()
+# Set ORDER_ROUTING to net each cycle's intents into one broker order per symbol
+broker = netting.get_broker(alpaca)
+indicator_store = IndicatorStore(redis_url)
+bar_store = get_bar_store(alpaca)
 
-@celery.task(name="run_market_cycle")
-def run_market_cycle():
+def synthetic_closes(symbol, price, bars=WARM_BARS):
+    """Keyless dev mode's stand-in history: a reproducible random walk per symbol ending at `price`."""
+    import zlib
+    from backtest import SyntheticPriceSource
+
+    closes = SyntheticPriceSource([symbol], bars=bars, seed=zlib.crc32(symbol.encode())).load().closes[:, 0]
+    return closes * (price / closes[-1])
+
+def load_indicator_engine(symbols, rsi_periods):
     """
-    Main loop:
-    1. Fetch active agents
-    2. Fetch market data for target symbols
-    3. Run agent logic
-    4. Save state & trades
+    Restore rolling indicator state, warming any symbol seen for the first time from history.
+    Without Alpaca keys there is no history, so new symbols warm from synthetic bars ending
+    at the mock quote instead of trading on empty indicators for weeks.
     """
-    db: Session = SessionLocal()
-    try:
-        # 1. Fetch Agents
-        agents = db.query(models.Agent).filter(models.Agent.status == "active").all()
-        if not agents:
-            print("No active agents found.")
-            return
-
-        # 2. Market Data (Mocking a universe for now)
-        universe = ["AAPL", "TSLA", "SPY", "NVDA", "AMZN"]
-        market_snapshot = {}
-        
+    engine = indicator_store.load() or IndicatorEngine()
+    engine.ensure_periods(rsi_periods)
+    unwarmed = []
+    for symbol in symbols:
+        if symbol not in engine:
+            # Local bar history, extended by only the bars missing since the last refresh
+            try:
+                bar_store.refresh(symbol, INDICATOR_TIMEFRAME, limit=WARM_BARS)
+            except Exception as e:
+                print(f"Error refreshing bars for {symbol}: {e}")
+            bars = bar_store.read(symbol, INDICATOR_TIMEFRAME, limit=WARM_BARS)
+            if bars is not None:
+                engine.warm(symbol, bars.close, bars.timestamp)
+            else:
+                unwarmed.append(symbol)
+    if unwarmed and alpaca.api is None:
+        prices = get_gateway().get_prices(unwarmed)
+        for symbol, price in prices.items():
+            engine.warm(symbol, synthetic_closes(symbol, price))
+        print(f"No Alpaca keys: warmed indicators for {len(prices)} symbols from synthetic bars.")
+    return engine
+
+def build_market_snapshot(db, universe):
+    """Prices plus streaming indicators (for every rsi_period in the population) per symbol."""
+    with metrics.phase("indicators"):
+        rsi_periods = {
+            p for (p,) in db.query(models.Agent.dna["rsi_period"].as_integer())
+            .filter(models.Agent.status == "active").distinct()
+            if p is not None
+        }
+        engine = load_indicator_engine(universe, rsi_periods)
+    market_snapshot = {}
+
+    with metrics.phase("quotes"):
+        prices = get_gateway().get_prices(universe)
+
+    with metrics.phase("indicators"):
         for symbol in universe:
-            price = alpaca.get_latest_price(symbol)
+            price = prices.get(symbol)
             if price is None:
-                 # Fallback if API fails or is mock
+                 # Fallback if API fails or is mock; not fed into indicator state
                  price = random.uniform(100, 200) 
+                 indicators = engine.values(symbol)
+            else:
+                 indicators = engine.update(symbol, price)
             
-            # TODO: Calculate indicators (RSI, SMA) here using pandas/TA-Lib
-            # For now, we mock RSI and SMA for demonstration
             market_snapshot[symbol] = {
                 "symbol": symbol,
                 "price": price,
-                "rsi": random.uniform(20, 80),
-                "sma_20": price * random.uniform(0.95, 1.05),
-                "sma_50": price * random.uniform(0.90, 1.10)
+                **indicators
             }
+        indicator_store.save(engine)
+    return market_snapshot
 
-        # 3. Agent Execution
-        for db_agent in agents:
-            # Initialize Logic Agent with DB State
-            logic_agent = TradingAgent(db_agent.id, db_agent.dna, alpaca_client=alpaca)
-            logic_agent.portfolio_value = db_agent.current_cash
-            logic_agent.positions = dict(db_agent.current_positions) if db_agent.current_positions else {}
-            
-            # Run logic against every symbol in universe
-            for symbol, data in market_snapshot.items():
-                logic_agent.execute_logic(data)
-            
-            # 4. Persistence
-            # Save Trades
-            if logic_agent.pending_trades:
-                for t in logic_agent.pending_trades:
-                    db_trade = models.Trade(
-                        agent_id=db_agent.id,
-                        symbol=t['symbol'],
-                        side=t['side'],
-                        qty=t['qty'],
-                        price=t['price'],
-                        timestamp=t['timestamp']
-                    )
-                    db.add(db_trade)
-            
-            # Save State
-            db_agent.current_cash = logic_agent.portfolio_value
-            db_agent.current_positions = logic_agent.positions
-            
-            # Snapshot performance (optional, maybe once per day or hour)
-            # db_snapshot = models.PortfolioSnapshot(...)
-            # db.add(db_snapshot)
+def load_population(db, symbols, id_range=None):
+    """Population of active agents (optionally only ids in [lo, hi]) with their positions in `symbols`, or None."""
+    # Plain rows, not ORM entities: state is written back in bulk, not via the unit of work
+    query = db.query(
+        models.Agent.id, models.Agent.dna, models.Agent.current_cash
+    ).filter(models.Agent.status == "active")
+    positions = db.query(
+        models.Position.agent_id, models.Position.symbol, models.Position.qty, models.Position.avg_price
+    ).join(models.Agent).filter(
+        models.Agent.status == "active", models.Position.symbol.in_(list(symbols))
+    )
+    if id_range is not None:
+        query = query.filter(models.Agent.id.between(*id_range))
+        positions = positions.filter(models.Position.agent_id.between(*id_range))
+    agents = query.all()
+    if not agents:
+        return None
+    return Population.from_agents(agents, positions.all(), list(symbols))
+
+def decide(db, market_snapshot, cycle_time, id_range=None):
+    """(population, trade intents) of the active agents (optionally only ids in [lo, hi]); population may be None."""
+    with metrics.phase("load"):
+        population = load_population(db, market_snapshot, id_range)
+    if population is None:
+        return None, []
 
-        db.commit()
-        print(f"Market cycle completed for {len(agents)} agents.")
+    # Whole population in one vectorized pass
+    with metrics.phase("decide"):
+        # Optional LLM review of entries (ADVISOR_MODEL); bounded by its own deadline
+        advisor = get_advisor()
+        trades = population.step(market_snapshot, timestamp=cycle_time, review=advisor.review if advisor else None)
+    return population, trades
+
+def execute_agents(db, market_snapshot, cycle_time, id_range=None, allocations=None, intents=None):
+    """
+    Runs the population (optionally only agents with id in [lo, hi]) against the
+    snapshot and bulk-writes the results without committing. Trades are routed
+    through the broker when ORDER_ROUTING is set. A shard of a routed cycle instead
+    replays its first-pass `intents` (so decisions, and advisor verdicts, are never
+    made twice) and fills them from `allocations` (netting.allocation_rows of the
+    whole cycle). Returns (agent_count, trades, rows_written).
+    """
+    if intents is None:
+        population, trades = decide(db, market_snapshot, cycle_time, id_range)
+    else:
+        with metrics.phase("load"):
+            population = load_population(db, market_snapshot, id_range)
+        trades = [{**t, "timestamp": cycle_time} for t in intents]
+        if population is not None:
+            population.apply_trades(trades)
+    if population is None:
+        return 0, [], {}
+
+    if allocations is not None:
+        with metrics.phase("route"):
+            trades = netting.apply_routed(population, trades, allocations)
+    elif broker is not None and trades:
+        with metrics.phase("route"):
+            intents = len(trades)
+            trades, orders = netting.route(population, trades, broker)
+        print(f"Routed {sum(1 for o, _ in orders if o.side)} net orders for {intents} intents "
+              f"({len(trades)} filled).")
+    metrics.record(agents=len(population), trades=len(trades))
+
+    # Batched trades, bulk update of changed agents and positions, and an equity snapshot
+    # per agent into the portfolio_snapshots hypertable
+    with metrics.phase("persist"):
+        cycle_prices = {s: d["price"] for s, d in market_snapshot.items()}
+        rows = persistence.persist_cycle(db, population, trades, prices=cycle_prices, timestamp=cycle_time)
+    return len(population), trades, rows
+
+def shard_ranges(db, shards):
+    """Splits active agents into `shards` contiguous id ranges of (nearly) equal size."""
+    ranked = db.query(
+        models.Agent.id.label("id"),
+        func.ntile(shards).over(order_by=models.Agent.id).label("shard"),
+    ).filter(models.Agent.status == "active").subquery()
+    return [
+        (lo, hi) for lo, hi in
+        db.query(func.min(ranked.c.id), func.max(ranked.c.id)).group_by(ranked.c.shard).order_by(ranked.c.shard)
+    ]
+
+@celery.task(name="schedule_market_cycle")
+def schedule_market_cycle():
+    """Beat entry: queues a market cycle while the market is open (coalesced with pending runs)."""
+    if scheduler.TRADING_MODE == "ticks":
+        return
+    if not scheduler.market_open():
+        scheduler.skipped("run_market_cycle", "market_closed")
+        return
+    scheduler.trigger(run_market_cycle, source="beat")
+
+@celery.task(name="schedule_evolution")
+def schedule_evolution():
+    """Beat entry: queues the weekly evolution (coalesced with pending runs)."""
+    scheduler.trigger(evolve_agents, source="beat")
+
+@celery.task(name="run_market_cycle")
+def run_market_cycle(triggered_at=None):
+    """
+    Main loop:
+    1. Fetch market data and indicators for target symbols (once per cycle)
+    2. Run agent logic for all active agents
+    3. Save state, trades & snapshots in bulk
+    With CYCLE_SHARDS > 1, steps 2-3 fan out to run_cycle_shard tasks (one per
+    agent id range) and finalize_market_cycle combines their results. With order
+    routing, decide_cycle_shard tasks first collect every shard's intents so
+    route_market_cycle can net them into one order per symbol; each shard then
+    applies its own intents and allocations without deciding again.
+    Holds the cycle lock throughout (until finalize_market_cycle when sharded);
+    `triggered_at` is set by scheduler.trigger and lets stale runs be skipped.
+    """
+    lock = scheduler.begin(run_market_cycle, triggered_at)
+    if lock is None:
+        return
+    fanned_out = False
+    db: Session = SessionLocal()
+    try:
+        with metrics.cycle("run_market_cycle") as timer:
+            with metrics.phase("load"):
+                agent_count = db.query(func.count(models.Agent.id)).filter(models.Agent.status == "active").scalar()
+            if not agent_count:
+                print("No active agents found.")
+                return
+
+            # 1. Market Data (Mocking a universe for now)
+            market_snapshot = build_market_snapshot(db, UNIVERSE)
+            cycle_time = datetime.datetime.utcnow()
+            cycle_prices = {s: d["price"] for s, d in market_snapshot.items()}
+
+            shards = min(CYCLE_SHARDS, agent_count // MIN_AGENTS_PER_SHARD)
+            if shards > 1:
+                ranges = shard_ranges(db, shards)
+                if broker is not None:
+                    chord(
+                        decide_cycle_shard.s(market_snapshot, cycle_time.isoformat(), lo, hi, lock.token)
+                        for lo, hi in ranges
+                    )(route_market_cycle.s(market_snapshot, cycle_time.isoformat(), ranges, cycle_prices, lock.token))
+                else:
+                    chord(
+                        run_cycle_shard.s(market_snapshot, cycle_time.isoformat(), lo, hi, lock.token)
+                        for lo, hi in ranges
+                    )(finalize_market_cycle.s(cycle_prices, lock.token))
+                fanned_out = True
+                print(f"Market cycle fanned out to {len(ranges)} shards for {agent_count} agents "
+                      f"[{timer.summary()}].")
+                return
+
+            # 2-3. Agent Execution & Persistence
+            agent_count, trades, rows = execute_agents(db, market_snapshot, cycle_time)
+            with metrics.phase("commit"):
+                lock.ensure()
+                db.commit()
+
+            with metrics.phase("publish"):
+                events.publish_events(events.trade_events(trades))
+                leaderboard.refresh_leaderboard(db, prices=cycle_prices)
+
+            print(f"Market cycle completed for {agent_count} agents "
+                  f"({rows['trades']} trades, {rows['agents']} agents updated, {rows['snapshots']} snapshots) "
+                  f"[{timer.summary()}].")
 
     except Exception as e:
         print(f"Error in market cycle: {e}")
         db.rollback()
     finally:
         db.close()
+        if not fanned_out:
+            lock.release()
+
+@celery.task(name="decide_cycle_shard")
+def decide_cycle_shard(market_snapshot, cycle_time, lo, hi, lock_token=None):
+    """First pass of a routed sharded cycle: the trade intents of agents with id in [lo, hi], nothing written."""
+    lock = scheduler.CycleLock(lock_token) if lock_token else None
+    if lock is not None:
+        lock.keep_alive()
+    db: Session = SessionLocal()
+    try:
+        with metrics.cycle("decide_cycle_shard"):
+            market_snapshot = normalize_snapshot(market_snapshot)
+            _, trades = decide(db, market_snapshot, datetime.datetime.fromisoformat(cycle_time), id_range=(lo, hi))
+        return [
+            {"agent_id": int(t["agent_id"]), "symbol": t["symbol"], "side": t["side"],
+             "qty": int(t["qty"]), "price": float(t["price"])}
+            for t in trades
+        ]
+    except Exception as e:
+        print(f"Error deciding market cycle shard {lo}-{hi}: {e}")
+        return []
+    finally:
+        db.rollback()
+        db.close()
+        if lock is not None:
+            lock.stop()
+
+@celery.task(name="route_market_cycle")
+def route_market_cycle(shard_intents, market_snapshot, cycle_time, ranges, cycle_prices, lock_token=None):
+    """
+    Chord callback of the first pass: nets every shard's intents into one order per
+    symbol, routes them, then fans out run_cycle_shard with each shard's allocations.
+    """
+    lock = scheduler.CycleLock(lock_token) if lock_token else None
+    if lock is not None:
+        lock.keep_alive()
+    try:
+        with metrics.cycle("route_market_cycle"), metrics.phase("route"):
+            intents = [t for shard in shard_intents for t in shard]
+            allocated, orders = netting.settle(intents, broker) if intents else ([], [])
+        filled = [row for row in netting.allocation_rows(allocated) if row[2] > 0]
+        print(f"Routed {sum(1 for o, _ in orders if o.side)} net orders for {len(intents)} intents "
+              f"across {len(ranges)} shards ({len(filled)} filled).")
+    except Exception as e:
+        print(f"Error routing market cycle: {e}")
+        filled = []
+    finally:
+        if lock is not None:
+            lock.stop()
+
+    chord(
+        run_cycle_shard.s(
+            market_snapshot, cycle_time, lo, hi, lock_token, [row for row in filled if lo <= row[0] <= hi], intents
+        )
+        for (lo, hi), intents in zip(ranges, shard_intents)
+    )(finalize_market_cycle.s(cycle_prices, lock_token))
+
+@celery.task(name="run_cycle_shard")
+def run_cycle_shard(market_snapshot, cycle_time, lo, hi, lock_token=None, allocations=None, intents=None):
+    """
+    One slice of a sharded market cycle: agents with id in [lo, hi], in their own session.
+    Renews the cycle lock held under `lock_token` while it runs. In a routed cycle,
+    `intents` are this shard's decisions from decide_cycle_shard and `allocations`
+    their fills from route_market_cycle.
+    """
+    lock = scheduler.CycleLock(lock_token) if lock_token else None
+    if lock is not None:
+        lock.keep_alive()
+    db: Session = SessionLocal()
+    try:
+        with metrics.cycle("run_cycle_shard"):
+            market_snapshot = normalize_snapshot(market_snapshot)
+            agent_count, trades, rows = execute_agents(
+                db, market_snapshot, datetime.datetime.fromisoformat(cycle_time), id_range=(lo, hi),
+                allocations=allocations, intents=intents,
+            )
+            with metrics.phase("commit"):
+                if lock is not None:
+                    lock.ensure()
+                db.commit()
+            with metrics.phase("publish"):
+                events.publish_events(events.trade_events(trades))
+        return {"agents": agent_count, "rows": rows}
+    except Exception as e:
+        print(f"Error in market cycle shard {lo}-{hi}: {e}")
+        db.rollback()
+        return {"agents": 0, "rows": {}, "error": str(e)}
+    finally:
+        db.close()
+        if lock is not None:
+            lock.stop()
+
+@celery.task(name="finalize_market_cycle")
+def finalize_market_cycle(results, cycle_prices, lock_token=None):
+    """Chord callback: combines shard results, publishes the leaderboard once and releases the cycle lock."""
+    totals = {}
+    for result in results:
+        for table, count in result["rows"].items():
+            totals[table] = totals.get(table, 0) + count
+    failed = sum(1 for r in results if r.get("error"))
+    print(f"Market cycle completed for {sum(r['agents'] for r in results)} agents across {len(results)} shards "
+          f"({totals.get('trades', 0)} trades, {totals.get('agents', 0)} agents updated, "
+          f"{totals.get('snapshots', 0)} snapshots, {failed} shards failed).")
+
+    db: Session = SessionLocal()
+    try:
+        with metrics.cycle("finalize_market_cycle"), metrics.phase("publish"):
+            leaderboard.refresh_leaderboard(db, prices=cycle_prices)
+    finally:
+        db.close()
+        scheduler.release(lock_token)
+    return totals
+
+@worker_ready.connect
+def start_worker_metrics(**kwargs):
+    # Prefork children only share samples when PROMETHEUS_MULTIPROC_DIR is set
+    metrics.start_metrics_server()
+
+@worker_ready.connect
+def migrate_positions(**kwargs):
+    # Cycles read the positions table, so legacy JSON must be moved over first
+    from positions import migrate_legacy_positions
+    try:
+        migrate_legacy_positions(SessionLocal)
+    except Exception as e:
+        print(f"Position migration failed: {e}")
+
+@worker_process_shutdown.connect
+def release_worker_metrics(pid=None, **kwargs):
+    metrics.mark_process_dead(pid or os.getpid())
+
+def robust_ranking(k):
+    """
+    (top, bottom) [(agent id, fitness)] by robustness.robust_rank, or [] when it
+    cannot run (e.g. no bar history offline) and evolution ranks by equity instead.
+    """
+    import robustness
+
+    db: Session = SessionLocal()
+    try:
+        start = time.perf_counter()
+        ranking = robustness.robust_rank(db, UNIVERSE, k=k)
+        print(f"Robust ranking took {time.perf_counter() - start:.1f}s.")
+        return ranking
+    except Exception as e:
+        print(f"Warning: robust ranking failed ({e}); ranking by marked equity instead.")
+        return []
+    finally:
+        db.close()
+
 
 @celery.task(name="evolve_agents")
-def evolve_agents():
+def evolve_agents(triggered_at=None, ranking=None):
     """
     Weekly Evolution Loop:
-    1. Rank agents by Portfolio Value
+    1. Rank agents by Portfolio Value (marked to market), or with EVOLVE_FITNESS=robust
+       by median return less tail drawdown across Monte Carlo paths of the universe
     2. Kill bottom 4
     3. Breed top 4 (Mutation)
     4. Reset for next epoch (optional, or keep running)
+    Shares the cycle lock with run_market_cycle. The robust ranking is computed
+    before taking it, so cycles keep running meanwhile, and travels with the
+    task when it is requeued behind a running cycle.
     """
+    if EVOLVE_FITNESS == "robust" and ranking is None:
+        ranking = robust_ranking(k=4)
+    lock = scheduler.begin(evolve_agents, triggered_at, retry_kwargs={"ranking": ranking})
+    if lock is None:
+        return
     db: Session = SessionLocal()
     try:
-        # 1. Rank
-        agents = db.query(models.Agent).filter(models.Agent.status == "active").all()
-        if len(agents) < 10:
-            print("Not enough agents to evolve. Need at least 10.")
-            return
-
-        # Sort by current cash/value (Descending)
-        # Note: In real app, consider open positions value too
-        ranked_agents = sorted(agents, key=lambda a: a.current_cash, reverse=True)
-        
-        top_performers = ranked_agents[:4]
-        bottom_performers = ranked_agents[-4:]
+        with metrics.cycle("evolve_agents"):
+            # 1. Rank by marked equity (cash + positions at one quote snapshot), top/bottom 4 selected in SQL
+            active = db.query(func.count(models.Agent.id)).filter(models.Agent.status == "active").scalar()
+            if active < 10:
+                print("Not enough agents to evolve. Need at least 10.")
+                return
+
+            with metrics.phase("quotes"):
+                prices = valuation.quote_snapshot(db)
+            with metrics.phase("rank"):
+                top = bottom = None
+                if ranking:
+                    # Agents terminated since the ranking drop out
+                    ids = {agent_id for agent_id, _ in ranking[0] + ranking[1]}
+                    rows = {a.id: a for a in db.query(models.Agent).filter(
+                        models.Agent.id.in_(ids), models.Agent.status == "active")}
+                    top = [(rows[i], f) for i, f in ranking[0] if i in rows]
+                    bottom = [(rows[i], f) for i, f in ranking[1] if i in rows]
+                    label = "{:+.4f} robust fitness"
+                if not top or not bottom:
+                    top, bottom = valuation.top_and_bottom(db, prices, k=4)
+                    label = "${:.2f}"
+            top_performers = [a for a, _ in top]
+            bottom_performers = [a for a, _ in bottom]
 
-        print(f"Top Agent: {top_performers[0].name} (${top_performers[0].current_cash})")
-        print(f"Worst Agent: {bottom_performers[0].name} (${bottom_performers[0].current_cash})")
+            print(f"Top Agent: {top_performers[0].name} ({label.format(top[0][1])})")
+            print(f"Worst Agent: {bottom_performers[-1].name} ({label.format(bottom[-1][1])})")
 
-        # 2. Purge (Kill Bottom 4)
-        for agent in bottom_performers:
-            agent.status = "terminated"
-            print(f"Terminating Agent {agent.id}...")
+            # 2. Purge (Kill Bottom 4)
+            for agent in bottom_performers:
+                agent.status = "terminated"
+                print(f"Terminating Agent {agent.id}...")
 
-        # 3. Reproduce (Mutate Top 4)
-        generation_id = top_performers[0].generation + 1
+            # 3. Reproduce (Mutate Top 4)
+            generation_id = top_performers[0].generation + 1
+            children = []
         
-        for parent in top_performers:
-            # Create a child with mutated DNA
-            new_dna = mutate_dna(parent.dna)
-            child_name = f"{parent.name.split('_')[0]}_Gen{generation_id}_{random.randint(100,999)}"
+            for parent in top_performers:
+                # Create a child with mutated DNA
+                new_dna = mutate_dna(parent.dna)
+                child_name = f"{parent.name.split('_')[0]}_Gen{generation_id}_{random.randint(100,999)}"
             
-            new_agent = models.Agent(
-                name=child_name,
-                dna=new_dna,
-                generation=generation_id,
-                current_cash=100000.0, # Reset cash for fair comparison next round? 
-                                       # Or inheritance? implementing reset for now per PRD "spawn new agents" implications
-                current_positions={}
-            )
-            db.add(new_agent)
-            print(f"Born: {child_name} from parent {parent.id}")
+                new_agent = models.Agent(
+                    name=child_name,
+                    dna=new_dna,
+                    generation=generation_id,
+                    current_cash=STARTING_CASH, # Reset cash for fair comparison next round? 
+                                           # Or inheritance? implementing reset for now per PRD "spawn new agents" implications
+                )
+                db.add(new_agent)
+                children.append(new_agent)
+                print(f"Born: {child_name} from parent {parent.id}")
             
-        db.commit()
+            with metrics.phase("commit"):
+                lock.ensure()
+                db.commit()
+            with metrics.phase("publish"):
+                events.publish_events([{
+                    "type": "evolution",
+                    "generation": generation_id,
+                    "terminated": [a.id for a in bottom_performers],
+                    "born": [a.id for a in children],
+                }])
+                leaderboard.refresh_leaderboard(db, prices)
+            metrics.record(agents=active)
     except Exception as e:
         print(f"Evolution failed: {e}")
         db.rollback()
     finally:
         db.close()
+        lock.release()
 
 def mutate_dna(dna: dict) -> dict:
-    """Randomly adjust DNA parameters"""
+    """Randomly adjust DNA parameters, within the bounds of genetic.GENES"""
+    from genetic import clamp_gene
+
     new_dna = dna.copy()
     
-    # Mutate RSI
-    if 'rsi_limit' in new_dna:
-        change = random.choice([-2, -1, 1, 2])
-        new_dna['rsi_limit'] = max(10, min(90, new_dna['rsi_limit'] + change))
+    # Mutate RSI threshold and lookback
+    for gene in ('rsi_limit', 'rsi_period'):
+        if gene in new_dna:
+            change = random.choice([-2, -1, 1, 2])
+            new_dna[gene] = clamp_gene(gene, new_dna[gene] + change)
         
     # Mutate Stop Loss
     if 'stop_loss_pct' in new_dna:
         factor = random.uniform(0.9, 1.1)
-        new_dna['stop_loss_pct'] = round(new_dna['stop_loss_pct'] * factor, 3)
+        new_dna['stop_loss_pct'] = clamp_gene('stop_loss_pct', new_dna['stop_loss_pct'] * factor)
         
     return new_dna
@@ -18,11 +18,22 @@ const getApiUrl = () => {
 };
 
 const API_BASE_URL = getApiUrl();
+const MAX_RECENT_TRADES = 30;
+
+interface Trade {
+    agent_id: number;
+    symbol: string;
+    side: string;
+    qty: number;
+    price: number;
+    timestamp: string;
+}
 
 export default function Dashboard() {
     const [data, setData] = useState<any>(null);
     const [loading, setLoading] = useState(true);
     const [lastUpdated, setLastUpdated] = useState<Date>(new Date());
+    const [recentTrades, setRecentTrades] = useState<Trade[]>([]);
 
     const fetchData = async () => {
         try {
@@ -39,7 +50,49 @@ export default function Dashboard() {
     useEffect(() => {
         fetchData();
         const interval = setInterval(fetchData, 10000); // Poll every 10 seconds
-        return () => clearInterval(interval);
+
+        // Live deltas; polling stays as a fallback but slows down while the stream is open
+        if (typeof EventSource === 'undefined') return () => clearInterval(interval);
+        const source = new EventSource(`${API_BASE_URL}/stream`);
+        let slowInterval: ReturnType<typeof setInterval> | null = null;
+        source.onopen = () => {
+            clearInterval(interval);
+            if (!slowInterval) slowInterval = setInterval(fetchData, 60000);
+        };
+        source.addEventListener('snapshot', (e) => {
+            setData(JSON.parse((e as MessageEvent).data));
+            setLastUpdated(new Date());
+        });
+        source.addEventListener('summary', (e) => {
+            const summary = JSON.parse((e as MessageEvent).data);
+            delete summary.type;
+            setData((prev: any) => prev ? { ...prev, ...summary } : prev);
+            setLastUpdated(new Date());
+        });
+        source.addEventListener('agent', (e) => {
+            const { agent } = JSON.parse((e as MessageEvent).data);
+            setData((prev: any) => {
+                if (!prev) return prev;
+                const agents = prev.agents.filter((a: any) => a.id !== agent.id);
+                agents.push(agent);
+                agents.sort((a: any, b: any) => b.pnl_usd - a.pnl_usd);
+                return { ...prev, agents };
+            });
+        });
+        source.addEventListener('agent_removed', (e) => {
+            const { id } = JSON.parse((e as MessageEvent).data);
+            setData((prev: any) => prev ? { ...prev, agents: prev.agents.filter((a: any) => a.id !== id) } : prev);
+        });
+        source.addEventListener('trades', (e) => {
+            const { trades } = JSON.parse((e as MessageEvent).data) as { trades: Trade[] };
+            setRecentTrades((prev) => [...trades.slice(-MAX_RECENT_TRADES).reverse(), ...prev].slice(0, MAX_RECENT_TRADES));
+        });
+
+        return () => {
+            source.close();
+            clearInterval(interval);
+            if (slowInterval) clearInterval(slowInterval);
+        };
     }, []);
 
     const triggerCycle = async () => {
@@ -103,8 +156,22 @@ export default function Dashboard() {
 
                 <div className="grid grid-cols-1 gap-6 lg:grid-cols-5 xl:grid-cols-6">
                     {/* Sidebar - Leaderboard */}
-                    <aside className="lg:col-span-1 xl:col-span-1">
+                    <aside className="lg:col-span-1 xl:col-span-1 space-y-6">
                         <Leaderboard agents={data?.agents.slice(0, 20) || []} />
+                        {recentTrades.length > 0 && (
+                            <div className="glass rounded-xl bg-[#1a1b23]/60 p-4 border border-white/5">
+                                <span className="text-[9px] font-black text-zinc-500 uppercase tracking-widest block mb-2">Live Trades</span>
+                                <ul className="space-y-1">
+                                    {recentTrades.map((t, i) => (
+                                        <li key={`${t.timestamp}-${t.agent_id}-${t.symbol}-${i}`} className="flex items-center justify-between text-[10px] font-bold">
+                                            <span className={t.side === 'BUY' ? "text-emerald-400" : "text-rose-400"}>{t.side}</span>
+                                            <span className="text-white/80">{t.qty} {t.symbol}</span>
+                                            <span className="text-zinc-500">${t.price.toLocaleString()}</span>
+                                        </li>
+                                    ))}
+                                </ul>
+                            </div>
+                        )}
                     </aside>
 
                     {/* Main Grid - Agent Cards */}